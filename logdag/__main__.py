@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import os
 import sys
 import logging
 import argparse
@@ -62,23 +63,14 @@ def make_args(ns):
     am.dump()
 
 
-def make_dag(ns):
-    from . import makedag
+def _exit_failed(l_result):
+    n_failed = sum(1 for result in l_result if result["status"] == "failed")
+    if n_failed > 0:
+        sys.exit("{0} makedag jobs failed".format(n_failed))
+
 
-    def makedag_sprocess(am):
-        timer = common.Timer("makedag task", output=_logger)
-        timer.start()
-        for args in am:
-            makedag.makedag_main(args)
-        timer.stop()
-
-    def makedag_mprocess(am, pal=1):
-        import multiprocessing
-        timer = common.Timer("makedag task", output=_logger)
-        timer.start()
-        with multiprocessing.Pool(processes=pal) as pool:
-            pool.map(makedag.makedag_main, am)
-        timer.stop()
+def make_dag(ns):
+    from . import schedule
 
     conf = open_logdag_config(ns)
 
@@ -87,11 +79,38 @@ def make_dag(ns):
     am.init_dirs(conf)
     am.dump()
 
-    p = ns.parallel
-    if p > 1:
-        makedag_mprocess(am, p)
-    else:
-        makedag_sprocess(am)
+    manifest = schedule.JobManifest(am)
+    l_args = list(am)
+    if ns.resume:
+        l_args = manifest.incomplete_args(conf, l_args)
+        _logger.info("resume makedag: skip {0} completed jobs, "
+                     "run {1} jobs".format(len(am) - len(l_args),
+                                           len(l_args)))
+
+    timer = common.Timer("makedag task", output=_logger)
+    timer.start()
+    l_result = schedule.run_jobs(conf, l_args, ns.parallel,
+                                 reuse_input=ns.reuse_input,
+                                 manifest=manifest)
+    timer.stop()
+    _exit_failed(l_result)
+
+
+def make_dag_worker(ns):
+    from . import jobqueue
+
+    conf = open_logdag_config(ns)
+    am = arguments.ArgumentManager(conf)
+    if not os.path.exists(am.args_path):
+        sys.exit("args file not found, run make-args first")
+    am.load()
+
+    timer = common.Timer("makedag worker", output=_logger)
+    timer.start()
+    l_result = jobqueue.run_worker(conf, am, reuse_input=ns.reuse_input,
+                                   resume=ns.resume)
+    timer.stop()
+    _exit_failed(l_result)
 
 
 def make_dag_stdin(ns):
@@ -106,7 +125,7 @@ def make_dag_stdin(ns):
     timer = common.Timer("makedag task for {0}".format(ns.argname),
                          output=_logger)
     timer.start()
-    makedag.makedag_main(args)
+    makedag.makedag_main(args, reuse_input=ns.reuse_input)
     timer.stop()
 
 
@@ -131,6 +150,23 @@ def make_dag_stdin(ns):
 #    print(tsdb.show_ts_compare(conf, **d))
 
 
+def make_dag_server(ns):
+    from . import server
+
+    conf = open_logdag_config(ns)
+    srv = server.MakeDagServer(conf, n_proc=ns.parallel,
+                               reuse_input=ns.reuse_input)
+    try:
+        if ns.socket_path is None:
+            srv.serve_stream(sys.stdin, sys.stdout)
+        else:
+            srv.serve_socket(ns.socket_path)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.close()
+
+
 def make_dag_prune(ns):
     from . import makedag
 
@@ -154,6 +190,26 @@ def make_dag_prune(ns):
 #    print(tsdb.show_filterlog(conf, **d))
 
 
+def bench(ns):
+    from . import bench as bench_mod
+    conf = open_logdag_config(ns)
+
+    l_scale = [int(v) for v in ns.scales.split(",")]
+    if ns.ci_funcs is None:
+        l_ci_func = None
+    else:
+        l_ci_func = ns.ci_funcs.split(",")
+    l_result = bench_mod.run(conf, l_scale, l_ci_func,
+                             repeat=ns.repeat, seed=ns.seed)
+    if ns.output is not None:
+        bench_mod.dump_results(l_result, ns.output)
+    if ns.baseline is None:
+        l_baseline = None
+    else:
+        l_baseline = bench_mod.load_results(ns.baseline)
+    print(bench_mod.format_table(l_result, l_baseline))
+
+
 def show_args(ns):
     conf = open_logdag_config(ns)
 
@@ -241,6 +297,19 @@ def show_netsize_list(ns):
     print(showdag.list_netsize(conf))
 
 
+def show_metrics(ns):
+    from . import metrics
+    conf = open_logdag_config(ns)
+
+    am = arguments.ArgumentManager(conf)
+    try:
+        am.load()
+    except IOError:
+        sys.exit("ArgumentManager object file ({0}) not found".format(
+            am.args_path))
+    print(metrics.report(conf, am))
+
+
 def plot_dag(ns):
     from . import showdag
     # from . import showdag_filter
@@ -302,6 +371,21 @@ OPT_PARALLEL = [["-p", "--parallel"],
                 {"dest": "parallel", "metavar": "PARALLEL",
                  "type": int, "default": 1,
                  "help": "number of processes in parallel"}]
+OPT_REUSE_INPUT = [["--reuse-input"],
+                   {"dest": "reuse_input", "action": "store_true",
+                    "help": ("reuse input saved in the output directory "
+                             "of each job instead of loading events "
+                             "(saved in this run if not available)")}]
+OPT_RESUME = [["--resume"],
+              {"dest": "resume", "action": "store_true",
+               "help": ("skip jobs completed with the current config "
+                        "in the job manifest, and run only failed, "
+                        "truncated, stale or new jobs")}]
+OPT_SOCKET = [["-s", "--socket"],
+              {"dest": "socket_path", "metavar": "SOCKET", "action": "store",
+               "default": None,
+               "help": "unix domain socket path to accept job names "
+                       "(default: stdin)"}]
 OPT_FILENAME = [["-f", "--filename"],
                 {"dest": "filename", "metavar": "FILENAME", "action": "store",
                  "default": "output",
@@ -359,11 +443,23 @@ DICT_ARGSET = {
                   [OPT_CONFIG, OPT_DEBUG],
                   make_args],
     "make-dag": ["Generate causal DAGs",
-                 [OPT_CONFIG, OPT_DEBUG, OPT_PARALLEL],
+                 [OPT_CONFIG, OPT_DEBUG, OPT_PARALLEL, OPT_REUSE_INPUT,
+                  OPT_RESUME],
                  make_dag],
+    "make-dag-worker": ["make-dag worker claiming jobs in the args file "
+                        "through a queue on a shared file system",
+                        [OPT_CONFIG, OPT_DEBUG, OPT_REUSE_INPUT, OPT_RESUME],
+                        make_dag_worker],
     "make-dag-stdin": ["make-dag interface for pipeline processing",
-                       [OPT_CONFIG, OPT_DEBUG, ARG_ARGNAME],
+                       [OPT_CONFIG, OPT_DEBUG, OPT_REUSE_INPUT,
+                        ARG_ARGNAME],
                        make_dag_stdin],
+    "make-dag-server": ["Long-running make-dag service, running jobs "
+                        "named in lines of stdin or a socket "
+                        "with warm event loaders",
+                        [OPT_CONFIG, OPT_DEBUG, OPT_PARALLEL,
+                         OPT_REUSE_INPUT, OPT_SOCKET],
+                        make_dag_server],
     "make-dag-prune": ["Show pruned DAGs before PC algorithm",
                        [OPT_CONFIG, OPT_DEBUG, ARG_ARGNAME],
                        make_dag_prune],
@@ -382,6 +478,32 @@ DICT_ARGSET = {
     #    "show-filterlog": ["Show preprocessing log",
     #                       [OPT_CONFIG, OPT_DEBUG, ARG_DBSEARCH],
     #                       show_filterlog],
+    "bench": ["Benchmark make-dag stages on synthetic events "
+              "(without databases)",
+              [OPT_CONFIG, OPT_DEBUG,
+               [["--scales"],
+                {"dest": "scales", "action": "store",
+                 "default": "10,100,1000,5000",
+                 "help": "comma-separated numbers of nodes"}],
+               [["--ci-funcs"],
+                {"dest": "ci_funcs", "action": "store", "default": None,
+                 "help": "comma-separated ci_func names to estimate DAGs "
+                         "(default: all except gsq_rlib)"}],
+               [["--repeat"],
+                {"dest": "repeat", "action": "store",
+                 "type": int, "default": 1,
+                 "help": "repeats of each stage (minimum time is shown)"}],
+               [["--seed"],
+                {"dest": "seed", "action": "store",
+                 "type": int, "default": 0,
+                 "help": "random seed of synthetic events"}],
+               [["-o", "--output"],
+                {"dest": "output", "action": "store", "default": None,
+                 "help": "output results in json"}],
+               [["--baseline"],
+                {"dest": "baseline", "action": "store", "default": None,
+                 "help": "results json of another run to compare"}]],
+              bench],
     "show-args": ["Show arguments recorded in argument file",
                   [OPT_CONFIG, OPT_DEBUG],
                   show_args],
@@ -413,6 +535,10 @@ DICT_ARGSET = {
     "show-netsize-list": ["Show connected subgraphs in every DAG",
                           [OPT_CONFIG, OPT_DEBUG],
                           show_netsize_list],
+    "show-metrics": ["Show stage-level metrics of make-dag "
+                     "aggregated over jobs",
+                     [OPT_CONFIG, OPT_DEBUG],
+                     show_metrics],
     "plot-dag": ["Generate causal DAG view",
                  [OPT_CONFIG, OPT_DEBUG, OPT_FILENAME, OPT_THRESHOLD,
                   ARG_ARGNAME, ARG_FILTER],
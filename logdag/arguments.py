@@ -16,6 +16,7 @@ _amulog_logger = logging.getLogger("amulog")
 
 class ArgumentManager(object):
     _args_filename = "args"
+    _manifest_filename = "manifest.jsonl"
 
     def __init__(self, conf):
         self._conf = conf
@@ -23,6 +24,8 @@ class ArgumentManager(object):
         common.mkdir(output_dir)
         self.args_path = "{0}/{1}".format(output_dir,
                                           self._args_filename)
+        self.manifest_path = "{0}/{1}".format(output_dir,
+                                              self._manifest_filename)
         self.l_args = []
         # self.args_filename = conf.get("dag", "args_fn")
         # self.l_args = []
@@ -52,9 +55,11 @@ class ArgumentManager(object):
         return [args for args in self.l_args if args[2] == area]
 
     def args_in_time(self, dt_range):
+        dt_range = tuple(localize(dt, self._conf) for dt in dt_range)
         return [args for args in self.l_args if args[1] == dt_range]
 
     def args_from_time(self, dt):
+        dt = localize(dt, self._conf)
         for args in self.l_args:
             dts, dte = args[1]
             if dts <= dt < dte:
@@ -94,8 +99,15 @@ class ArgumentManager(object):
 
     @staticmethod
     def jobname2args(name, conf):
-        area, dtstr = name.split("_", 1)
-        dts = dtutil.shortstr2dt(dtstr)
+        # area names can include "_" (e.g., host_<hostname>),
+        # and the datetime of a job can be <date> or <date>_<time>
+        try:
+            area, date, time = name.rsplit("_", 2)
+            dts = dtutil.shortstr2dt("_".join((date, time)))
+        except ValueError:
+            area, dtstr = name.rsplit("_", 1)
+            dts = dtutil.shortstr2dt(dtstr)
+        dts = localize(dts.replace(tzinfo=None), conf)
         term = config.getdur(conf, "dag", "unit_term")
         dte = dts + term
         return conf, (dts, dte), area
@@ -109,7 +121,7 @@ class ArgumentManager(object):
         return "{0}/{1}".format(output_dir, argname)
 
     @classmethod
-    def dag_path(cls, conf, args, ext="pickle"):
+    def dag_path(cls, conf, args, ext="pickle", name="dag"):
         dirname = cls._arg_dirname(cls._output_dir(conf),
                                    cls.jobname(args))
         # try <- compatibility
@@ -117,7 +129,28 @@ class ArgumentManager(object):
             common.mkdir(dirname)
         except OSError:
             return
-        return dirname + "/dag.{0}".format(ext)
+        return dirname + "/{0}.{1}".format(name, ext)
+
+    @classmethod
+    def citest_cache_path(cls, conf, args):
+        dirname = cls._arg_dirname(cls._output_dir(conf),
+                                   cls.jobname(args))
+        common.mkdir(dirname)
+        return dirname + "/citest_cache.pickle"
+
+    @classmethod
+    def metrics_path(cls, conf, args):
+        dirname = cls._arg_dirname(cls._output_dir(conf),
+                                   cls.jobname(args))
+        common.mkdir(dirname)
+        return dirname + "/metrics.json"
+
+    @classmethod
+    def input_path(cls, conf, args, name="input", ext="npy"):
+        dirname = cls._arg_dirname(cls._output_dir(conf),
+                                   cls.jobname(args))
+        common.mkdir(dirname)
+        return dirname + "/{0}.{1}".format(name, ext)
 
     @classmethod
     def evdef_path(cls, args):
@@ -189,6 +222,15 @@ def name2args(name, conf):
     return ArgumentManager.jobname2args(name, conf)
 
 
+def localize(dt, conf):
+    """Give naive datetimes [general] timezone, in the same way as
+    whole_term (amulog.config.getterm) for the generated args.
+    Timezone-aware datetimes are returned as they are."""
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=config.get_timezone(conf))
+    return dt
+
+
 def open_logdag_config(conf_path, debug=False):
     conf = config.open_config(conf_path, ex_defaults=[DEFAULT_CONFIG])
     lv = logging.DEBUG if debug else logging.INFO
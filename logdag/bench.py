@@ -0,0 +1,455 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Offline benchmark of the hot paths of make-dag.
+
+Event sets are synthesized with dtutil.rand_exp / rand_uniform
+on a known ground-truth DAG, and loaded through an in-memory
+event loader, so neither InfluxDB nor amulog databases are needed.
+The stages are timed on the same synthetic events (with the same seed)
+at each scale (the number of nodes):
+
+- discretize: dtutil.discretize and discretize_{sequential,slide,radius}
+  for all events
+- makeinput: log2event.makeinput with [dag] load_batch false and true
+- prune: prune.pruned_graph, and prune.prune_graph on the complete graph
+  (only for small scales)
+- estimate: makedag.estimate_dag for each ci_func
+  (the recall of the ground-truth edges is also shown),
+  on the initial graph pruned with the ring topology of the hosts
+  (with skeleton_engine pcalg, only for small scales)
+- showdag: post-processing of the estimated DAG with showdag.LogDAG
+
+Options of DAG estimation (e.g., ci_bin_*, skeleton_*) follow
+the given config. The results can be saved as JSON,
+and compared with those of another run (e.g., before an upgrade).
+"""
+
+import os
+import json
+import time
+import random
+import logging
+import datetime
+import tempfile
+import numpy as np
+import networkx as nx
+
+from amulog import common
+from . import dtutil
+from . import log2event
+
+_logger = logging.getLogger(__package__)
+
+DEFAULT_SCALES = [10, 100, 1000, 5000]
+DEFAULT_CI_FUNCS = ["gsq", "gsq_batch", "gsq_sparse", "fisherz",
+                    "fisherz_bin", "fisherz_batch", "fisherz_bin_batch"]
+# prune_graph on the complete graph is skipped for larger scales
+LEGACY_PRUNE_MAX_NODES = 1000
+# pcalg.estimate_skeleton allocates separation sets of all node pairs,
+# use skeleton_engine native for larger scales
+PCALG_MAX_NODES = 1000
+MEASUREMENT = "bench"
+
+
+class SyntheticEventDefinition(log2event.EventDefinition):
+    __slots__ = ["gid", ]
+    _l_attr_bench = ["gid", ]
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        for attr in self._l_attr_bench:
+            setattr(self, attr, kwargs[attr])
+
+    def __str__(self):
+        return "{0}, gid:{1}({2})".format(self.host, str(self.gid),
+                                          self.group)
+
+    def ident(self):
+        return self.source, self.host, str(self.gid), self.group
+
+    def key(self):
+        return str(self.gid)
+
+    def tags(self):
+        return {"host": self.host,
+                "key": self.key()}
+
+    def series(self):
+        return MEASUREMENT, self.tags()
+
+
+class SyntheticEvents(object):
+    """Event timestamps on a random ground-truth DAG.
+
+    The nodes are placed on hosts (nodes_per_host nodes each),
+    and the hosts are connected in a ring topology.
+    Each node has a cause (parent) with probability p_edge,
+    chosen from the preceding nodes on the same or adjacent hosts.
+    Root events follow a Poisson process (dtutil.rand_exp)
+    of lambd_root times a day, and the other events follow
+    their cause with probability p_follow within max_delay,
+    in addition to noise (dtutil.rand_uniform) of lambd_noise times a day.
+
+    Args:
+        n_nodes (int): the number of nodes (events).
+        dt_range (tuple): range of the timestamps.
+        seed (int): random seed.
+    """
+
+    def __init__(self, n_nodes, dt_range, seed=0, nodes_per_host=5,
+                 p_edge=0.7, p_follow=0.8, max_delay=30,
+                 lambd_root=48, lambd_noise=4):
+        self.n_nodes = n_nodes
+        self.dt_range = dt_range
+        random.seed(seed)
+        np.random.seed(seed)
+
+        self.n_hosts = max(1, (n_nodes + nodes_per_host - 1) // nodes_per_host)
+        self.l_host = ["host{0}".format(i // nodes_per_host)
+                       for i in range(n_nodes)]
+        self.topology = nx.cycle_graph(
+            ["host{0}".format(i) for i in range(self.n_hosts)])
+
+        self.dag = nx.DiGraph()
+        self.dag.add_nodes_from(range(n_nodes))
+        for node in range(n_nodes):
+            l_cand = [cand for cand in range(max(0, node - 2 * nodes_per_host),
+                                             node)
+                      if self._is_neighbor(self.l_host[cand],
+                                           self.l_host[node])]
+            if len(l_cand) > 0 and random.random() < p_edge:
+                self.dag.add_edge(random.choice(l_cand), node)
+
+        top_dt, end_dt = dt_range
+        self.l_ts = []
+        for node in range(n_nodes):
+            l_parent = list(self.dag.predecessors(node))
+            if len(l_parent) == 0:
+                l_dt = list(dtutil.rand_exp(top_dt, end_dt, lambd_root))
+            else:
+                l_dt = dtutil.rand_uniform(top_dt, end_dt, lambd_noise)
+                for dt in self.l_ts[l_parent[0]]:
+                    if random.random() < p_follow:
+                        delay = datetime.timedelta(
+                            seconds=random.randint(0, max_delay))
+                        if dt + delay < end_dt:
+                            l_dt.append(dt + delay)
+            self.l_ts.append(sorted(l_dt))
+        self.l_us = [dtutil.dt2us_array(l_dt) for l_dt in self.l_ts]
+
+    def _is_neighbor(self, host1, host2):
+        return host1 == host2 or self.topology.has_edge(host1, host2)
+
+    def evdef(self, node):
+        return SyntheticEventDefinition(source=log2event.SRCCLS_LOG,
+                                        host=self.l_host[node],
+                                        group="bench", gid=node)
+
+    def dump_topology(self, fp):
+        with open(fp, "w", encoding="utf-8") as f:
+            json.dump(nx.node_link_data(self.topology), f)
+
+
+class SyntheticEventLoader(object):
+    """In-memory event loader of SyntheticEvents,
+    with the same interface as evgen_log.LogEventLoader."""
+    fields = ["val", ]
+
+    def __init__(self, events):
+        self._events = events
+        self._d_node = {(events.l_host[node], str(node)): node
+                        for node in range(events.n_nodes)}
+
+    def iter_evdef(self, dt_range=None, area=None):
+        for node in range(self._events.n_nodes):
+            if self._select(node, dt_range).size > 0:
+                yield self._events.evdef(node)
+
+    def _select(self, node, dt_range):
+        a_us = self._events.l_us[node]
+        if dt_range is None:
+            return a_us
+        lo, hi = np.searchsorted(a_us, [dtutil.dt2us(dt_range[0]),
+                                        dtutil.dt2us(dt_range[1])])
+        return a_us[lo:hi]
+
+    @staticmethod
+    def _bin(a_ts, dt_range, binsize):
+        # aligned on epoch, same as GROUP BY time() in influxdb
+        binsize = dtutil.td2us(binsize)
+        top, end = dtutil.dt2us(dt_range[0]), dtutil.dt2us(dt_range[1])
+        a_index = np.arange(top // binsize * binsize, end, binsize,
+                            dtype=np.int64)
+        a_values = np.bincount((a_ts - a_index[0]) // binsize,
+                               minlength=a_index.size)
+        return a_index, a_values
+
+    def load(self, measure, tags, dt_range, binsize):
+        import pandas as pd
+        a_ts = self._select(self._d_node[(tags["host"], tags["key"])],
+                            dt_range)
+        if a_ts.size == 0:
+            return None
+        a_index, a_values = self._bin(a_ts, dt_range, binsize)
+        return pd.DataFrame({"val": a_values},
+                            index=log2event.us2dtindex(a_index))
+
+    def load_array(self, measure, tags, dt_range):
+        a_ts = self._select(self._d_node[(tags["host"], tags["key"])],
+                            dt_range)
+        return a_ts, np.ones((a_ts.size, 1), dtype=np.int64)
+
+    def load_group(self, measure, l_tags, dt_range, binsize=None):
+        d_data = {}
+        for tags in l_tags:
+            key = (tags["host"], tags["key"])
+            a_ts = self._select(self._d_node[key], dt_range)
+            if a_ts.size == 0:
+                continue
+            if binsize is None:
+                d_data[key] = (a_ts, np.ones((a_ts.size, 1), dtype=np.int64))
+            else:
+                a_index, a_values = self._bin(a_ts, dt_range, binsize)
+                d_data[key] = (a_index, a_values.reshape(-1, 1))
+        return d_data
+
+
+def _init_bench_config(conf, dirname, topology_fp):
+    conf["dag"]["source"] = log2event.SRCCLS_LOG
+    conf["dag"]["input_cache"] = "none"
+    conf["dag"]["input_incremental"] = "false"
+    conf["dag"]["input_persist"] = "false"
+    conf["dag"]["ci_cache_size"] = "0"
+    conf["dag"]["metrics_sink"] = ""
+    conf["dag"]["output_dir"] = dirname
+    conf["pc_prune"]["do_pruning"] = "true"
+    conf["pc_prune"]["methods"] = "topology"
+    conf["pc_prune"]["single_network_file"] = topology_fp
+    conf["pc_prune"]["topology_cache_dir"] = ""
+
+
+def _measure(func, repeat):
+    """Returns the minimum time in repeats, and the last return value."""
+    l_time = []
+    ret = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ret = func()
+        l_time.append(time.perf_counter() - start)
+    return min(l_time), ret
+
+
+def _skeleton_recall(graph, dag):
+    if dag.number_of_edges() == 0:
+        return None
+    n_found = sum(1 for u, v in dag.edges()
+                  if graph.has_edge(u, v) or graph.has_edge(v, u))
+    return n_found / dag.number_of_edges()
+
+
+def _import_libraries(l_ci_func):
+    """Import the libraries of CI tests, not to be timed
+    in the first estimate_dag."""
+    import pandas as pd
+    from . import pc_input
+    data = pd.DataFrame(np.random.randint(0, 2, size=(20, 2)))
+    for ci_func in l_ci_func:
+        try:
+            pc_input.init_citest(data, ci_func)
+        except (ImportError, ValueError):
+            # reported in run_scale
+            pass
+
+
+def run_scale(conf, n_nodes, l_ci_func, repeat=1, seed=0):
+    """Benchmark the stages on synthetic events of n_nodes nodes.
+
+    Returns:
+        list: results of stages (dict with keys nodes, stage, variant,
+            time (seconds, None if not available) and note).
+    """
+    from . import prune
+    from . import makedag
+    from . import showdag
+    from amulog import config
+
+    top_dt = datetime.datetime(2112, 9, 1)
+    dt_range = (top_dt, top_dt + datetime.timedelta(days=1))
+    args = (conf, dt_range, "all")
+    ci_bin_size = config.getdur(conf, "dag", "ci_bin_size")
+    ci_bin_diff = config.getdur(conf, "dag", "ci_bin_diff")
+
+    start = time.perf_counter()
+    events = SyntheticEvents(n_nodes, dt_range, seed=seed)
+    _logger.info("synthesized {0} nodes, {1} timestamps, {2} edges "
+                 "in {3:.1f}s".format(n_nodes, sum(a.size for a in events.l_us),
+                                      events.dag.number_of_edges(),
+                                      time.perf_counter() - start))
+    l_result = []
+
+    def _add(stage, variant, sec, note=""):
+        _logger.info("{0} nodes {1} {2}: {3}".format(
+            n_nodes, stage, variant,
+            "n/a" if sec is None else "{0:.4f}s".format(sec)))
+        l_result.append({"nodes": n_nodes, "stage": stage,
+                         "variant": variant, "time": sec, "note": note})
+
+    # discretize
+    l_term = [(dt, dt + ci_bin_size)
+              for dt in dtutil.range_dt(dt_range[0], dt_range[1], ci_bin_diff)]
+    l_func = [
+        ("terms", lambda l_dt: dtutil.discretize(
+            l_dt, l_term, dt_range, True)),
+        ("sequential", lambda l_dt: dtutil.discretize_sequential(
+            l_dt, dt_range, ci_bin_size, True)),
+        ("slide", lambda l_dt: dtutil.discretize_slide(
+            l_dt, dt_range, ci_bin_diff, ci_bin_size, True)),
+        ("radius", lambda l_dt: dtutil.discretize_radius(
+            l_dt, dt_range, ci_bin_diff, 0.5 * ci_bin_size, True)),
+    ]
+    for name, func in l_func:
+        sec, _ = _measure(lambda: [func(l_dt) for l_dt in events.l_ts],
+                          repeat)
+        _add("discretize", name, sec)
+
+    with tempfile.TemporaryDirectory() as dirname, \
+            log2event.registered_evloader(conf, log2event.SRCCLS_LOG,
+                                          SyntheticEventLoader(events)):
+        topology_fp = os.path.join(dirname, "topology.json")
+        events.dump_topology(topology_fp)
+        _init_bench_config(conf, dirname, topology_fp)
+
+        # makeinput
+        input_df = evmap = None
+        for load_batch in ("false", "true"):
+            conf["dag"]["load_batch"] = load_batch
+            sec, (input_df, evmap) = _measure(
+                lambda: log2event.makeinput(conf, dt_range, "all", True),
+                repeat)
+            _add("makeinput", "load_batch={0}".format(load_batch), sec,
+                 "{0} samples".format(input_df.shape[0]))
+
+        # prune
+        sec, init_graph = _measure(
+            lambda: prune.pruned_graph(conf, evmap), repeat)
+        _add("prune", "pruned_graph", sec,
+             "{0} edges".format(init_graph.number_of_edges()))
+        if n_nodes <= LEGACY_PRUNE_MAX_NODES:
+            node_ids = list(evmap.eids())
+            sec, _ = _measure(lambda: prune.prune_graph(
+                makedag._complete_graph(node_ids), conf, evmap), repeat)
+            _add("prune", "prune_graph", sec)
+        else:
+            _add("prune", "prune_graph", None,
+                 "skipped (> {0} nodes)".format(LEGACY_PRUNE_MAX_NODES))
+
+        # estimate_dag: nodes of the input are same as those in the DAG
+        l_node = [evmap.evdef(eid).gid for eid in evmap.eids()]
+        true_dag = nx.relabel_nodes(events.dag.subgraph(l_node),
+                                    {gid: eid for eid, gid
+                                     in zip(evmap.eids(), l_node)})
+        d_input = {}
+        ldag = None
+        for ci_func in l_ci_func:
+            if conf.get("dag", "skeleton_engine") == "pcalg" and \
+                    n_nodes > PCALG_MAX_NODES:
+                _add("estimate_dag", ci_func, None,
+                     "skipped (> {0} nodes with pcalg engine)".format(
+                         PCALG_MAX_NODES))
+                continue
+            binarize = makedag.is_binarize(ci_func)
+            if binarize not in d_input:
+                d_input[binarize] = log2event.makeinput(
+                    conf, dt_range, "all", binarize)[0]
+            try:
+                sec, graph = _measure(lambda: makedag.estimate_dag(
+                    conf, d_input[binarize], ci_func, init_graph.copy(),
+                    evmap=evmap, args=args), repeat)
+            except ImportError as e:
+                # optional CI test libraries
+                _add("estimate_dag", ci_func, None, str(e))
+                continue
+            recall = _skeleton_recall(graph, true_dag)
+            _add("estimate_dag", ci_func, sec, "{0} edges, recall {1}".format(
+                graph.number_of_edges(),
+                "n/a" if recall is None else "{0:.2f}".format(recall)))
+            if ldag is None:
+                ldag = showdag.LogDAG(args, graph)
+                ldag._evmap_obj = evmap
+
+        # showdag
+        if ldag is not None:
+            l_post = [
+                ("directed", lambda: showdag.apply_filter(
+                    ldag, ["directed"])),
+                ("across_host", lambda: showdag.apply_filter(
+                    ldag, ["across_host"])),
+                ("connected_subgraphs", lambda: list(
+                    ldag.connected_subgraphs())),
+                ("edge_str", lambda: [ldag.edge_str(edge)
+                                      for edge in ldag.graph.edges()]),
+                ("relabel", lambda: ldag.relabel()),
+            ]
+            for name, func in l_post:
+                sec, _ = _measure(func, repeat)
+                _add("showdag", name, sec)
+    return l_result
+
+
+def run(conf, l_scale=None, l_ci_func=None, repeat=1, seed=0):
+    if l_scale is None:
+        l_scale = DEFAULT_SCALES
+    if l_ci_func is None:
+        l_ci_func = DEFAULT_CI_FUNCS
+    _import_libraries(l_ci_func)
+    l_result = []
+    for n_nodes in l_scale:
+        l_result += run_scale(conf, n_nodes, l_ci_func,
+                              repeat=repeat, seed=seed)
+    return l_result
+
+
+def dump_results(l_result, fp):
+    with open(fp, "w") as f:
+        json.dump(l_result, f, indent=1)
+
+
+def load_results(fp):
+    with open(fp, "r") as f:
+        return json.load(f)
+
+
+def _result_key(result):
+    return result["nodes"], result["stage"], result["variant"]
+
+
+def format_table(l_result, l_baseline=None):
+    """Table of stage times at each scale. If l_baseline
+    (results of another run) is given, ratios to it are also shown."""
+    d_base = {}
+    if l_baseline is not None:
+        d_base = {_result_key(result): result for result in l_baseline}
+
+    header = ["nodes", "stage", "variant", "time(s)"]
+    if l_baseline is not None:
+        header += ["base(s)", "ratio"]
+    header.append("note")
+    table = [header]
+    for result in l_result:
+        sec = result["time"]
+        row = [str(result["nodes"]), result["stage"], result["variant"],
+               "n/a" if sec is None else "{0:.4f}".format(sec)]
+        if l_baseline is not None:
+            base = d_base.get(_result_key(result))
+            if base is None or base["time"] is None:
+                row += ["n/a", ""]
+            else:
+                row.append("{0:.4f}".format(base["time"]))
+                if sec is None or base["time"] == 0:
+                    row.append("")
+                else:
+                    row.append("{0:.2f}".format(sec / base["time"]))
+        row.append(result["note"])
+        table.append(row)
+    return common.cli_table(table)
@@ -0,0 +1,604 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Conditional independence test functions for PC algorithm.
+
+The test objects are callable with the interface of indep_test_func
+in pcalg (data_matrix, x, y, s, **kwargs), so they can be passed to
+pcalg.estimate_skeleton directly. They also provide pvalues() to
+test one pair of nodes with multiple conditioning sets at once.
+"""
+
+import logging
+import pickle
+import hashlib
+from collections import OrderedDict
+from itertools import product
+
+import numpy as np
+from scipy.stats import chi2
+from scipy.stats import norm
+
+_logger = logging.getLogger(__package__)
+
+# upper limit of temporal bit-mask buffer size (bytes) in a batch
+BATCH_BUFFER_SIZE = 64 * 1024 * 1024
+
+# partial correlation is cut at this value before Fisher's z-transform
+# (same as pcorOrder in pcalg for R)
+PCORR_CUT = 0.9999999
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)],
+                           dtype=np.uint8)
+
+
+def popcount(a):
+    """Count set bits in a uint8 array along the last axis.
+
+    Args:
+        a (np.ndarray): bit-packed array (dtype uint8).
+
+    Returns:
+        np.ndarray: the number of set bits, with the last axis reduced.
+    """
+    if hasattr(np, "bitwise_count"):
+        # numpy >= 2.0
+        return np.bitwise_count(a).sum(axis=-1, dtype=np.int64)
+    else:
+        return _POPCOUNT_TABLE[a].sum(axis=-1, dtype=np.int64)
+
+
+def pack_columns(data):
+    """Convert a binary data matrix into bit-packed columns.
+
+    Args:
+        data (np.ndarray or pd.DataFrame): data matrix of shape
+            (n_samples, n_nodes). Positive values are regarded as 1.
+
+    Returns:
+        np.ndarray: uint8 array of shape (n_nodes, ceil(n_samples / 8)).
+    """
+    if isinstance(data, BitMatrix):
+        return data.bits
+    dm = np.asarray(data)
+    return np.ascontiguousarray(np.packbits(dm > 0, axis=0).T)
+
+
+class BitMatrix(object):
+    """Binary data matrix of bit-packed columns, used as a compact
+    replacement of binarized input DataFrame (1 bit per value).
+
+    It provides shape, columns and index as pandas.DataFrame,
+    and is accepted by the CI test objects in this module.
+    values (or np.asarray) unpacks it into a uint8 matrix.
+
+    Args:
+        bits (np.ndarray): uint8 array of shape
+            (n_nodes, ceil(n_samples / 8)), see pack_columns.
+        n_samples (int): the number of samples (rows).
+        columns (list, optional): column labels (e.g., eids).
+        index (pd.Index, optional): row labels (e.g., DatetimeIndex).
+    """
+
+    def __init__(self, bits, n_samples, columns=None, index=None):
+        self.bits = bits
+        self.n_samples = n_samples
+        if columns is None:
+            columns = list(range(bits.shape[0]))
+        self.columns = list(columns)
+        self.index = index
+
+    @classmethod
+    def from_dense(cls, data):
+        """Pack a binary data matrix (np.ndarray or pd.DataFrame)."""
+        columns = getattr(data, "columns", None)
+        index = getattr(data, "index", None)
+        return cls(pack_columns(data), np.asarray(data).shape[0],
+                   columns=columns, index=index)
+
+    @property
+    def shape(self):
+        return self.n_samples, len(self.columns)
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def column(self, idx):
+        """Values of idx-th column as uint8 array."""
+        return np.unpackbits(self.bits[idx], count=self.n_samples)
+
+    def nonzero(self, idx):
+        """Row indices of nonzero values in idx-th column."""
+        return np.flatnonzero(self.column(idx))
+
+    @property
+    def values(self):
+        return np.ascontiguousarray(
+            np.unpackbits(self.bits, axis=1, count=self.n_samples).T)
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.values
+        else:
+            return self.values.astype(dtype)
+
+    def to_dataframe(self):
+        import pandas as pd
+        return pd.DataFrame(self.values, index=self.index,
+                            columns=self.columns)
+
+
+class CITest(object):
+    """Base class of conditional independence tests.
+
+    Subclasses implement pvalues(), that returns p-values of
+    the independence of node x and y given each conditioning set.
+    """
+
+    def __call__(self, data_matrix, x, y, s, **kwargs):
+        # interface of indep_test_func in pcalg
+        return self.pvalue(x, y, s)
+
+    def pvalue(self, x, y, s):
+        return self.pvalues(x, y, [s])[0]
+
+    def pvalues(self, x, y, l_s):
+        raise NotImplementedError
+
+
+class FunctionCITest(CITest):
+    """Wrapper of CI test functions with the interface of pcalg,
+    such as gsq.ci_tests.ci_test_bin. Conditioning sets are tested
+    one by one."""
+
+    def __init__(self, func, data_matrix, **kwargs):
+        self._func = func
+        self._dm = data_matrix
+        self._kwargs = kwargs
+
+    def pvalues(self, x, y, l_s):
+        return np.array([self._func(self._dm, x, y, set(s), **self._kwargs)
+                         for s in l_s])
+
+
+class GSquareBatch(CITest):
+    """G-square test for binary data, equivalent to gsq.ci_tests.ci_test_bin.
+
+    Every column is packed into a bit vector. Contingency tables
+    for all configurations of conditioning sets are counted with
+    bitwise AND and popcount, for multiple conditioning sets at once.
+    """
+
+    def __init__(self, data):
+        self._n_samples = data.shape[0]
+        self._bits = pack_columns(data)
+        self._valid = np.packbits(np.ones(self._n_samples, dtype=bool))
+        self._warned = set()
+
+    @property
+    def n_samples(self):
+        return self._n_samples
+
+    def pvalues(self, x, y, l_s):
+        ret = np.ones(len(l_s))
+        d_size = {}
+        for idx, s in enumerate(l_s):
+            d_size.setdefault(len(s), []).append(idx)
+        for size, l_idx in d_size.items():
+            a_s = np.array([sorted(l_s[idx]) for idx in l_idx],
+                           dtype=np.int64).reshape(len(l_idx), size)
+            ret[l_idx] = self._pvalues_fixed_size(x, y, a_s)
+        return ret
+
+    def _pvalues_fixed_size(self, x, y, a_s):
+        n_sets, size = a_s.shape
+        dof = 2 ** size
+        if self._n_samples < 10 * dof:
+            if size not in self._warned:
+                _logger.warning("Not enough samples. {0} is too small. "
+                                "Need {1}.".format(self._n_samples, 10 * dof))
+                self._warned.add(size)
+            return np.ones(n_sets)
+
+        n_bytes = self._bits.shape[1]
+        chunk = max(1, BATCH_BUFFER_SIZE // max(1, dof * n_bytes))
+        l_g2 = []
+        for top in range(0, n_sets, chunk):
+            l_g2.append(self._g2(x, y, a_s[top:top + chunk]))
+        g2 = np.concatenate(l_g2)
+        return chi2.sf(g2, dof)
+
+    def _config_masks(self, a_s):
+        """Bit masks of samples for every configuration of
+        the conditioning sets, in shape (n_sets, 2 ** size, n_bytes)."""
+        n_sets, size = a_s.shape
+        configs = np.array(list(product((False, True), repeat=size)),
+                           dtype=bool).reshape(2 ** size, size)
+        masks = np.broadcast_to(self._valid,
+                                (n_sets, 2 ** size, self._valid.size)).copy()
+        for t in range(size):
+            pos = self._bits[a_s[:, t]][:, np.newaxis, :]
+            neg = ~pos & self._valid
+            sel = configs[:, t][np.newaxis, :, np.newaxis]
+            masks &= np.where(sel, pos, neg)
+        return masks
+
+    def _g2(self, x, y, a_s):
+        masks = self._config_masks(a_s)
+        xbits = self._bits[x]
+        ybits = self._bits[y]
+        nk = popcount(masks)
+        nxk = popcount(masks & xbits)
+        nyk = popcount(masks & ybits)
+        nxyk = popcount(masks & (xbits & ybits))
+        return g2_statistic(nk, nxk, nyk, nxyk)
+
+
+def g2_statistic(nk, nxk, nyk, nxyk):
+    """G-square statistic of binary x and y from the counts
+    for every configuration k of the conditioning set.
+
+    Args:
+        nk, nxk, nyk, nxyk (np.ndarray): the number of samples
+            with configuration k, and also with x = 1, y = 1,
+            and x = y = 1, in shape (n_sets, n_configs).
+
+    Returns:
+        np.ndarray: G-square statistic in shape (n_sets, ).
+    """
+    # contingency table nijk and its marginals, with axes
+    # (set, i, j, k) and (set, i or j, k)
+    nijk = np.stack([np.stack([nk - nxk - nyk + nxyk, nyk - nxyk], 1),
+                     np.stack([nxk - nxyk, nxyk], 1)], 1)
+    nik = np.stack([nk - nxk, nxk], 1)
+    njk = np.stack([nk - nyk, nyk], 1)
+    expected = (nik[:, :, np.newaxis, :] * njk[:, np.newaxis, :, :]
+                / np.maximum(nk, 1)[:, np.newaxis, np.newaxis, :])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(nijk > 0,
+                         nijk * np.log(nijk / expected), 0.)
+    return 2 * terms.sum(axis=(1, 2, 3))
+
+
+class SparseBinaryStats(object):
+    """Sufficient statistics of a sparse binary data matrix.
+
+    Built once for a job, in the cost proportional to the number of
+    nonzero values: row indices of nonzero values in every column,
+    counts of nonzero values, and pairwise co-occurrence counts.
+    Contingency tables of empty conditioning sets are given by
+    the counts and co-occurrence counts, and those of 1 conditioning
+    node additionally need to scan only the rows of the node.
+    Joint configurations of larger conditioning sets are counted
+    only on the rows with any nonzero value in the set,
+    and cached for frequently used conditioning sets.
+
+    Args:
+        data (np.ndarray or pd.DataFrame): data matrix of shape
+            (n_samples, n_nodes). Positive values are regarded as 1.
+        cache_size (int): the number of conditioning sets to cache
+            their joint configurations.
+    """
+
+    def __init__(self, data, cache_size=4096):
+        import scipy.sparse
+
+        self.n_samples = data.shape[0]
+        if isinstance(data, BitMatrix):
+            self.rows = [data.nonzero(i) for i in range(data.shape[1])]
+            indptr = np.concatenate(
+                [[0], np.cumsum([rows.size for rows in self.rows])])
+            indices = np.concatenate([[]] + self.rows).astype(np.int64)
+            sp = scipy.sparse.csc_matrix(
+                (np.ones(indices.size, dtype=np.int64), indices, indptr),
+                shape=data.shape)
+        else:
+            sp = scipy.sparse.csc_matrix(np.asarray(data) > 0,
+                                         dtype=np.int64)
+            sp.sort_indices()
+            self.rows = [sp.indices[sp.indptr[i]:sp.indptr[i + 1]]
+                         for i in range(sp.shape[1])]
+        self.counts = np.diff(sp.indptr).astype(np.int64)
+        self.cooc = (sp.T @ sp).tocsr()
+        self.cooc.sort_indices()
+        # bit-packed columns to look up values of given rows
+        self._bits = pack_columns(data)
+        self._cache_size = cache_size
+        self._configs = OrderedDict()
+
+    def corrcoef(self):
+        """Correlation matrix, same as np.corrcoef(data.T)
+        for binary data."""
+        n = self.n_samples
+        p = self.counts / n
+        cov = self.cooc.toarray() / n - np.outer(p, p)
+        std = np.sqrt(np.diag(cov))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cm = cov / np.outer(std, std)
+        return np.clip(cm, -1, 1)
+
+    def cooccurrence(self, x, y):
+        """The number of rows where both x and y are nonzero."""
+        top, end = self.cooc.indptr[x], self.cooc.indptr[x + 1]
+        idx = top + np.searchsorted(self.cooc.indices[top:end], y)
+        if idx < end and self.cooc.indices[idx] == y:
+            return int(self.cooc.data[idx])
+        return 0
+
+    def values(self, node, rows):
+        """Binary values (0 or 1) of a node at given rows."""
+        return (self._bits[node][rows >> 3] >> (7 - (rows & 7))) & 1
+
+    def configs(self, s):
+        """Joint configurations of conditioning set s.
+
+        Returns:
+            np.ndarray: rows with any nonzero value in s.
+            np.ndarray: configuration codes of the rows,
+                sum of 2 ** t for t-th node with value 1.
+        """
+        s = tuple(s)
+        if s in self._configs:
+            self._configs.move_to_end(s)
+            return self._configs[s]
+        if len(s) == 1:
+            rows = self.rows[s[0]]
+        else:
+            rows = np.unique(np.concatenate([self.rows[z] for z in s]))
+        codes = np.zeros(rows.size, dtype=np.int64)
+        for t, z in enumerate(s):
+            codes |= self.values(z, rows).astype(np.int64) << t
+        self._configs[s] = (rows, codes)
+        if len(self._configs) > self._cache_size:
+            self._configs.popitem(last=False)
+        return rows, codes
+
+    def config_counts(self, x, y, s):
+        """Counts nk, nxk, nyk, nxyk for every configuration k of s,
+        in shape (2 ** len(s), ). Configuration 0 (all zero) is derived
+        from the totals, so that only nonzero rows are scanned."""
+        n_configs = 2 ** len(s)
+        n = self.n_samples
+        n_x = self.counts[x]
+        n_y = self.counts[y]
+        n_xy = self.cooccurrence(x, y)
+        if len(s) == 0:
+            return (np.array([n]), np.array([n_x]),
+                    np.array([n_y]), np.array([n_xy]))
+        elif len(s) == 1:
+            z = s[0]
+            n_z = self.counts[z]
+            n_xz = self.cooccurrence(x, z)
+            n_yz = self.cooccurrence(y, z)
+            rows = self.rows[z]
+            n_xyz = int((self.values(x, rows) & self.values(y, rows)).sum())
+            return (np.array([n - n_z, n_z]),
+                    np.array([n_x - n_xz, n_xz]),
+                    np.array([n_y - n_yz, n_yz]),
+                    np.array([n_xy - n_xyz, n_xyz]))
+        rows, codes = self.configs(s)
+        in_x = self.values(x, rows).astype(bool)
+        in_y = self.values(y, rows).astype(bool)
+        nk = np.bincount(codes, minlength=n_configs)
+        nxk = np.bincount(codes[in_x], minlength=n_configs)
+        nyk = np.bincount(codes[in_y], minlength=n_configs)
+        nxyk = np.bincount(codes[in_x & in_y], minlength=n_configs)
+        nk[0] = n - rows.size
+        nxk[0] = n_x - nxk[1:].sum()
+        nyk[0] = n_y - nyk[1:].sum()
+        nxyk[0] = n_xy - nxyk[1:].sum()
+        return nk, nxk, nyk, nxyk
+
+
+class GSquareSparse(CITest):
+    """G-square test for sparse binary data, equivalent to
+    gsq.ci_tests.ci_test_bin. Contingency tables are given by
+    SparseBinaryStats.config_counts (see SparseBinaryStats)."""
+
+    def __init__(self, data, stats=None):
+        if stats is None:
+            stats = SparseBinaryStats(data)
+        self._stats = stats
+        self._warned = set()
+
+    @property
+    def n_samples(self):
+        return self._stats.n_samples
+
+    def pvalues(self, x, y, l_s):
+        ret = np.ones(len(l_s))
+        d_size = {}
+        for idx, s in enumerate(l_s):
+            d_size.setdefault(len(s), []).append(idx)
+        for size, l_idx in d_size.items():
+            dof = 2 ** size
+            if self.n_samples < 10 * dof:
+                if size not in self._warned:
+                    _logger.warning("Not enough samples. {0} is too small. "
+                                    "Need {1}.".format(self.n_samples,
+                                                       10 * dof))
+                    self._warned.add(size)
+                continue
+            counts = [self._stats.config_counts(x, y, sorted(l_s[idx]))
+                      for idx in l_idx]
+            nk, nxk, nyk, nxyk = [np.array(a) for a in zip(*counts)]
+            ret[l_idx] = chi2.sf(g2_statistic(nk, nxk, nyk, nxyk), dof)
+        return ret
+
+
+class FisherZBatch(CITest):
+    """Fisher's z-test of partial correlation for gaussian data.
+
+    Partial correlations are derived from the correlation matrix
+    precomputed once, for all given conditioning sets at once:
+    with recursive formulas for sets of size 1 and 2,
+    and with inverses of stacked sub-matrices for larger sets.
+    """
+
+    def __init__(self, data, corr_matrix=None):
+        self._n_samples = data.shape[0]
+        if corr_matrix is None:
+            corr_matrix = np.corrcoef(np.asarray(data).T)
+        self._cm = corr_matrix
+
+    @property
+    def n_samples(self):
+        return self._n_samples
+
+    def pvalues(self, x, y, l_s):
+        ret = np.ones(len(l_s))
+        d_size = {}
+        for idx, s in enumerate(l_s):
+            d_size.setdefault(len(s), []).append(idx)
+        for size, l_idx in d_size.items():
+            a_s = np.array([sorted(l_s[idx]) for idx in l_idx],
+                           dtype=np.int64).reshape(len(l_idx), size)
+            r = self.partial_corr(x, y, a_s)
+            ret[l_idx] = self._fisher_z(r, size)
+        return ret
+
+    def partial_corr(self, x, y, a_s):
+        """Partial correlations of x and y given each row of a_s."""
+        cm = self._cm
+        n_sets, size = a_s.shape
+        if size == 0:
+            return np.full(n_sets, cm[x, y])
+        elif size == 1:
+            z = a_s[:, 0]
+            return self._pcorr_recursive(cm[x, y], cm[x, z], cm[y, z])
+        elif size == 2:
+            z1 = a_s[:, 0]
+            z2 = a_s[:, 1]
+            r_xy = self._pcorr_recursive(cm[x, y], cm[x, z1], cm[y, z1])
+            r_xz2 = self._pcorr_recursive(cm[x, z2], cm[x, z1], cm[z2, z1])
+            r_yz2 = self._pcorr_recursive(cm[y, z2], cm[y, z1], cm[z2, z1])
+            return self._pcorr_recursive(r_xy, r_xz2, r_yz2)
+        else:
+            idx = np.concatenate([np.full((n_sets, 1), x),
+                                  np.full((n_sets, 1), y), a_s], axis=1)
+            sub = cm[idx[:, :, np.newaxis], idx[:, np.newaxis, :]]
+            try:
+                prec = np.linalg.inv(sub)
+            except np.linalg.LinAlgError:
+                prec = np.linalg.pinv(sub)
+            return -prec[:, 0, 1] / np.sqrt(prec[:, 0, 0] * prec[:, 1, 1])
+
+    @staticmethod
+    def _pcorr_recursive(r_xy, r_xz, r_yz):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (r_xy - r_xz * r_yz) / np.sqrt((1 - r_xz ** 2) *
+                                                  (1 - r_yz ** 2))
+
+    def _fisher_z(self, r, size):
+        r = np.clip(r, -PCORR_CUT, PCORR_CUT)
+        stat = np.sqrt(self._n_samples - size - 3) * np.arctanh(r)
+        return 2 * norm.sf(np.abs(stat))
+
+
+class CITestCache(object):
+    """LRU cache of p-values of CI tests.
+
+    Keys are given by CachedCITest, consisting of the name of
+    the CI test, and identities and data fingerprints of the nodes.
+    P-values do not depend on the threshold, so the cache can be
+    reused to estimate DAGs with different skeleton_threshold.
+    If size is None, the cache is not bounded.
+    """
+
+    def __init__(self, size):
+        self._size = size
+        self._d = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._d)
+
+    def get(self, key):
+        if key in self._d:
+            self._d.move_to_end(key)
+            self.hits += 1
+            return self._d[key]
+        else:
+            self.misses += 1
+            return None
+
+    def put(self, key, pval):
+        self._d[key] = pval
+        self._d.move_to_end(key)
+        while self._size is not None and len(self._d) > self._size:
+            self._d.popitem(last=False)
+
+    def dump(self, fp, keys=None):
+        if keys is None:
+            obj = list(self._d.items())
+        else:
+            obj = [(key, self._d[key]) for key in keys if key in self._d]
+        with open(fp, "wb") as f:
+            pickle.dump(obj, f)
+
+    def load(self, fp):
+        with open(fp, "rb") as f:
+            obj = pickle.load(f)
+        for key, pval in obj:
+            self.put(key, pval)
+        return len(obj)
+
+
+class CachedCITest(CITest):
+    """CI test object with CITestCache.
+
+    Args:
+        citest (CITest): CI test object to be cached.
+        cache (CITestCache): shared cache object.
+        name (str): name of the CI test (e.g., ci_func).
+        node_keys (List[str]): identities of the nodes
+            (e.g., str(evdef)) that are consistent among jobs.
+        data (np.ndarray, pd.DataFrame or BitMatrix): data matrix,
+            used for fingerprints.
+    """
+
+    def __init__(self, citest, cache, name, node_keys, data):
+        self._citest = citest
+        self._cache = cache
+        self._name = name
+        if isinstance(data, BitMatrix):
+            self._nodes = [(key, self._fingerprint(data.bits[idx]))
+                           for idx, key in enumerate(node_keys)]
+        else:
+            dm = np.asarray(data)
+            self._nodes = [(key, self._fingerprint(dm[:, idx]))
+                           for idx, key in enumerate(node_keys)]
+        # keys used in this object, to dump the cache of a job
+        self.used_keys = set()
+
+    @staticmethod
+    def _fingerprint(column):
+        h = hashlib.blake2b(digest_size=8)
+        h.update(np.ascontiguousarray(column).tobytes())
+        return h.hexdigest()
+
+    def _key(self, x, y, s):
+        # both G-square and Fisher-z tests are symmetric about x and y
+        node_x, node_y = sorted((self._nodes[x], self._nodes[y]))
+        node_s = tuple(sorted(self._nodes[z] for z in s))
+        return self._name, node_x, node_y, node_s
+
+    def pvalues(self, x, y, l_s):
+        ret = np.ones(len(l_s))
+        l_key = [self._key(x, y, s) for s in l_s]
+        l_miss = []
+        for idx, key in enumerate(l_key):
+            pval = self._cache.get(key)
+            if pval is None:
+                l_miss.append(idx)
+            else:
+                ret[idx] = pval
+        if len(l_miss) > 0:
+            a_pval = self._citest.pvalues(x, y, [l_s[idx] for idx in l_miss])
+            for idx, pval in zip(l_miss, a_pval):
+                ret[idx] = pval
+                self._cache.put(l_key[idx], pval)
+        self.used_keys.update(l_key)
+        return ret
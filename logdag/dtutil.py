@@ -6,13 +6,15 @@ import logging
 import random
 import numpy as np
 import dateutil
-from collections import defaultdict
 
 # from itertools import chain
 
 TIMEFMT = "%Y-%m-%d %H:%M:%S"
 _logger = logging.getLogger(__package__)
 
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_US = datetime.timedelta(microseconds=1)
+
 
 def empty_timedelta():
     return datetime.timedelta(seconds=0)
@@ -66,11 +68,68 @@ def range_dt(dts, dte, interval):
 # -> iter_term
 
 
+def dt2us(dt):
+    """Convert datetime into int epoch microseconds.
+    Naive datetime is regarded as local time
+    (same as datetime.timestamp())."""
+    if dt.tzinfo is None:
+        return round(dt.timestamp() * 10 ** 6)
+    return (dt - _EPOCH) // _US
+
+
+def dt2us_array(l_dt):
+    """Convert a sequence of datetime into int64 epoch microseconds.
+    Naive datetime is regarded as local time (same as dt2us).
+    Given int64 numpy array is regarded as already converted."""
+    if isinstance(l_dt, np.ndarray) and l_dt.dtype == np.int64:
+        return l_dt
+    if len(l_dt) == 0:
+        return np.array([], dtype=np.int64)
+    import pandas as pd
+    try:
+        dtindex = pd.DatetimeIndex(l_dt)
+    except (TypeError, ValueError):
+        # e.g., mixed timezones
+        return np.array([dt2us(dt) for dt in l_dt], dtype=np.int64)
+    if dtindex.tz is not None:
+        return dtindex2us(dtindex)
+    return _local2us(dtindex2us(dtindex))
+
+
+def dtindex2us(dtindex):
+    """Convert pandas.DatetimeIndex (in any resolution) into int64
+    microseconds: epoch microseconds if timezone-aware, otherwise
+    microseconds of the wall clock (not regarded as local time)."""
+    # values are in UTC if timezone-aware
+    return np.asarray(dtindex.values).astype("datetime64[us]").view(np.int64)
+
+
+# UTC offsets change at the boundaries of 15 minutes in any timezone
+_OFFSET_UNIT = 15 * 60 * 10 ** 6
+
+
+def _local2us(a_local):
+    """Convert naive local times (int64 microseconds of wall clock)
+    into epoch microseconds, in the same way as dt2us.
+    The UTC offset is derived once for each 15 minutes."""
+    a_unit, a_inv = np.unique(a_local // _OFFSET_UNIT, return_inverse=True)
+    wall_epoch = datetime.datetime(1970, 1, 1)
+    a_offset = np.array(
+        [unit * _OFFSET_UNIT - dt2us(wall_epoch + datetime.timedelta(
+            microseconds=int(unit * _OFFSET_UNIT))) for unit in a_unit],
+        dtype=np.int64)
+    return a_local - a_offset[a_inv.reshape(-1)]
+
+
+def td2us(td):
+    """Convert timedelta into int microseconds."""
+    return td // _US
+
+
 def discretize(l_dt, l_term, dt_range, binarize, l_dt_values=None):
     """Convert list of datetime into numpy array.
-    This function use mapping algorithm: split datetime space by change points
-    (i.e., all ends of datetime terms) and iterate l_dt only once
-    with comparing to the change points.
+    Each bin corresponds to a term, and aggregates datetimes
+    in the term and also in dt_range.
     Args:
         l_dt (List[datetime.datetime]): An input datetime sequence.
         l_term (List[(datetime.datetime, datetime.datetime)]):
@@ -88,106 +147,79 @@ def discretize(l_dt, l_term, dt_range, binarize, l_dt_values=None):
     Returns:
         np.array
     """
+    if len(l_term) == 0:
+        a_top = a_end = np.array([], dtype=np.int64)
+    else:
+        a_top = dt2us_array([term[0] for term in l_term])
+        a_end = dt2us_array([term[1] for term in l_term])
+    return discretize_us(dt2us_array(l_dt), a_top, a_end,
+                         dt2us(dt_range[0]), dt2us(dt_range[1]),
+                         binarize, l_dt_values)
 
-    if l_dt_values is None:
-        l_dt_values = np.array([1] * len(l_dt))
-    top_dt, end_dt = dt_range
-    a_ret = np.zeros(len(l_term), dtype=int)
-
-    # extract change points
-    d_cp = defaultdict(list)
-    # test top_dt
-    for idx, term in enumerate(l_term):
-        if term[0] <= top_dt < term[1]:
-            d_cp[top_dt].append((idx, True))
-    # test both ends of terms
-    for idx, term in enumerate(l_term):
-        if term[0] > top_dt:
-            d_cp[term[0]].append((idx, True))
-        if end_dt >= term[1]:
-            d_cp[term[1]].append((idx, False))
-    # test end_dt
-    for idx, term in enumerate(l_term):
-        if term[0] <= end_dt < term[1]:
-            d_cp[end_dt].append((idx, False))
-
-    # generate mapped change points
-    l_cp = []
-    temp_idxs = set()
-    for dt, changes in sorted(d_cp.items(), key=lambda x: x[0]):
-        for idx, flag in changes:
-            if flag:
-                temp_idxs.add(idx)
-            else:
-                temp_idxs.remove(idx)
-        l_cp.append((dt, tuple(temp_idxs)))
-    assert len(temp_idxs) == 0
 
-    # iteration does not use last component (uniquely used afterward)
-    iterobj = zip(l_cp[:-1], l_cp[1:])
-    try:
-        (key, l_rid), (next_key, next_l_rid) = next(iterobj)
-    except StopIteration:
-        return a_ret
-
-    for dt, v in zip(l_dt, l_dt_values):
-        if not dt_range[0] <= dt < dt_range[1]:
-            # ignored
-            continue
-        assert dt >= key
-        if next_key is not None:
-            while dt >= next_key:
-                try:
-                    (key, l_rid), (next_key, next_l_rid) = next(iterobj)
-                except StopIteration:
-                    # not iterate after here and use last component
-                    key, l_rid = l_cp[-1]
-                    next_key = None
-                    break
-        # following processed only if key <= dt < next_key
-        if binarize:
-            a_ret[np.array(l_rid)] = 1
-        else:
-            a_ret[np.array(l_rid)] += v
+def discretize_us(a_ts, a_top, a_end, top, end, binarize,
+                  a_values=None):
+    """discretize() on int64 epoch microseconds.
+    Bins are counted with binary search over sorted timestamps,
+    so the cost is O((n_timestamps + n_terms) * log(n_timestamps)).
+
+    Args:
+        a_ts (np.ndarray): timestamps, need not be sorted.
+        a_top (np.ndarray): start (inclusive) of each term.
+        a_end (np.ndarray): end (exclusive) of each term.
+        top (int): start (inclusive) of the whole range.
+        end (int): end (exclusive) of the whole range.
+        binarize (bool): If True, return 0 or 1 for each bin.
+        a_values (np.ndarray, optional): values to be aggregated,
+            corresponding to a_ts. Truncated into int.
 
-    return a_ret
+    Returns:
+        np.array
+    """
+    mask = (a_ts >= top) & (a_ts < end)
+    order = np.argsort(a_ts[mask], kind="stable")
+    a_ts = a_ts[mask][order]
+
+    a_lo = np.searchsorted(a_ts, np.maximum(a_top, top), side="left")
+    a_hi = np.searchsorted(a_ts, np.minimum(a_end, end), side="left")
+    a_hi = np.maximum(a_hi, a_lo)
+    if binarize:
+        return (a_hi > a_lo).astype(int)
+    elif a_values is None:
+        return (a_hi - a_lo).astype(int)
+    else:
+        a_values = np.trunc(np.asarray(a_values)[mask][order]).astype(int)
+        a_cum = np.concatenate([[0], np.cumsum(a_values)])
+        return a_cum[a_hi] - a_cum[a_lo]
 
 
 def discretize_sequential(l_dt, dt_range, binsize,
                           binarize=False, l_dt_values=None):
-    l_term = []
-    top_dt, end_dt = dt_range
-    temp_dt = top_dt
-    while temp_dt < end_dt:
-        l_term.append((temp_dt, temp_dt + binsize))
-        temp_dt += binsize
-
-    return discretize(l_dt, l_term, dt_range, binarize)
+    top, end = dt2us(dt_range[0]), dt2us(dt_range[1])
+    a_top = np.arange(top, end, td2us(binsize), dtype=np.int64)
+    a_end = a_top + td2us(binsize)
+    return discretize_us(dt2us_array(l_dt), a_top, a_end,
+                         top, end, binarize)
 
 
 def discretize_slide(l_dt, dt_range, bin_slide, binsize,
                      binarize=False, l_dt_values=None):
-    l_term = []
-    top_dt, end_dt = dt_range
-    temp_dt = top_dt
-    while temp_dt < end_dt:
-        l_term.append((temp_dt, temp_dt + binsize))
-        temp_dt += bin_slide
-
-    return discretize(l_dt, l_term, dt_range, binarize)
+    top, end = dt2us(dt_range[0]), dt2us(dt_range[1])
+    a_top = np.arange(top, end, td2us(bin_slide), dtype=np.int64)
+    a_end = a_top + td2us(binsize)
+    return discretize_us(dt2us_array(l_dt), a_top, a_end,
+                         top, end, binarize)
 
 
 def discretize_radius(l_dt, dt_range, bin_slide, bin_radius,
                       binarize=False, l_dt_values=None):
-    l_label = []
-    top_dt, end_dt = dt_range
-    temp_dt = top_dt + 0.5 * bin_slide
-    while temp_dt < end_dt:
-        l_label.append(temp_dt)
-        temp_dt += bin_slide
-    l_term = [(dt - bin_radius, dt + bin_radius) for dt in l_label]
-
-    return discretize(l_dt, l_term, dt_range, binarize)
+    top, end = dt2us(dt_range[0]), dt2us(dt_range[1])
+    a_label = np.arange(top + td2us(0.5 * bin_slide), end,
+                        td2us(bin_slide), dtype=np.int64)
+    a_top = a_label - td2us(bin_radius)
+    a_end = a_label + td2us(bin_radius)
+    return discretize_us(dt2us_array(l_dt), a_top, a_end,
+                         top, end, binarize)
 
 
 # old
@@ -377,8 +409,8 @@ def radj_sep(dt, duration):
 
 
 def shortstr(dt):
-    date = datetime.datetime.combine(dt.date(), datetime.time())
-    date.tzinfo = dt.tzinfo
+    date = datetime.datetime.combine(dt.date(), datetime.time(),
+                                     tzinfo=dt.tzinfo)
     if date == dt:
         return dt.strftime("%Y%m%d")
     else:
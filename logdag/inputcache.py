@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Cache of loaded and discretized event series, and
+materialized input of jobs.
+
+Jobs of the same time window (e.g., areas with overlapping hosts,
+or area = each) load same series repeatedly. SeriesCache keeps
+the discretized series keyed by the source, series and binning
+parameters, in memory for the current window, and optionally
+in npy files to share them among processes of make-dag -p.
+
+dump_input and load_input store the whole input matrix of a job
+in the job directory, to estimate DAGs again with other parameters
+(make-dag --reuse-input) without loading events.
+"""
+
+import os
+import json
+import shutil
+import logging
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+
+from amulog import config
+
+_logger = logging.getLogger(__package__)
+
+# cache object in a process, see init_series_cache
+_series_cache = None
+
+
+class SeriesCache(object):
+    """Discretized series (1-dimensional array, or None if empty)
+    of one time window.
+
+    Args:
+        cache_dir (str, optional): If given, series are also stored
+            in npy files under this directory, and mapped in memory
+            (read-only) on loading.
+        max_windows (int, optional): Number of windows kept in cache_dir.
+            Least recently stored ones are removed on storing a new window.
+            If 0, the files are never removed.
+    """
+
+    def __init__(self, cache_dir=None, max_windows=0):
+        self._cache_dir = cache_dir
+        self._max_windows = max_windows
+        self._window = None
+        self._d = {}
+        self._evicted = False
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(src, measure, tags, dt_range, method,
+            ci_bin_size, ci_bin_diff, binarize):
+        s = repr((src, measure, sorted(tags.items()),
+                  tuple(dt.isoformat() for dt in dt_range), method,
+                  config.dur2str(ci_bin_size), config.dur2str(ci_bin_diff),
+                  bool(binarize)))
+        return hashlib.sha1(s.encode("utf-8")).hexdigest()
+
+    def _set_window(self, dt_range):
+        window = tuple(dt.isoformat() for dt in dt_range)
+        if window != self._window:
+            # keep series of only 1 window in memory
+            self._window = window
+            self._d = {}
+            self._evicted = False
+
+    def _window_dir(self):
+        return "{0}/{1}_{2}".format(
+            self._cache_dir, *[s.replace(":", "") for s in self._window])
+
+    def _path(self, key):
+        return "{0}/{1}.npy".format(self._window_dir(), key)
+
+    def _evict(self, current):
+        # windows are ordered by the modification time of the directories,
+        # i.e., the time of storing the last series
+        l_dir = []
+        for name in os.listdir(self._cache_dir):
+            dirname = os.path.join(self._cache_dir, name)
+            if dirname == current or not os.path.isdir(dirname):
+                continue
+            try:
+                l_dir.append((os.path.getmtime(dirname), dirname))
+            except OSError:
+                # removed by another process
+                pass
+        n_remove = len(l_dir) + 1 - self._max_windows
+        for _, dirname in sorted(l_dir)[:max(n_remove, 0)]:
+            _logger.debug("remove input cache {0}".format(dirname))
+            shutil.rmtree(dirname, ignore_errors=True)
+
+    def get(self, key, dt_range):
+        """Returns:
+            bool: True if the series is cached.
+            np.ndarray or None: the series, None if it is empty.
+        """
+        self._set_window(dt_range)
+        if key in self._d:
+            self.hits += 1
+            return True, self._d[key]
+        if self._cache_dir is not None:
+            fp = self._path(key)
+            try:
+                array = np.load(fp, mmap_mode="r")
+            except (OSError, ValueError):
+                # not stored, or removed by another process
+                pass
+            else:
+                if array.size == 0:
+                    array = None
+                self._d[key] = array
+                self.hits += 1
+                return True, array
+        self.misses += 1
+        return False, None
+
+    def put(self, key, dt_range, array):
+        self._set_window(dt_range)
+        self._d[key] = array
+        if self._cache_dir is not None:
+            fp = self._path(key)
+            if array is None:
+                array = np.zeros(0)
+            # write and rename, not to load partially written files
+            # in other processes
+            tmp_fp = "{0}.{1}.{2}.tmp".format(fp, os.getpid(),
+                                              threading.get_ident())
+            try:
+                os.makedirs(os.path.dirname(fp), exist_ok=True)
+                if self._max_windows > 0 and not self._evicted:
+                    self._evict(os.path.dirname(fp))
+                    self._evicted = True
+                with open(tmp_fp, "wb") as f:
+                    np.save(f, np.asarray(array))
+                os.replace(tmp_fp, fp)
+            except OSError as e:
+                # the window is removed by another process,
+                # cached only in memory
+                if os.path.exists(tmp_fp):
+                    os.remove(tmp_fp)
+                _logger.warning("failed to store input cache: "
+                                "{0}".format(e))
+
+
+def init_series_cache(conf):
+    """Return SeriesCache object of this process,
+    or None if [dag] input_cache is none."""
+    global _series_cache
+    mode = conf.get("dag", "input_cache")
+    if mode == "none":
+        return None
+    elif mode == "memory":
+        cache_dir = None
+    elif mode == "file":
+        cache_dir = conf.get("dag", "input_cache_dir")
+    else:
+        raise ValueError("input_cache invalid ({0})".format(mode))
+    if _series_cache is None:
+        max_windows = conf.getint("dag", "input_cache_max_windows")
+        _series_cache = SeriesCache(cache_dir, max_windows=max_windows)
+    return _series_cache
+
+
+# config options that change the input of a job
+INPUT_CONFIG_KEYS = [("general", "evdb"),
+                     ("general", "log_source"),
+                     ("general", "snmp_source"),
+                     ("general", "host_alias_filename"),
+                     ("database_influx", "host"),
+                     ("database_influx", "port"),
+                     ("database_influx", "log_dbname"),
+                     ("database_influx", "snmp_dbname"),
+                     ("dag", "source"),
+                     ("dag", "snmp_features"),
+                     ("dag", "area_def"),
+                     ("dag", "unit_term"),
+                     ("dag", "ci_bin_method"),
+                     ("dag", "ci_bin_size"),
+                     ("dag", "ci_bin_diff")]
+
+
+def input_fingerprint(conf, args, binarize, packed):
+    """Fingerprint of the config options and job arguments
+    that determine the input of the job.
+    dt_range is given in epoch seconds, so that naive (local time) and
+    timezone-aware datetimes of the same time give the same fingerprint."""
+    _, dt_range, area = args
+    d = {"{0}.{1}".format(section, name): conf.get(section, name)
+         for section, name in INPUT_CONFIG_KEYS}
+    d["dt_range"] = [dt.timestamp() for dt in dt_range]
+    d["area"] = area
+    d["binarize"] = bool(binarize)
+    d["packed"] = bool(packed)
+    s = json.dumps(d, sort_keys=True)
+    return hashlib.sha1(s.encode("utf-8")).hexdigest()
+
+
+def _save_npy(fp, array):
+    tmp_fp = "{0}.{1}.tmp".format(fp, os.getpid())
+    with open(tmp_fp, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_fp, fp)
+
+
+def dump_input(conf, args, input_df, binarize, packed):
+    """Materialize the input of a job (pd.DataFrame or citest.BitMatrix)
+    in the job directory, to be reused by load_input.
+    The event definitions are stored separately with evmap.dump."""
+    from .arguments import ArgumentManager
+    from .citest import BitMatrix
+
+    if isinstance(input_df, BitMatrix):
+        fmt = "packed"
+        array = input_df.bits
+    else:
+        fmt = "dataframe"
+        array = input_df.values
+    index = input_df.index
+    if index is None:
+        a_index = np.zeros(0, dtype=np.int64)
+        naive = False
+    else:
+        from .dtutil import dtindex2us
+        index = pd.DatetimeIndex(index)
+        a_index = dtindex2us(index)
+        naive = index.tz is None
+    _save_npy(ArgumentManager.input_path(conf, args), array)
+    _save_npy(ArgumentManager.input_path(conf, args, name="input_index"),
+              a_index)
+    meta = {"fingerprint": input_fingerprint(conf, args, binarize, packed),
+            "format": fmt,
+            "n_samples": input_df.shape[0],
+            "naive_index": naive,
+            "columns": [int(eid) for eid in input_df.columns]}
+    # meta is written at last, as a mark of completed materialization
+    fp = ArgumentManager.input_path(conf, args, name="input_meta",
+                                    ext="json")
+    with open(fp + ".tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(fp + ".tmp", fp)
+
+
+def load_input(conf, args, binarize, packed):
+    """Load the input materialized by dump_input, mapped in memory
+    without copying the data matrix.
+
+    Returns:
+        pd.DataFrame or citest.BitMatrix: input of the job,
+            or None if not materialized or stale
+            (i.e., materialized with different config).
+        log2event.EventDefinitionMap: event definitions of the input.
+    """
+    from .arguments import ArgumentManager
+    from .citest import BitMatrix
+    from . import log2event
+
+    fp = ArgumentManager.input_path(conf, args, name="input_meta",
+                                    ext="json")
+    if not os.path.exists(fp):
+        return None, None
+    with open(fp, "r") as f:
+        meta = json.load(f)
+    if meta["fingerprint"] != input_fingerprint(conf, args,
+                                                binarize, packed):
+        _logger.info("materialized input is stale: {0}".format(fp))
+        return None, None
+
+    array = np.load(ArgumentManager.input_path(conf, args), mmap_mode="r")
+    a_index = np.load(ArgumentManager.input_path(conf, args,
+                                                 name="input_index"))
+    if a_index.size == 0:
+        index = None
+    elif meta["naive_index"]:
+        index = pd.to_datetime(a_index, unit="us")
+    else:
+        index = log2event.us2dtindex(a_index)
+    if meta["format"] == "packed":
+        input_df = BitMatrix(array, meta["n_samples"],
+                             columns=meta["columns"], index=index)
+    else:
+        input_df = pd.DataFrame(array, index=index,
+                                columns=meta["columns"], copy=False)
+    evmap = log2event.EventDefinitionMap()
+    evmap.load(conf, args)
+    return input_df, evmap
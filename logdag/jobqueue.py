@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Job queue of make-dag on a shared file system.
+
+Any number of make-dag-worker processes (on any hosts sharing
+the output directory) claim the jobs in the args file.
+A job is claimed by creating a lock file exclusively (O_EXCL)
+in the queue directory, and the worker keeps updating the mtime
+of the lock file while running the job (lease).
+The lock of a crashed worker expires after [dag] worker_lease,
+and the job is claimed again by another worker.
+A finished job is marked with a done file (including failed jobs,
+that are not retried). Remove the queue directory to run the jobs again.
+"""
+
+import os
+import json
+import time
+import socket
+import logging
+import threading
+
+_logger = logging.getLogger(__package__)
+
+
+class JobQueue(object):
+    """
+    Args:
+        am (arguments.ArgumentManager): job list.
+        lease (float): seconds to regard a lock without update as expired.
+    """
+    _queue_dirname = "queue"
+
+    def __init__(self, am, lease):
+        self._dirname = "{0}/{1}".format(os.path.dirname(am.args_path),
+                                         self._queue_dirname)
+        os.makedirs(self._dirname, exist_ok=True)
+        self._lease = lease
+        self.worker_id = "{0}:{1}".format(socket.gethostname(), os.getpid())
+
+    def _lock_path(self, jobname):
+        return "{0}/{1}.lock".format(self._dirname, jobname)
+
+    def _done_path(self, jobname):
+        return "{0}/{1}.done".format(self._dirname, jobname)
+
+    def is_done(self, jobname):
+        return os.path.exists(self._done_path(jobname))
+
+    def _is_expired(self, fp):
+        try:
+            mtime = os.stat(fp).st_mtime
+        except FileNotFoundError:
+            return False
+        return time.time() - mtime > self._lease
+
+    def _create(self, fp, content):
+        try:
+            fd = os.open(fp, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        return True
+
+    def _break(self, fp):
+        """Remove an expired lock. Breaking is also exclusive,
+        not to remove the lock newly created by another worker."""
+        break_fp = fp + ".break"
+        if not self._create(break_fp, self.worker_id):
+            if self._is_expired(break_fp):
+                # left by a worker crashed in breaking
+                try:
+                    os.unlink(break_fp)
+                except FileNotFoundError:
+                    pass
+            return False
+        try:
+            if not self._is_expired(fp):
+                return False
+            with open(fp, "r") as f:
+                owner = f.read()
+            _logger.warning("lease of {0} by {1} expired".format(fp, owner))
+            os.unlink(fp)
+            return True
+        except FileNotFoundError:
+            return True
+        finally:
+            os.unlink(break_fp)
+
+    def claim(self, jobname):
+        """Returns True if the job is claimed by this worker."""
+        fp = self._lock_path(jobname)
+        if not self._create(fp, self.worker_id):
+            if not (self._is_expired(fp) and self._break(fp)):
+                return False
+            if not self._create(fp, self.worker_id):
+                return False
+        if self.is_done(jobname):
+            # finished by another worker after the check
+            os.unlink(fp)
+            return False
+        return True
+
+    def renew(self, jobname):
+        os.utime(self._lock_path(jobname))
+
+    def hold(self, jobname):
+        """Context manager to renew the lease while running a job."""
+        return _LeaseHolder(self, jobname, self._lease / 4)
+
+    def complete(self, jobname, result):
+        """Mark the job as done with its result, and release the lock."""
+        fp = self._done_path(jobname)
+        tmp_fp = "{0}.{1}.tmp".format(fp, os.getpid())
+        with open(tmp_fp, "w") as f:
+            json.dump(dict(result, worker=self.worker_id), f)
+        os.replace(tmp_fp, fp)
+        try:
+            os.unlink(self._lock_path(jobname))
+        except FileNotFoundError:
+            pass
+
+
+class _LeaseHolder(object):
+
+    def __init__(self, queue, jobname, interval):
+        self._queue = queue
+        self._jobname = jobname
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            try:
+                self._queue.renew(self._jobname)
+            except OSError:
+                _logger.warning("failed to renew the lease of job({0})".format(
+                    self._jobname))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def run_worker(conf, am, reuse_input=False, resume=False):
+    """Claim and run jobs in the queue until all of them are done.
+
+    Args:
+        resume (bool): If True, jobs completed with the current config
+            in the job manifest are marked as done without running.
+
+    Returns:
+        list: results of the jobs run in this worker (see schedule.run_job).
+    """
+    from amulog import config
+    from . import arguments
+    from . import schedule
+
+    lease = config.getdur(conf, "dag", "worker_lease").total_seconds()
+    poll = config.getdur(conf, "dag", "worker_poll").total_seconds()
+    queue = JobQueue(am, lease)
+    manifest = schedule.JobManifest(am)
+    l_args = schedule.order_jobs(conf, list(am))
+
+    l_result = []
+    while True:
+        n_waiting = 0
+        for args in l_args:
+            jobname = arguments.args2name(args)
+            if queue.is_done(jobname):
+                continue
+            if not queue.claim(jobname):
+                n_waiting += 1
+                continue
+            if resume and manifest.is_completed(conf, args):
+                queue.complete(jobname, manifest.get(jobname))
+                continue
+            with queue.hold(jobname):
+                result = schedule.run_job(args, reuse_input=reuse_input)
+                manifest.record(conf, args, result)
+            queue.complete(jobname, result)
+            l_result.append(result)
+            _logger.info("makedag job({0}) {1} in {2:.1f}s by {3}".format(
+                jobname, result["status"], result["time"], queue.worker_id))
+        if n_waiting == 0:
+            break
+        # wait for the jobs of other workers (or expiration of their leases)
+        time.sleep(poll)
+    return l_result
@@ -1,14 +1,18 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import sys
 import logging
 import pickle
+import datetime
 import pandas as pd
 import numpy as np
 from dateutil import tz
 from collections import namedtuple
+from contextlib import contextmanager
 
 from . import dtutil
+from . import metrics
 from . import arguments
 from amulog import common
 from amulog import config
@@ -19,16 +23,74 @@ SRCCLS_LOG = "log"
 SRCCLS_SNMP = "snmp"
 
 
+def _intern(value):
+    if type(value) is str:
+        return sys.intern(value)
+    else:
+        return value
+
+
 class EventDefinition(object):
+    """Definition of an event (a node of DAGs).
+
+    Attributes are stored in __slots__, and strings are interned
+    (hosts and groups are shared by many events).
+    Equality and hash are defined on ident(), that identifies the event
+    in the same way as str(evdef), and the hash is cached.
+    Subclasses define their attributes in __slots__.
+    """
+    __slots__ = ["source", "host", "group", "_ident", "_hash"]
     _l_attr = ["source", "host", "group"]
 
     def __init__(self, **kwargs):
         for attr in self._l_attr:
-            setattr(self, attr, kwargs[attr])
+            setattr(self, attr, _intern(kwargs[attr]))
+        self._ident = None
 
     def key(self):
         return None
 
+    def ident(self):
+        """Tuple identifying the event, corresponding to str(evdef)."""
+        return self.source, self.host, self.group
+
+    def _cached_ident(self):
+        if self._ident is None:
+            self._ident = self.ident()
+            self._hash = hash(self._ident)
+        return self._ident
+
+    def __eq__(self, other):
+        if not isinstance(other, EventDefinition):
+            return NotImplemented
+        return self._cached_ident() == other._cached_ident()
+
+    def __hash__(self):
+        self._cached_ident()
+        return self._hash
+
+    def _state_attrs(self):
+        return [attr for cls in type(self).__mro__
+                for attr in getattr(cls, "__slots__", [])
+                if not attr.startswith("_")]
+
+    def __getstate__(self):
+        # same as the __dict__ of former (not slotted) objects
+        return {attr: getattr(self, attr) for attr in self._state_attrs()}
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            # (__dict__, slots) given by default reduction
+            d = {}
+            for tmp_state in state:
+                if tmp_state:
+                    d.update(tmp_state)
+            state = d
+        for attr, value in state.items():
+            if not attr.startswith("_"):
+                setattr(self, attr, _intern(value))
+        self._ident = None
+
 
 class EventDefinitionMap(object):
     """This class defines classified groups as "Event", and provide
@@ -46,7 +108,7 @@ class EventDefinitionMap(object):
 
     def __init__(self):
         self._emap = {}  # key : eid, val : evdef
-        self._ermap = {}  # key : evdef, val : eid
+        self._ermap = {}  # key : evdef (hashed with ident), val : eid
 
     def __len__(self):
         return len(self._emap)
@@ -64,14 +126,14 @@ class EventDefinitionMap(object):
     def add_evdef(self, evdef):
         eid = self._next_eid()
         self._emap[eid] = evdef
-        self._ermap[str(evdef)] = eid
+        self._ermap[evdef] = eid
         return eid
 
     def has_eid(self, eid):
         return eid in self._emap
 
     def has_evdef(self, evdef):
-        return str(evdef) in self._ermap
+        return evdef in self._ermap
 
     def evdef(self, eid):
         return self._emap[eid]
@@ -80,7 +142,7 @@ class EventDefinitionMap(object):
         return self._emap.items()
 
     def get_eid(self, evdef):
-        return self._ermap[str(evdef)]
+        return self._ermap[evdef]
 
     def iter_eid(self):
         return self._emap.keys()
@@ -91,7 +153,9 @@ class EventDefinitionMap(object):
 
     def dump(self, conf, args):
         fp = arguments.ArgumentManager.evdef_path(args)
-        obj = (self._emap, self._ermap)
+        # reverse map keyed by str(evdef), same format as former versions
+        obj = (self._emap, {str(evdef): eid
+                            for eid, evdef in self._emap.items()})
         with open(fp, "wb") as f:
             pickle.dump(obj, f)
 
@@ -100,13 +164,13 @@ class EventDefinitionMap(object):
         try:
             with open(fp, "rb") as f:
                 obj = pickle.load(f)
-            self._emap, self._ermap = obj
         except:
             # compatibility
             fp = arguments.ArgumentManager.evdef_path_old(args)
             with open(fp, "rb") as f:
                 obj = pickle.load(f)
-            self._emap, self._ermap = obj
+        self._emap = obj[0]
+        self._ermap = {evdef: eid for eid, evdef in self._emap.items()}
 
 class AreaTest():
 
@@ -137,7 +201,54 @@ class AreaTest():
         return self._testfunc(area, host)
 
 
+# event loaders kept in a process, key: src, val: (conf, loader)
+_warm_evloaders = {}
+
+
+def warm_evloaders(conf):
+    """Keep event loaders (with their connections to the databases
+    and loaded definitions) in the process, to be reused by init_evloader
+    for the jobs of the same conf (e.g., in make-dag-server)."""
+    for src in config.getlist(conf, "dag", "source"):
+        if src not in _warm_evloaders or _warm_evloaders[src][0] is not conf:
+            _warm_evloaders[src] = (conf, _new_evloader(conf, src))
+
+
+def register_evloader(conf, src, el):
+    """Use el as the event loader of src for the jobs of conf,
+    e.g., synthetic events in benchmarks. It is kept in the process
+    until unregister_evloader (see also registered_evloader)."""
+    _warm_evloaders[src] = (conf, el)
+
+
+def unregister_evloader(src):
+    """Remove the event loader of src kept in the process
+    (given by register_evloader or warm_evloaders)."""
+    _warm_evloaders.pop(src, None)
+
+
+@contextmanager
+def registered_evloader(conf, src, el):
+    """Use el as the event loader of src for the jobs of conf
+    in the block, and restore the former loader on exit."""
+    prev = _warm_evloaders.get(src)
+    register_evloader(conf, src, el)
+    try:
+        yield el
+    finally:
+        if prev is None:
+            unregister_evloader(src)
+        else:
+            _warm_evloaders[src] = prev
+
+
 def init_evloader(conf, src):
+    if src in _warm_evloaders and _warm_evloaders[src][0] is conf:
+        return _warm_evloaders[src][1]
+    return _new_evloader(conf, src)
+
+
+def _new_evloader(conf, src):
     if src == SRCCLS_LOG:
         from .source import evgen_log
         return evgen_log.LogEventLoader(conf)
@@ -155,8 +266,10 @@ def init_evloaders(conf):
 
 def load_event(measure, tags, dt_range, ci_bin_size, ci_bin_diff,
                method, binarize, el):
+    metrics.incr("source.series")
     if method == "sequential":
-        df = el.load(measure, tags, dt_range, ci_bin_size)
+        with metrics.timer("source.query"):
+            df = el.load(measure, tags, dt_range, ci_bin_size)
         if df is None or df[el.fields[0]].sum() == 0:
             _logger.debug("{0} is empty".format((measure, tags)))
             return None
@@ -166,15 +279,15 @@ def load_event(measure, tags, dt_range, ci_bin_size, ci_bin_diff,
         tmp_dt_range = (dt_range[0],
                         max(dt_range[1],
                             dt_range[1] + (ci_bin_size - ci_bin_diff)))
-        items = list(el.load_items(measure, tags, tmp_dt_range))
-        if len(items) == 0:
+        with metrics.timer("source.query"):
+            a_ts, a_values = el.load_array(measure, tags, tmp_dt_range)
+        if a_ts.size == 0:
             _logger.debug("{0} is empty".format((measure, tags)))
             return None
-        l_dt = [e[0] for e in items]
-        l_array = np.vstack([e[1] for e in items])[:, 0]
-        data = dtutil.discretize_slide(l_dt, dt_range, ci_bin_diff,
-                                       ci_bin_size, binarize,
-                                       l_dt_values=l_array)
+        with metrics.timer("discretize"):
+            data = dtutil.discretize_slide(a_ts, dt_range, ci_bin_diff,
+                                           ci_bin_size, binarize,
+                                           l_dt_values=a_values[:, 0])
         l_dt_label = dtutil.range_dt(dt_range[0], dt_range[1], ci_bin_diff)
         dtindex = pd.to_datetime(l_dt_label)
         dtindex = dtindex.tz_localize(tz.tzlocal())
@@ -184,15 +297,15 @@ def load_event(measure, tags, dt_range, ci_bin_size, ci_bin_diff,
                             dt_range[0] - 0.5 * (ci_bin_size - ci_bin_diff)),
                         max(dt_range[1],
                             dt_range[1] + 0.5 * (ci_bin_size - ci_bin_diff)))
-        items = list(el.load_items(measure, tags, tmp_dt_range))
-        if len(items) == 0:
+        with metrics.timer("source.query"):
+            a_ts, a_values = el.load_array(measure, tags, tmp_dt_range)
+        if a_ts.size == 0:
             _logger.debug("{0} is empty".format((measure, tags)))
             return None
-        l_dt = [e[0] for e in items]
-        l_array = np.vstack([e[1] for e in items])[:, 0]
-        data = dtutil.discretize_radius(l_dt, dt_range, ci_bin_diff,
-                                        0.5 * ci_bin_size, binarize,
-                                        l_dt_values=l_array)
+        with metrics.timer("discretize"):
+            data = dtutil.discretize_radius(a_ts, dt_range, ci_bin_diff,
+                                            0.5 * ci_bin_size, binarize,
+                                            l_dt_values=a_values[:, 0])
         l_dt_label = dtutil.range_dt(dt_range[0], dt_range[1], ci_bin_diff)
         dtindex = pd.to_datetime(l_dt_label)
         dtindex = dtindex.tz_localize(tz.tzlocal())
@@ -203,50 +316,291 @@ def load_event(measure, tags, dt_range, ci_bin_size, ci_bin_diff,
     return df
 
 
+def iter_evdef(conf, src, el, dt_range, area):
+    """Iterate event definitions of a source in the order of eids."""
+    if src == SRCCLS_LOG:
+        for evdef in el.iter_evdef(dt_range, area):
+            yield evdef
+    elif src == SRCCLS_SNMP:
+        areatest = AreaTest(conf)
+        l_feature_name = config.getlist(conf, "dag", "snmp_features")
+        if len(l_feature_name) == 0:
+            l_feature_name = el.all_feature()
+        for evdef in el.iter_evdef(l_feature_name):
+            if areatest.test(area, evdef.host):
+                yield evdef
+    else:
+        raise NotImplementedError
+
+
 def load_event_log_all(conf, dt_range, area, binarize, d_el=None):
     if d_el is None:
-        from .source import evgen_log
-        el = evgen_log.LogEventLoader(conf)
+        el = init_evloader(conf, SRCCLS_LOG)
     else:
         el = d_el[SRCCLS_LOG]
-
-    method = conf.get("dag", "ci_bin_method")
-    ci_bin_size = config.getdur(conf, "dag", "ci_bin_size")
-    ci_bin_diff = config.getdur(conf, "dag", "ci_bin_diff")
-
-    for evdef in el.iter_evdef(dt_range, area):
-        measure, tags = evdef.series()
-        df = load_event(measure, tags, dt_range, ci_bin_size, ci_bin_diff,
-                        method, binarize, el)
-        if df is not None:
-            yield evdef, df
+    for evdef, df in _iter_load_event(conf, [(SRCCLS_LOG, el)],
+                                      dt_range, area, binarize):
+        yield evdef, df
 
 
 def load_event_snmp_all(conf, dt_range, area, binarize, d_el=None):
     if d_el is None:
-        from .source import evgen_snmp
-        el = evgen_snmp.SNMPEventLoader(conf)
+        el = init_evloader(conf, SRCCLS_SNMP)
     else:
         el = d_el["snmp"]
-    areatest = AreaTest(conf)
+    for evdef, df in _iter_load_event(conf, [(SRCCLS_SNMP, el)],
+                                      dt_range, area, binarize):
+        yield evdef, df
+
+
+def _iter_load_event(conf, l_src_el, dt_range, area, binarize):
+    """Load events of given sources (list of (src, el)).
+    If [dag] load_workers > 1, queries are issued concurrently
+    in a thread pool, and yielded in the same order as sequential."""
     method = conf.get("dag", "ci_bin_method")
     ci_bin_size = config.getdur(conf, "dag", "ci_bin_size")
     ci_bin_diff = config.getdur(conf, "dag", "ci_bin_diff")
+    n_workers = conf.getint("dag", "load_workers")
 
-    l_feature_name = config.getlist(conf, "dag", "snmp_features")
-    if len(l_feature_name) == 0:
-        l_feature_name = el.all_feature()
-    for evdef in el.iter_evdef(l_feature_name):
+    from . import inputcache
+    cache = inputcache.init_series_cache(conf)
+
+    def _load(task):
+        evdef, el, src = task
         measure, tags = evdef.series()
-        if not areatest.test(area, tags["host"]):
-            continue
-        df = load_event(measure, tags, dt_range, ci_bin_size, ci_bin_diff,
-                        method, binarize, el)
-        if df is not None:
-            yield evdef, df
+        if cache is None:
+            return load_event(measure, tags, dt_range, ci_bin_size,
+                              ci_bin_diff, method, binarize, el)
+        key = cache.key(src, measure, tags, dt_range, method,
+                        ci_bin_size, ci_bin_diff, binarize)
+        hit, array = cache.get(key, dt_range)
+        if hit:
+            metrics.incr("source.cache_hits")
+        else:
+            df = load_event(measure, tags, dt_range, ci_bin_size,
+                            ci_bin_diff, method, binarize, el)
+            if df is None:
+                array = None
+            else:
+                array = df.values[:, 0]
+            cache.put(key, dt_range, array)
+        if array is None:
+            return None
+        a_index = bin_index(dt_range, method, ci_bin_size, ci_bin_diff)
+        return pd.DataFrame(array, index=us2dtindex(a_index))
+
+    iterobj = ((evdef, el, src) for src, el in l_src_el
+               for evdef in iter_evdef(conf, src, el, dt_range, area))
+    if n_workers > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        l_task = list(iterobj)
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            # executor.map keeps the order of tasks
+            for (evdef, _, _), df in zip(l_task,
+                                         executor.map(_load, l_task)):
+                if df is not None:
+                    yield evdef, df
+    else:
+        for task in iterobj:
+            df = _load(task)
+            if df is not None:
+                yield task[0], df
+
+
+def bin_index(dt_range, method, ci_bin_size, ci_bin_diff):
+    """Bins of the series given by load_event,
+    in int64 epoch microseconds."""
+    top, end = dtutil.dt2us(dt_range[0]), dtutil.dt2us(dt_range[1])
+    if method == "sequential":
+        # bins of GROUP BY time() in influxdb are aligned on epoch
+        binsize = dtutil.td2us(ci_bin_size)
+        return np.arange(top // binsize * binsize, end, binsize,
+                         dtype=np.int64)
+    elif method in ("slide", "radius"):
+        return np.arange(top, end, dtutil.td2us(ci_bin_diff),
+                         dtype=np.int64)
+    else:
+        raise NotImplementedError
+
+
+def us2dtindex(a_index):
+    """Convert int64 epoch microseconds into DatetimeIndex
+    in local timezone."""
+    dtindex = pd.to_datetime(a_index, unit="us", utc=True)
+    return dtindex.tz_convert(tz.tzlocal())
+
+
+def load_event_batch(l_evdef, dt_range, ci_bin_size, ci_bin_diff,
+                     method, binarize, el, batch_hosts=100, n_workers=1,
+                     cache=None, src=None, packed=False):
+    """Load events with batch queries, that fetch all series of
+    a measurement (for batch_hosts hosts at most) at once.
+    The data are written into a preallocated matrix aligned on the bins.
+    Results are same as load_event for each evdef.
+    If n_workers > 1, the queries are issued concurrently.
+    If cache (inputcache.SeriesCache) is given, only the series
+    not in the cache are queried.
+    If packed (available only if binarize), each column is bit-packed
+    as soon as it is filled, instead of the int64 data matrix.
+
+    Returns:
+        np.ndarray: bins in int64 epoch microseconds.
+        np.ndarray: data matrix in shape (n_bins, n_events),
+            or bit-packed columns in shape (n_events, ceil(n_bins / 8))
+            if packed (see citest.pack_columns).
+        list: event definitions of the matrix columns,
+            without empty events, in the same order as l_evdef.
+    """
+    a_index = bin_index(dt_range, method, ci_bin_size, ci_bin_diff)
+    if method == "sequential":
+        load_dt_range = dt_range
+        load_binsize = ci_bin_size
+    elif method == "slide":
+        load_dt_range = (dt_range[0],
+                         max(dt_range[1],
+                             dt_range[1] + (ci_bin_size - ci_bin_diff)))
+        load_binsize = None
+    elif method == "radius":
+        load_dt_range = (min(dt_range[0],
+                             dt_range[0] - 0.5 * (ci_bin_size - ci_bin_diff)),
+                         max(dt_range[1],
+                             dt_range[1] + 0.5 * (ci_bin_size - ci_bin_diff)))
+        load_binsize = None
+    else:
+        raise NotImplementedError
+
+    if binarize:
+        dtype = np.int64
+    else:
+        dtype = float
+    packed = packed and binarize
+    if packed:
+        # columns are filled in a buffer, and packed one by one
+        matrix = np.zeros((len(l_evdef), (a_index.size + 7) // 8),
+                          dtype=np.uint8)
+        buf = np.zeros(a_index.size, dtype=dtype)
+    else:
+        matrix = np.zeros((a_index.size, len(l_evdef)), dtype=dtype)
+        buf = None
+    a_nonempty = np.zeros(len(l_evdef), dtype=bool)
+
+    def _column(idx):
+        if packed:
+            buf[:] = 0
+            return buf
+        else:
+            return matrix[:, idx]
+
+    def _store(idx, column):
+        if packed:
+            matrix[idx] = np.packbits(column > 0)
+        if idx in d_key:
+            if a_nonempty[idx]:
+                cache.put(d_key[idx], dt_range, column.copy())
+            else:
+                cache.put(d_key[idx], dt_range, None)
+
+    d_measure = {}
+    d_key = {}
+    for idx, evdef in enumerate(l_evdef):
+        measure, tags = evdef.series()
+        if cache is not None:
+            key = cache.key(src, measure, tags, dt_range, method,
+                            ci_bin_size, ci_bin_diff, binarize)
+            hit, array = cache.get(key, dt_range)
+            if hit:
+                metrics.incr("source.cache_hits")
+                if array is not None:
+                    if packed:
+                        matrix[idx] = np.packbits(array > 0)
+                    else:
+                        matrix[:, idx] = array
+                    a_nonempty[idx] = True
+                continue
+            d_key[idx] = key
+        d_measure.setdefault(measure, []).append((idx, tags))
+    l_query = []
+    for measure, l_item in d_measure.items():
+        l_host = sorted({tags["host"] for _, tags in l_item})
+        for top_host in range(0, len(l_host), batch_hosts):
+            s_host = set(l_host[top_host:top_host + batch_hosts])
+            l_chunk = [(idx, tags) for idx, tags in l_item
+                       if tags["host"] in s_host]
+            l_query.append((measure, l_chunk))
+
+    def _load(query):
+        measure, l_chunk = query
+        with metrics.timer("source.query"):
+            return el.load_group(measure, [tags for _, tags in l_chunk],
+                                 load_dt_range, binsize=load_binsize)
+
+    if n_workers > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(max_workers=n_workers)
+        iterobj = executor.map(_load, l_query)
+    else:
+        executor = None
+        iterobj = map(_load, l_query)
+    for (_, l_chunk), d_data in zip(l_query, iterobj):
+        for idx, tags in l_chunk:
+            key = (tags["host"], tags["key"])
+            if key not in d_data:
+                if idx in d_key:
+                    cache.put(d_key[idx], dt_range, None)
+                continue
+            a_ts, a_values = d_data[key]
+            column = _column(idx)
+            with metrics.timer("discretize"):
+                a_nonempty[idx] = _fill_column(
+                    column, a_index, a_ts, a_values[:, 0],
+                    dt_range, ci_bin_size, ci_bin_diff, method, binarize)
+                _store(idx, column)
+    if executor is not None:
+        executor.shutdown()
+    metrics.incr("source.series", sum(len(l_chunk) for _, l_chunk in l_query))
+
+    l_evdef_nonempty = [evdef for evdef, flag in zip(l_evdef, a_nonempty)
+                        if flag]
+    if packed:
+        return a_index, matrix[a_nonempty], l_evdef_nonempty
+    return a_index, matrix[:, a_nonempty], l_evdef_nonempty
+
+
+def _fill_column(column, a_index, a_ts, a_values, dt_range,
+                 ci_bin_size, ci_bin_diff, method, binarize):
+    """Write a series into a column of the matrix.
+    Returns False if the series is regarded as empty in load_event."""
+    if method == "sequential":
+        binsize = dtutil.td2us(ci_bin_size)
+        a_row = (a_ts - a_index[0]) // binsize
+        mask = (a_row >= 0) & (a_row < a_index.size)
+        column[a_row[mask]] = a_values[mask]
+        if column.sum() == 0:
+            return False
+        if binarize:
+            column[column > 0] = 1
+    elif method == "slide":
+        column[:] = dtutil.discretize_slide(a_ts, dt_range, ci_bin_diff,
+                                            ci_bin_size, binarize,
+                                            l_dt_values=a_values)
+    elif method == "radius":
+        column[:] = dtutil.discretize_radius(a_ts, dt_range, ci_bin_diff,
+                                             0.5 * ci_bin_size, binarize,
+                                             l_dt_values=a_values)
+    else:
+        raise NotImplementedError
+    return a_ts.size > 0
 
 
 def load_event_all(sources, conf, dt_range, area, binarize):
+    if conf.getint("dag", "load_workers") > 1:
+        # overlap queries of all sources
+        l_src_el = [(src, init_evloader(conf, src)) for src in sources]
+        for evdef, df in _iter_load_event(conf, l_src_el,
+                                          dt_range, area, binarize):
+            yield evdef, df
+        return
+
     for src in sources:
         if src == SRCCLS_LOG:
             for evdef, df in load_event_log_all(conf, dt_range, area, binarize):
@@ -258,7 +612,214 @@ def load_event_all(sources, conf, dt_range, area, binarize):
             raise NotImplementedError
 
 
-def makeinput(conf, dt_range, area, binarize):
+class SlidingWindowInput(object):
+    """Incremental input builder for overlapping time windows of an area
+    (i.e., unit_diff < unit_term) given in time order.
+
+    The bin matrix of the previous window is kept, and the bins
+    in the overlapping interval are reused for the next window.
+    Only the trailing interval after them is loaded from the sources.
+    Events without data in the window are retired from the columns,
+    and events appearing in the new interval are added.
+    The results are same as those of makeinput with load_batch.
+
+    The bin matrix is kept in int64 (or float) to be reused,
+    so it is bit-packed only after the update with input_format packed.
+
+    Windows not overlapping the previous one (or not aligned on its bins)
+    are loaded entirely. ci_bin_method radius is not supported
+    (always loaded entirely), because the bins on the head of
+    a window depend on the window.
+    """
+
+    def __init__(self, conf, area, binarize):
+        self._conf = conf
+        self._area = area
+        self._binarize = binarize
+        self._method = conf.get("dag", "ci_bin_method")
+        self._ci_bin_size = config.getdur(conf, "dag", "ci_bin_size")
+        self._ci_bin_diff = config.getdur(conf, "dag", "ci_bin_diff")
+        self._batch = conf.getboolean("dag", "load_batch")
+        self._batch_hosts = conf.getint("dag", "load_batch_hosts")
+        self._n_workers = conf.getint("dag", "load_workers")
+        self._d_el = {src: init_evloader(conf, src)
+                      for src in config.getlist(conf, "dag", "source")}
+        if binarize:
+            self._dtype = np.int64
+        else:
+            self._dtype = float
+
+        # state of the previous window
+        self._dt_range = None
+        self._a_index = None
+        self._matrix = None
+        self._d_column = {}
+
+    @staticmethod
+    def _evdef_key(src, evdef):
+        measure, tags = evdef.series()
+        return src, measure, tuple(sorted(tags.items()))
+
+    def _reusable(self, dt_range, a_index):
+        """Returns:
+            int: row of the previous matrix corresponding to
+                the first bin of the window.
+            int: number of bins reusable from the previous matrix.
+        """
+        if self._a_index is None or self._method == "radius":
+            return 0, 0
+        top = dtutil.dt2us(dt_range[0])
+        old_top = dtutil.dt2us(self._dt_range[0])
+        old_end = dtutil.dt2us(self._dt_range[1])
+        if not old_top <= top < old_end or a_index[0] != top:
+            # not overlapping, or head bin not aligned on the window
+            return 0, 0
+        row = np.searchsorted(self._a_index, top)
+        if row >= self._a_index.size or self._a_index[row] != top:
+            return 0, 0
+        # bins on the end of the previous window are incomplete
+        # (clipped at the end of the window)
+        a_old = self._a_index[row:]
+        a_old = a_old[a_old + dtutil.td2us(self._ci_bin_size) <= old_end]
+        # load at least 1 bin, to test if the events have data
+        # after the end of the window (see load_event)
+        n_reuse = min(a_old.size, a_index.size - 1)
+        if not np.array_equal(a_old[:n_reuse], a_index[:n_reuse]):
+            return 0, 0
+        tail_range = (self._tail_top(dt_range, a_index, n_reuse),
+                      dt_range[1])
+        a_tail = bin_index(tail_range, self._method,
+                           self._ci_bin_size, self._ci_bin_diff)
+        if not np.array_equal(a_tail, a_index[n_reuse:]):
+            return 0, 0
+        return row, n_reuse
+
+    @staticmethod
+    def _tail_top(dt_range, a_index, n_reuse):
+        if n_reuse == 0:
+            return dt_range[0]
+        usec = int(a_index[n_reuse] - dtutil.dt2us(dt_range[0]))
+        return dt_range[0] + datetime.timedelta(microseconds=usec)
+
+    def _load(self, src, l_evdef, dt_range, n_bins):
+        """Load events in dt_range into a matrix
+        (including empty columns).
+
+        Returns:
+            np.ndarray: data matrix in shape (n_bins, len(l_evdef)).
+            np.ndarray: bool array, True for the events not empty
+                in the sense of load_event.
+        """
+        el = self._d_el[src]
+        matrix = np.zeros((n_bins, len(l_evdef)), dtype=self._dtype)
+        a_nonempty = np.zeros(len(l_evdef), dtype=bool)
+        if self._batch:
+            _, tmp_matrix, l_evdef_nonempty = load_event_batch(
+                l_evdef, dt_range, self._ci_bin_size, self._ci_bin_diff,
+                self._method, self._binarize, el, self._batch_hosts,
+                self._n_workers, src=src)
+            d_col = {id(evdef): col for col, evdef in enumerate(l_evdef)}
+            cols = [d_col[id(evdef)] for evdef in l_evdef_nonempty]
+            matrix[:, cols] = tmp_matrix
+            a_nonempty[cols] = True
+            return matrix, a_nonempty
+
+        def _load_event(evdef):
+            measure, tags = evdef.series()
+            return load_event(measure, tags, dt_range, self._ci_bin_size,
+                              self._ci_bin_diff, self._method,
+                              self._binarize, el)
+
+        if self._n_workers > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=self._n_workers) as executor:
+                l_df = list(executor.map(_load_event, l_evdef))
+        else:
+            l_df = [_load_event(evdef) for evdef in l_evdef]
+        for col, df in enumerate(l_df):
+            if df is not None:
+                matrix[:, col] = df.values[:, 0]
+                a_nonempty[col] = True
+        return matrix, a_nonempty
+
+    def update(self, dt_range):
+        """Make input of the next window.
+
+        Returns:
+            np.ndarray: bins in int64 epoch microseconds.
+            np.ndarray: data matrix in shape (n_bins, n_events).
+            list: event definitions of the matrix columns,
+                in the same order as makeinput.
+        """
+        a_index = bin_index(dt_range, self._method,
+                            self._ci_bin_size, self._ci_bin_diff)
+        row, n_reuse = self._reusable(dt_range, a_index)
+        tail_range = (self._tail_top(dt_range, a_index, n_reuse),
+                      dt_range[1])
+        _logger.debug("incremental input of {0}: reuse {1} bins, "
+                      "load {2} bins".format(dt_range, n_reuse,
+                                             a_index.size - n_reuse))
+        metrics.incr("input.bins_reused", n_reuse)
+        metrics.incr("input.bins_loaded", a_index.size - n_reuse)
+
+        l_matrix = []
+        l_key = []
+        l_evdef = []
+        for src in self._d_el:
+            l_src_evdef = list(iter_evdef(self._conf, src, self._d_el[src],
+                                          dt_range, self._area))
+            l_src_key = [self._evdef_key(src, evdef)
+                         for evdef in l_src_evdef]
+            matrix = np.zeros((a_index.size, len(l_src_evdef)),
+                              dtype=self._dtype)
+            if n_reuse > 0:
+                # events not in the previous matrix are empty in the head
+                l_pair = [(col, self._d_column[key])
+                          for col, key in enumerate(l_src_key)
+                          if key in self._d_column]
+                if len(l_pair) > 0:
+                    cols, old_cols = zip(*l_pair)
+                    matrix[:n_reuse, list(cols)] = self._matrix[
+                        row:row + n_reuse][:, list(old_cols)]
+            matrix[n_reuse:], a_nonempty = self._load(
+                src, l_src_evdef, tail_range, a_index.size - n_reuse)
+            # reused bins cover the data from the head of the window
+            # to the head of tail_range
+            a_nonempty |= matrix[:n_reuse].any(axis=0)
+            l_matrix.append(matrix[:, a_nonempty])
+            l_key += [key for key, flag in zip(l_src_key, a_nonempty)
+                      if flag]
+            l_evdef += [evdef for evdef, flag in zip(l_src_evdef, a_nonempty)
+                        if flag]
+        with metrics.timer("concat"):
+            if len(l_matrix) > 0:
+                matrix = np.hstack(l_matrix)
+            else:
+                matrix = np.zeros((a_index.size, 0), dtype=self._dtype)
+
+        self._dt_range = dt_range
+        self._a_index = a_index
+        self._matrix = matrix
+        self._d_column = {key: col for col, key in enumerate(l_key)}
+        return a_index, matrix, l_evdef
+
+
+# incremental input builders in a process, see _makeinput_incremental
+_window_inputs = {}
+
+
+def makeinput(conf, dt_range, area, binarize, packed=False):
+    """If packed, the input is given as citest.BitMatrix
+    instead of pandas.DataFrame (available only if binarize)."""
+    if conf.getboolean("dag", "input_incremental"):
+        return _makeinput_incremental(conf, dt_range, area, binarize,
+                                      packed and binarize)
+    if conf.getboolean("dag", "load_batch"):
+        return _makeinput_batch(conf, dt_range, area, binarize,
+                                packed and binarize)
+    if packed and binarize:
+        return _makeinput_packed(conf, dt_range, area)
+
     evmap = EventDefinitionMap()
     evlist = []
     sources = config.getlist(conf, "dag", "source")
@@ -269,10 +830,113 @@ def makeinput(conf, dt_range, area, binarize):
         msg = "loaded event {0} {1} (sum: {2})".format(eid, evmap.evdef(eid),
                                                        df[eid].sum())
         _logger.debug(msg)
-    input_df = pd.concat(evlist, axis=1)
+    with metrics.timer("concat"):
+        input_df = pd.concat(evlist, axis=1)
     return input_df, evmap
 
 
+def _makeinput_packed(conf, dt_range, area):
+    from .citest import BitMatrix
+
+    evmap = EventDefinitionMap()
+    index = None
+    l_bits = []
+    sources = config.getlist(conf, "dag", "source")
+    for evdef, df in load_event_all(sources, conf, dt_range, area, True):
+        if index is None:
+            index = df.index
+        elif not df.index.equals(index):
+            df = df.reindex(index, fill_value=0)
+        eid = evmap.add_evdef(evdef)
+        # pack each event on loading, not to keep int64 columns
+        a_bin = df.values[:, 0] > 0
+        l_bits.append(np.packbits(a_bin))
+        msg = "loaded event {0} {1} (sum: {2})".format(
+            eid, evmap.evdef(eid), np.count_nonzero(a_bin))
+        _logger.debug(msg)
+    if index is None:
+        bits = np.zeros((0, 0), dtype=np.uint8)
+        n_samples = 0
+    else:
+        with metrics.timer("concat"):
+            bits = np.vstack(l_bits)
+        n_samples = len(index)
+    input_data = BitMatrix(bits, n_samples, columns=evmap.eids(),
+                           index=index)
+    return input_data, evmap
+
+
+def _makeinput_batch(conf, dt_range, area, binarize, packed):
+    method = conf.get("dag", "ci_bin_method")
+    ci_bin_size = config.getdur(conf, "dag", "ci_bin_size")
+    ci_bin_diff = config.getdur(conf, "dag", "ci_bin_diff")
+    batch_hosts = conf.getint("dag", "load_batch_hosts")
+    n_workers = conf.getint("dag", "load_workers")
+    from . import inputcache
+    cache = inputcache.init_series_cache(conf)
+
+    evmap = EventDefinitionMap()
+    a_index = None
+    l_matrix = []
+    sources = config.getlist(conf, "dag", "source")
+    for src in sources:
+        el = init_evloader(conf, src)
+        l_evdef = list(iter_evdef(conf, src, el, dt_range, area))
+        a_index, matrix, l_evdef = load_event_batch(
+            l_evdef, dt_range, ci_bin_size, ci_bin_diff,
+            method, binarize, el, batch_hosts, n_workers,
+            cache=cache, src=src, packed=packed)
+        if packed:
+            from .citest import popcount
+            # bit-packed columns in rows
+            l_sum = popcount(matrix)
+        else:
+            l_sum = matrix.sum(axis=0)
+        for evdef, val in zip(l_evdef, l_sum):
+            eid = evmap.add_evdef(evdef)
+            msg = "loaded event {0} {1} (sum: {2})".format(
+                eid, evmap.evdef(eid), val)
+            _logger.debug(msg)
+        l_matrix.append(matrix)
+    if packed:
+        from .citest import BitMatrix
+        with metrics.timer("concat"):
+            bits = np.vstack(l_matrix)
+            dtindex = us2dtindex(a_index)
+        return BitMatrix(bits, a_index.size, columns=evmap.eids(),
+                         index=dtindex), evmap
+    with metrics.timer("concat"):
+        matrix = np.hstack(l_matrix)
+    return _matrix2input(a_index, matrix, evmap, packed), evmap
+
+
+def _makeinput_incremental(conf, dt_range, area, binarize, packed):
+    key = (area, binarize)
+    if key not in _window_inputs:
+        _window_inputs[key] = SlidingWindowInput(conf, area, binarize)
+    a_index, matrix, l_evdef = _window_inputs[key].update(dt_range)
+
+    evmap = EventDefinitionMap()
+    for evdef, column in zip(l_evdef, matrix.T):
+        eid = evmap.add_evdef(evdef)
+        msg = "loaded event {0} {1} (sum: {2})".format(
+            eid, evmap.evdef(eid), column.sum())
+        _logger.debug(msg)
+    return _matrix2input(a_index, matrix, evmap, packed), evmap
+
+
+def _matrix2input(a_index, matrix, evmap, packed):
+    with metrics.timer("concat"):
+        dtindex = us2dtindex(a_index)
+        if packed:
+            from .citest import BitMatrix, pack_columns
+            return BitMatrix(pack_columns(matrix), matrix.shape[0],
+                             columns=evmap.eids(), index=dtindex)
+        else:
+            return pd.DataFrame(matrix, index=dtindex,
+                                columns=list(evmap.eids()))
+
+
 def evdef_instruction(conf, evdef, d_el=None):
     if d_el is None:
         d_el = init_evloaders(conf)
@@ -6,14 +6,48 @@ from itertools import combinations
 
 from . import arguments
 from . import log2event
+from . import metrics
 from . import pc_input
 from . import showdag
 from amulog import common
+from amulog import config
 
 _logger = logging.getLogger(__package__)
 
+# CI test cache shared by jobs in a process
+_ci_cache = None
 
-def makedag_main(args):
+
+def makedag_main(args, reuse_input=False):
+    """Estimate a DAG of a job.
+    Metrics of the job stages are passed to [dag] metrics_sink.
+
+    Args:
+        args (tuple): job arguments (conf, dt_range, area).
+        reuse_input (bool, optional): If True, reuse the input
+            materialized in the job directory in a former run
+            (if not stale), instead of loading events.
+    """
+    conf = args[0]
+    l_sink = metrics.init_sinks(conf)
+    if len(l_sink) == 0:
+        return _makedag_main(args, reuse_input)
+
+    status = "failed"
+    with metrics.collect() as job_metrics:
+        try:
+            with metrics.timer("job"):
+                ldag = _makedag_main(args, reuse_input)
+            if ldag.graph.graph.get("truncated", False):
+                status = "truncated"
+            else:
+                status = "done"
+        finally:
+            metrics.emit(conf, args, job_metrics, l_sink, status=status)
+    return ldag
+
+
+def _makedag_main(args, reuse_input=False):
     jobname = arguments.args2name(args)
     conf, dt_range, area = args
 
@@ -22,35 +56,75 @@ def makedag_main(args):
 
     ci_func = conf.get("dag", "ci_func")
     binarize = is_binarize(ci_func)
-    # generate event set and evmap, and apply preprocessing
-    # d_input, evmap = log2event.ts2input(conf, dt_range, area, binarize)
-    input_df, evmap = log2event.makeinput(conf, dt_range, area, binarize)
+    packed = is_packed(conf, binarize)
+    input_df = None
+    if reuse_input:
+        from . import inputcache
+        with metrics.timer("input.reuse"):
+            input_df, evmap = inputcache.load_input(conf, args,
+                                                    binarize, packed)
+        if input_df is None:
+            _logger.info("{0} no reusable input, load events".format(jobname))
+    if input_df is None:
+        # generate event set and evmap, and apply preprocessing
+        # d_input, evmap = log2event.ts2input(conf, dt_range, area, binarize)
+        with metrics.timer("input"):
+            input_df, evmap = log2event.makeinput(conf, dt_range, area,
+                                                  binarize, packed=packed)
+        evmap.dump(conf, args)
+        if reuse_input or conf.getboolean("dag", "input_persist"):
+            from . import inputcache
+            with metrics.timer("input.persist"):
+                inputcache.dump_input(conf, args, input_df, binarize, packed)
     _logger.info("{0} pc input shape: {1}".format(jobname, input_df.shape))
-    evmap.dump(conf, args)
+    metrics.incr("input.samples", input_df.shape[0])
+    metrics.incr("input.nodes", input_df.shape[1])
     timer.lap("load-nodes")
 
     node_ids = evmap.eids()
-    g = _complete_graph(node_ids)
-    if conf.getboolean("pc_prune", "do_pruning"):
-        from . import prune
-        n_edges_before = g.number_of_edges()
-        init_graph = prune.prune_graph(g, conf, evmap)
-        n_edges_after = init_graph.number_of_edges()
-        _logger.info("{0} DAG edge pruning: ".format(jobname) + \
-                     "{0} -> {1}".format(n_edges_before, n_edges_after))
-    else:
-        n_edges = g.number_of_edges()
-        init_graph = g
-        _logger.info("{0} DAG edge candidates: ".format(jobname) + \
-                     "{0}".format(n_edges))
+    n_edges_before = len(node_ids) * (len(node_ids) - 1) // 2
+    with metrics.timer("prune"):
+        if conf.getboolean("pc_prune", "do_pruning"):
+            from . import prune
+            init_graph = prune.pruned_graph(conf, evmap)
+            n_edges_after = init_graph.number_of_edges()
+            _logger.info("{0} DAG edge pruning: ".format(jobname) + \
+                         "{0} -> {1}".format(n_edges_before, n_edges_after))
+        else:
+            init_graph = _complete_graph(node_ids)
+            n_edges_after = init_graph.number_of_edges()
+            _logger.info("{0} DAG edge candidates: ".format(jobname) + \
+                         "{0}".format(n_edges_after))
+    metrics.incr("prune.edges_before", n_edges_before)
+    metrics.incr("prune.edges_after", n_edges_after)
     timer.lap("prune-dag")
 
-    graph = estimate_dag(conf, input_df, ci_func, init_graph)
+    l_sweep = config.getlist(conf, "dag", "skeleton_threshold_sweep")
+    with metrics.timer("estimate"):
+        if len(l_sweep) == 0:
+            graph = estimate_dag(conf, input_df, ci_func, init_graph,
+                                 evmap=evmap, args=args)
+        else:
+            skel_th = conf.getfloat("dag", "skeleton_threshold")
+            l_th = [float(th) for th in l_sweep] + [skel_th]
+            d_graph = estimate_dag_sweep(conf, input_df, ci_func, l_th,
+                                         init_graph, evmap=evmap, args=args)
+            graph = d_graph[skel_th]
+            for th in l_sweep:
+                showdag.LogDAG(args, d_graph[float(th)]).dump(
+                    name="dag_" + th)
     timer.lap("estimate-dag")
+    if graph.graph.get("truncated", False):
+        _logger.warning("{0} DAG is truncated at skeleton depth {1} "
+                        "by the budget".format(
+            jobname, graph.graph["completed_depth"]))
+
+    metrics.incr("dag.edges", graph.number_of_edges())
 
     # record dag
     ldag = showdag.LogDAG(args, graph)
-    ldag.dump()
+    with metrics.timer("dump"):
+        ldag.dump()
     timer.stop()
     return ldag
 
@@ -66,17 +140,16 @@ def makedag_prune_test(args):
     evmap.dump(conf, args)
 
     node_ids = evmap.eids()
-    g = _complete_graph(node_ids)
     if conf.getboolean("pc_prune", "do_pruning"):
         from . import prune
-        n_edges_before = g.number_of_edges()
-        init_graph = prune.prune_graph(g, conf, evmap)
+        n_edges_before = len(node_ids) * (len(node_ids) - 1) // 2
+        init_graph = prune.pruned_graph(conf, evmap)
         n_edges_after = init_graph.number_of_edges()
         _logger.info("{0} DAG edge pruning: ".format(jobname) + \
                      "{0} -> {1}".format(n_edges_before, n_edges_after))
     else:
-        n_edges = g.number_of_edges()
-        init_graph = g
+        init_graph = _complete_graph(node_ids)
+        n_edges = init_graph.number_of_edges()
         _logger.info("{0} DAG edge candidates: ".format(jobname) + \
                      "{0}".format(n_edges))
 
@@ -86,21 +159,30 @@ def makedag_prune_test(args):
     return ldag
 
 
-def estimate_dag(conf, input_df, ci_func, init_graph=None):
+def estimate_dag(conf, input_df, ci_func, init_graph=None,
+                 evmap=None, args=None):
     if input_df.shape[1] >= 2:
         cause_algorithm = conf.get("dag", "cause_algorithm")
         if cause_algorithm == "pc":
             # apply pc algorithm to estimate dag
-            skel_method = conf.get("dag", "skeleton_method")
             skel_th = conf.getfloat("dag", "skeleton_threshold")
-            skel_depth = conf.getint("dag", "skeleton_depth")
-            skel_verbose = conf.getboolean("dag", "skeleton_verbose")
-            return pc_input.pc(input_df, skel_th, ci_func, skel_method,
-                               skel_depth, skel_verbose, init_graph)
+            ci = init_cached_citest(conf, input_df, ci_func, evmap, args)
+            if ci is not None:
+                n_hits, n_misses = _ci_cache.hits, _ci_cache.misses
+            graph = _estimate_pc(conf, input_df, ci_func, skel_th,
+                                 init_graph, ci)
+            if ci is not None:
+                metrics.incr("ci_cache.hits", _ci_cache.hits - n_hits)
+                metrics.incr("ci_cache.misses", _ci_cache.misses - n_misses)
+                dump_ci_cache(conf, ci, args)
+            return graph
         elif cause_algorithm == "lingam":
             if init_graph is not None:
                 _logger.warning("init_graph not used in lingam")
             from . import lingam_input
+            if hasattr(input_df, "to_dataframe"):
+                # citest.BitMatrix
+                input_df = input_df.to_dataframe()
             return lingam_input.estimate(input_df)
     else:
         _logger.info("input too small({0} nodes), return empty dag".format(
@@ -108,13 +190,124 @@ def estimate_dag(conf, input_df, ci_func, init_graph=None):
         return showdag.empty_dag()
 
 
+def estimate_dag_sweep(conf, input_df, ci_func, l_threshold,
+                       init_graph=None, evmap=None, args=None):
+    """Estimate DAGs with multiple skeleton thresholds.
+    P-values of all CI tests are recorded in the run with the loosest
+    (largest) threshold, and reused in the runs with stricter thresholds.
+    Only the CI tests not recorded are newly calculated.
+
+    Returns:
+        dict: key is threshold (float), value is estimated DAG.
+    """
+    if input_df.shape[1] < 2 or \
+            not conf.get("dag", "cause_algorithm") == "pc":
+        graph = estimate_dag(conf, input_df, ci_func, init_graph,
+                             evmap=evmap, args=args)
+        return {th: graph for th in l_threshold}
+
+    from . import citest
+    ci = init_cached_citest(conf, input_df, ci_func, evmap, args)
+    if ci is None:
+        ci = pc_input.init_citest(input_df, ci_func)
+    if evmap is None:
+        node_keys = [str(col) for col in input_df.columns]
+    else:
+        node_keys = [str(evmap.evdef(eid)) for eid in input_df.columns]
+    record = citest.CITestCache(None)
+    ci_record = citest.CachedCITest(ci, record, ci_func,
+                                    node_keys, input_df)
+
+    d_graph = {}
+    for th in sorted(set(l_threshold), reverse=True):
+        n_hits, n_misses = record.hits, record.misses
+        if init_graph is None:
+            tmp_init_graph = None
+        else:
+            # pcalg removes edges of init_graph in place
+            tmp_init_graph = init_graph.copy()
+        d_graph[th] = _estimate_pc(conf, input_df, ci_func, th,
+                                   tmp_init_graph, ci_record)
+        _logger.info("threshold {0}: {1} CI tests reused, "
+                     "{2} calculated".format(th, record.hits - n_hits,
+                                             record.misses - n_misses))
+    if isinstance(ci, citest.CachedCITest):
+        dump_ci_cache(conf, ci, args)
+    return d_graph
+
+
+def _estimate_pc(conf, input_df, ci_func, threshold, init_graph, ci=None):
+    skel_method = conf.get("dag", "skeleton_method")
+    skel_depth = conf.getint("dag", "skeleton_depth")
+    skel_verbose = conf.getboolean("dag", "skeleton_verbose")
+    skel_engine = conf.get("dag", "skeleton_engine")
+    skel_workers = conf.getint("dag", "skeleton_workers")
+    time_limit = config.getdur(conf, "dag", "skeleton_time_limit")
+    if time_limit is not None:
+        time_limit = time_limit.total_seconds()
+    max_tests = conf.getint("dag", "skeleton_max_tests")
+    if max_tests < 0:
+        max_tests = None
+    return pc_input.pc(input_df, threshold, ci_func, skel_method,
+                       skel_depth, skel_verbose, init_graph,
+                       engine=skel_engine, n_workers=skel_workers, ci=ci,
+                       time_limit=time_limit, max_tests=max_tests)
+
+
+def init_cached_citest(conf, input_df, ci_func, evmap, args=None):
+    """Return citest.CachedCITest if ci_cache is enabled, otherwise None."""
+    global _ci_cache
+    cache_size = conf.getint("dag", "ci_cache_size")
+    if cache_size <= 0 or evmap is None:
+        return None
+    if ci_func == "gsq_rlib":
+        _logger.warning("ci_cache not available with gsq_rlib")
+        return None
+
+    from . import citest
+    if _ci_cache is None:
+        _ci_cache = citest.CITestCache(cache_size)
+    if args is not None and conf.getboolean("dag", "ci_cache_persist"):
+        import os
+        fp = arguments.ArgumentManager.citest_cache_path(conf, args)
+        if os.path.exists(fp):
+            n_loaded = _ci_cache.load(fp)
+            _logger.info("loaded {0} CI test results from {1}".format(
+                n_loaded, fp))
+    node_keys = [str(evmap.evdef(eid)) for eid in input_df.columns]
+    ci = pc_input.init_citest(input_df, ci_func)
+    return citest.CachedCITest(ci, _ci_cache, ci_func,
+                               node_keys, input_df)
+
+
+def dump_ci_cache(conf, ci, args=None):
+    _logger.info("CI test cache: {0} hits, {1} misses".format(
+        _ci_cache.hits, _ci_cache.misses))
+    if args is not None and conf.getboolean("dag", "ci_cache_persist"):
+        fp = arguments.ArgumentManager.citest_cache_path(conf, args)
+        _ci_cache.dump(fp, keys=ci.used_keys)
+
+
+def is_packed(conf, binarize):
+    """Use bit-packed input (citest.BitMatrix) for binary ci_func."""
+    return binarize and conf.get("dag", "input_format") == "packed"
+
+
 def is_binarize(ci_func):
     if ci_func == "fisherz":
         return False
     elif ci_func == "fisherz_bin":
         return True
+    elif ci_func == "fisherz_batch":
+        return False
+    elif ci_func == "fisherz_bin_batch":
+        return True
     elif ci_func == "gsq":
         return True
+    elif ci_func == "gsq_batch":
+        return True
+    elif ci_func == "gsq_sparse":
+        return True
     elif ci_func == "gsq_rlib":
         return True
     else:
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Stage-level metrics of make-dag jobs.
+
+The stages in log2event, prune and pc_input record timers and counters
+into the metrics of the job in progress (see collect).
+The recording functions (timer, incr) do nothing outside of collect,
+so the stages can be used without metrics.
+
+The metrics of a job are passed to the sinks in [dag] metrics_sink
+(no sinks in default, i.e., metrics are not collected):
+json writes metrics.json in the job directory (aggregated by
+show-metrics), and log writes them to the logger.
+Other sinks can be added with register_sink.
+
+Timers of the stages run in threads (e.g., [dag] load_workers > 1)
+are summed over the threads, so they can be larger than the wall time.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+from amulog import common
+from amulog import config
+from . import arguments
+
+_logger = logging.getLogger(__package__)
+
+
+class Metrics(object):
+    """Timers and counters of a job."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key: name, value: [total seconds, count]
+        self.timers = {}
+        self.counters = {}
+
+    def add_time(self, name, sec):
+        with self._lock:
+            if name in self.timers:
+                self.timers[name][0] += sec
+                self.timers[name][1] += 1
+            else:
+                self.timers[name] = [sec, 1]
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def to_dict(self):
+        with self._lock:
+            return {"timers": {name: {"time": v[0], "count": v[1]}
+                               for name, v in self.timers.items()},
+                    "counters": dict(self.counters)}
+
+
+# metrics of the job in progress in this process, see collect
+_current = None
+
+
+def enabled():
+    return _current is not None
+
+
+@contextmanager
+def _null_timer():
+    yield
+
+
+def timer(name):
+    """Context manager to measure a stage in the job in progress."""
+    if _current is None:
+        return _null_timer()
+    return _current.timer(name)
+
+
+def add_time(name, sec):
+    if _current is not None:
+        _current.add_time(name, sec)
+
+
+def incr(name, n=1):
+    if _current is not None:
+        _current.incr(name, n)
+
+
+@contextmanager
+def collect():
+    """Record the metrics in the block into a new Metrics object."""
+    global _current
+    prev = _current
+    _current = Metrics()
+    try:
+        yield _current
+    finally:
+        _current = prev
+
+
+class JSONFileSink(object):
+    """Write metrics.json in the job directory."""
+
+    def emit(self, conf, args, d_metrics):
+        fp = arguments.ArgumentManager.metrics_path(conf, args)
+        tmp_fp = "{0}.{1}.tmp".format(fp, os.getpid())
+        with open(tmp_fp, "w") as f:
+            json.dump(d_metrics, f, indent=1)
+        os.replace(tmp_fp, fp)
+
+
+class LogSink(object):
+    """Write metrics to the logger in INFO level."""
+
+    def emit(self, conf, args, d_metrics):
+        _logger.info("makedag job({0}) metrics:\n{1}".format(
+            d_metrics["job"], format_table([d_metrics])))
+
+
+SINKS = {"json": JSONFileSink,
+         "log": LogSink}
+
+
+def register_sink(name, sink_class):
+    """Add a sink available in [dag] metrics_sink. sink_class is
+    a class with emit(conf, args, d_metrics), initialized without args."""
+    SINKS[name] = sink_class
+
+
+def init_sinks(conf):
+    l_sink = []
+    for name in config.getlist(conf, "dag", "metrics_sink"):
+        if name not in SINKS:
+            raise ValueError("metrics_sink invalid ({0})".format(name))
+        l_sink.append(SINKS[name]())
+    return l_sink
+
+
+def emit(conf, args, metrics, l_sink, **kwargs):
+    """Pass the metrics of a job to the sinks.
+    kwargs are added to the output (e.g., status)."""
+    d_metrics = {"job": arguments.args2name(args)}
+    d_metrics.update(kwargs)
+    d_metrics.update(metrics.to_dict())
+    for sink in l_sink:
+        try:
+            sink.emit(conf, args, d_metrics)
+        except Exception:
+            # metrics should not fail the job
+            _logger.warning("failed to emit metrics of job({0})".format(
+                d_metrics["job"]), exc_info=True)
+
+
+def load_metrics(conf, args):
+    """Load metrics.json of a job, or None if not available."""
+    fp = arguments.ArgumentManager.metrics_path(conf, args)
+    if not os.path.exists(fp):
+        return None
+    with open(fp, "r") as f:
+        return json.load(f)
+
+
+def _names(l_metrics, key):
+    # in the order of the first appearance, i.e., roughly the stage order
+    d = {}
+    for d_metrics in l_metrics:
+        for name in d_metrics[key]:
+            d[name] = None
+    return list(d)
+
+
+def format_table(l_metrics):
+    """Table of timers and counters aggregated over jobs:
+    total, mean and max among the jobs, and the job with the max."""
+    table = [["name", "total", "mean", "max", "max_job", "calls"]]
+    for name in _names(l_metrics, "timers"):
+        l_item = [(d["timers"][name], d["job"]) for d in l_metrics
+                  if name in d["timers"]]
+        l_time = [item["time"] for item, _ in l_item]
+        max_item, max_job = max(l_item, key=lambda x: x[0]["time"])
+        table.append([name + " (s)",
+                      "{0:.3f}".format(sum(l_time)),
+                      "{0:.3f}".format(sum(l_time) / len(l_time)),
+                      "{0:.3f}".format(max_item["time"]), max_job,
+                      str(sum(item["count"] for item, _ in l_item))])
+    for name in _names(l_metrics, "counters"):
+        l_item = [(d["counters"][name], d["job"]) for d in l_metrics
+                  if name in d["counters"]]
+        l_val = [val for val, _ in l_item]
+        max_val, max_job = max(l_item, key=lambda x: x[0])
+        table.append([name, str(sum(l_val)),
+                      "{0:.1f}".format(sum(l_val) / len(l_val)),
+                      str(max_val), max_job, ""])
+    return common.cli_table(table)
+
+
+def report(conf, am):
+    """Aggregate report of metrics.json of the jobs in the args file."""
+    l_metrics = []
+    n_missing = 0
+    for args in am:
+        d_metrics = load_metrics(conf, args)
+        if d_metrics is None:
+            n_missing += 1
+        else:
+            l_metrics.append(d_metrics)
+    if len(l_metrics) == 0:
+        return "no job metrics found (see [dag] metrics_sink)"
+    buf = ["{0} jobs ({1} without metrics)".format(len(l_metrics),
+                                                    n_missing),
+           format_table(l_metrics)]
+    return "\n".join(buf)
@@ -5,21 +5,54 @@ import logging
 import numpy as np
 import networkx as nx
 
+from . import metrics
+
 _logger = logging.getLogger(__package__)
 
 
 def pc(data, threshold, mode="pylib", skel_method="default",
-       pc_depth=None, verbose=False, init_graph=None):
+       pc_depth=None, verbose=False, init_graph=None, engine="pcalg",
+       n_workers=1, ci=None, time_limit=None, max_tests=None):
+    """If ci (citest.CITest) is given, it is used instead of
+    the CI test of given mode.
+    time_limit and max_tests are available only with native engine."""
+    if engine == "native":
+        if ci is None:
+            ci = init_citest(data, mode)
+        return pc_native(data, threshold, ci, skel_method,
+                         pc_depth, verbose, init_graph, n_workers,
+                         time_limit, max_tests)
+    elif not engine == "pcalg":
+        raise ValueError("skeleton_engine invalid ({0})".format(engine))
+
+    if time_limit is not None or max_tests is not None:
+        _logger.warning("skeleton budget ignored with pcalg engine")
+    if ci is not None:
+        return pc_citest(data, threshold, ci, skel_method,
+                         pc_depth, verbose, init_graph)
+
     if mode == "gsq_rlib":
+        if hasattr(data, "to_dataframe"):
+            # citest.BitMatrix
+            data = data.to_dataframe()
         if init_graph is not None:
             _logger.warning("init_graph not used in gsq_rlib")
         graph = pc_rlib(data, threshold, skel_method, verbose)
     elif mode == "gsq":
         graph = pc_gsq(data, threshold, skel_method,
                        pc_depth, verbose, init_graph)
+    elif mode == "gsq_batch":
+        graph = pc_gsq_batch(data, threshold, skel_method,
+                             pc_depth, verbose, init_graph)
     elif mode in ("fisherz", "fisherz_bin"):
         graph = pc_fisherz(data, threshold, skel_method,
                            pc_depth, verbose, init_graph)
+    elif mode == "fisherz_batch":
+        graph = pc_fisherz_batch(data, threshold, skel_method,
+                                 pc_depth, verbose, init_graph)
+    elif mode in ("gsq_sparse", "fisherz_bin_batch"):
+        graph = pc_citest(data, threshold, init_citest(data, mode),
+                          skel_method, pc_depth, verbose, init_graph)
     else:
         raise ValueError("ci_func invalid ({0})".format(mode))
     return graph
@@ -27,7 +60,6 @@ def pc(data, threshold, mode="pylib", skel_method="default",
 
 def pc_gsq(data, threshold, skel_method, pc_depth=None,
            verbose=False, init_graph=None):
-    import pcalg
     from gsq.ci_tests import ci_test_bin
 
     args = {"indep_test_func": ci_test_bin,
@@ -39,19 +71,32 @@ def pc_gsq(data, threshold, skel_method, pc_depth=None,
         args["max_reach"] = pc_depth
     if init_graph is not None:
         args["init_graph"] = init_graph
-    (g, sep_set) = pcalg.estimate_skeleton(**args)
-    g = pcalg.estimate_cpdag(skel_graph=g, sep_set=sep_set)
-    return g
+    return _estimate_pcalg(args)
+
+
+def pc_gsq_batch(data, threshold, skel_method, pc_depth=None,
+                 verbose=False, init_graph=None):
+    from . import citest
+
+    args = {"indep_test_func": citest.GSquareBatch(data),
+            "data_matrix": data,
+            "alpha": threshold,
+            "method": skel_method,
+            "verbose": verbose}
+    if pc_depth is not None and pc_depth >= 0:
+        args["max_reach"] = pc_depth
+    if init_graph is not None:
+        args["init_graph"] = init_graph
+    return _estimate_pcalg(args)
 
 
 def pc_fisherz(data, threshold, skel_method, pc_depth=None,
                verbose=False, init_graph=None):
-    import pcalg
     # from ci_test.ci_tests import ci_test_gauss
     from citestfz.ci_tests import ci_test_gauss
 
     # dm = np.array([data for nid, data in sorted(data.items())]).transpose()
-    cm = np.corrcoef(data.T)
+    cm = np.corrcoef(data.values.T)
     args = {"indep_test_func": ci_test_gauss,
             "data_matrix": data.values,
             "corr_matrix": cm,
@@ -62,8 +107,119 @@ def pc_fisherz(data, threshold, skel_method, pc_depth=None,
         args["max_reach"] = pc_depth
     if init_graph is not None:
         args["init_graph"] = init_graph
-    (g, sep_set) = pcalg.estimate_skeleton(**args)
-    g = pcalg.estimate_cpdag(skel_graph=g, sep_set=sep_set)
+    return _estimate_pcalg(args)
+
+
+def pc_fisherz_batch(data, threshold, skel_method, pc_depth=None,
+                     verbose=False, init_graph=None):
+    from . import citest
+
+    args = {"indep_test_func": citest.FisherZBatch(data),
+            "data_matrix": data,
+            "alpha": threshold,
+            "method": skel_method,
+            "verbose": verbose}
+    if pc_depth is not None and pc_depth >= 0:
+        args["max_reach"] = pc_depth
+    if init_graph is not None:
+        args["init_graph"] = init_graph
+    return _estimate_pcalg(args)
+
+
+def pc_citest(data, threshold, ci, skel_method, pc_depth=None,
+              verbose=False, init_graph=None):
+    args = {"indep_test_func": ci,
+            "data_matrix": data,
+            "alpha": threshold,
+            "method": skel_method,
+            "verbose": verbose}
+    if pc_depth is not None and pc_depth >= 0:
+        args["max_reach"] = pc_depth
+    if init_graph is not None:
+        args["init_graph"] = init_graph
+    return _estimate_pcalg(args)
+
+
+def _estimate_pcalg(args):
+    import pcalg
+
+    if metrics.enabled():
+        args["indep_test_func"] = _counted_citest(args["indep_test_func"])
+    with metrics.timer("skeleton"):
+        (g, sep_set) = pcalg.estimate_skeleton(**args)
+    with metrics.timer("orientation"):
+        g = pcalg.estimate_cpdag(skel_graph=g, sep_set=sep_set)
+    return g
+
+
+def _counted_citest(func):
+    """Count CI tests by depth (size of the conditioning set)
+    in the indep_test_func of pcalg."""
+
+    def _func(data_matrix, x, y, s, **kwargs):
+        metrics.incr("skeleton.tests.depth{0}".format(len(s)))
+        return func(data_matrix, x, y, s, **kwargs)
+
+    return _func
+
+
+def init_citest(data, mode):
+    """Return citest.CITest object for given ci_func name."""
+    from . import citest
+    if mode == "gsq":
+        from gsq.ci_tests import ci_test_bin
+        return citest.FunctionCITest(ci_test_bin, data.values)
+    elif mode == "gsq_batch":
+        return citest.GSquareBatch(data)
+    elif mode == "gsq_sparse":
+        return citest.GSquareSparse(data)
+    elif mode in ("fisherz", "fisherz_bin"):
+        from citestfz.ci_tests import ci_test_gauss
+        cm = np.corrcoef(data.values.T)
+        return citest.FunctionCITest(ci_test_gauss, data.values,
+                                     corr_matrix=cm)
+    elif mode == "fisherz_batch":
+        return citest.FisherZBatch(data)
+    elif mode == "fisherz_bin_batch":
+        # correlation matrix from co-occurrence counts of binary data
+        stats = citest.SparseBinaryStats(data)
+        return citest.FisherZBatch(data,
+                                   corr_matrix=stats.corrcoef())
+    else:
+        raise ValueError("ci_func invalid for citest object "
+                         "({0})".format(mode))
+
+
+def pc_native(data, threshold, ci, skel_method, pc_depth=None,
+              verbose=False, init_graph=None, n_workers=1,
+              time_limit=None, max_tests=None):
+    """If the search exceeds time_limit (sec) or max_tests,
+    the DAG is estimated from the skeleton of completed depths,
+    and marked with graph attribute "truncated"."""
+    from . import pc_native as pcn
+
+    n_nodes = data.shape[1]
+    if init_graph is None:
+        init_adj = None
+    else:
+        init_adj = pcn.graph2adj(init_graph, n_nodes)
+    search = pcn.SkeletonSearch(ci, n_nodes, threshold, init_adj=init_adj,
+                                max_depth=pc_depth, method=skel_method,
+                                n_workers=n_workers, time_limit=time_limit,
+                                max_tests=max_tests)
+    with metrics.timer("skeleton"):
+        adj, sep_set = search.run()
+    if verbose:
+        _logger.info("skeleton tests by depth: {0}".format(search.n_tests))
+    for depth, (n_tests, sec) in enumerate(zip(search.n_tests,
+                                               search.depth_time)):
+        metrics.incr("skeleton.tests.depth{0}".format(depth), n_tests)
+        metrics.add_time("skeleton.depth{0}".format(depth), sec)
+    with metrics.timer("orientation"):
+        g = pcn.adj2digraph(pcn.estimate_cpdag(adj, sep_set))
+    if search.truncated:
+        g.graph["truncated"] = True
+        g.graph["completed_depth"] = search.depth - 1
     return g
 
 
@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""PC algorithm implemented on numpy adjacency matrices.
+
+The search follows the procedure (and the test order) of
+pcalg.estimate_skeleton and pcalg.estimate_cpdag, so it gives
+the same DAGs with the same CI tests. The skeleton is stored as
+a boolean adjacency matrix, and the CI tests are given as
+citest.CITest objects to evaluate multiple conditioning sets at once.
+"""
+
+import time
+import logging
+from itertools import combinations
+
+import numpy as np
+import networkx as nx
+
+_logger = logging.getLogger(__package__)
+
+# the number of conditioning sets given to a CI test object at once
+# starts with BATCH_MIN and is doubled up to BATCH_MAX for each edge
+BATCH_MIN = 4
+BATCH_MAX = 256
+
+
+def graph2adj(graph, n_nodes):
+    """Convert an undirected networkx graph with nodes 0 to n_nodes - 1
+    into a symmetric boolean adjacency matrix."""
+    if not graph.number_of_nodes() == n_nodes:
+        raise ValueError("init_graph not matching data_matrix shape")
+    adj = np.zeros((n_nodes, n_nodes), dtype=bool)
+    edges = np.array(list(graph.edges()), dtype=np.int64).reshape(-1, 2)
+    adj[edges[:, 0], edges[:, 1]] = True
+    adj[edges[:, 1], edges[:, 0]] = True
+    np.fill_diagonal(adj, False)
+    return adj
+
+
+def complete_adj(n_nodes):
+    adj = np.ones((n_nodes, n_nodes), dtype=bool)
+    np.fill_diagonal(adj, False)
+    return adj
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class Budget(object):
+    """Limit of wall time (seconds) and the number of CI tests
+    for a skeleton search. None means no limit."""
+
+    def __init__(self, time_limit=None, max_tests=None):
+        self.time_limit = time_limit
+        self.max_tests = max_tests
+        self.n_tests = 0
+        self._start = time.time()
+
+    def elapsed(self):
+        return time.time() - self._start
+
+    def consume(self, n_tests):
+        self.n_tests += n_tests
+        self.check()
+
+    def check(self):
+        if self.max_tests is not None and self.n_tests > self.max_tests:
+            raise BudgetExceeded("CI tests exceeded {0}".format(
+                self.max_tests))
+        if self.time_limit is not None and \
+                self.elapsed() > self.time_limit:
+            raise BudgetExceeded("wall time exceeded {0} sec".format(
+                self.time_limit))
+
+
+def search_sepset(citest, alpha, i, j, neighbors, depth, budget=None):
+    """Search a separating set of node i and j in the neighbors.
+
+    Returns:
+        tuple or None: the first separating set found, or None.
+        int: the number of CI tests done, counted in the same way as
+            sequential PC (i.e., the tests in a batch after the first
+            separating set are not counted).
+    """
+    n_tests = 0
+    iterobj = combinations(neighbors, depth)
+    batch_size = BATCH_MIN
+    while True:
+        l_s = [s for _, s in zip(range(batch_size), iterobj)]
+        if len(l_s) == 0:
+            return None, n_tests
+        a_pval = citest.pvalues(i, j, l_s)
+        a_sep = np.flatnonzero(a_pval > alpha)
+        if a_sep.size > 0:
+            n_batch = int(a_sep[0]) + 1
+        else:
+            n_batch = len(l_s)
+        n_tests += n_batch
+        if budget is not None:
+            budget.consume(n_batch)
+        if a_sep.size > 0:
+            return l_s[a_sep[0]], n_tests
+        batch_size = min(batch_size * 2, BATCH_MAX)
+
+
+# CI test object, threshold and budget in worker processes of stable-PC
+_worker_args = None
+
+
+def _init_worker(citest, alpha, budget):
+    global _worker_args
+    _worker_args = (citest, alpha, budget)
+
+
+def _search_sepset_worker(task):
+    citest, alpha, budget = _worker_args
+    return search_sepset(citest, alpha, *task, budget=budget)
+
+
+class SeparationSet(object):
+    """Separation sets of node pairs.
+
+    Same as sep_set of pcalg, get(i, j) returns None for the pairs
+    not adjacent in the initial graph, and an empty set
+    for the pairs with no separating nodes found.
+    """
+
+    def __init__(self, init_adj):
+        self._init_adj = init_adj
+        self._d = {}
+
+    @staticmethod
+    def _key(i, j):
+        return (i, j) if i < j else (j, i)
+
+    def add(self, i, j, s):
+        self._d.setdefault(self._key(i, j), set()).update(s)
+
+    def get(self, i, j):
+        if not self._init_adj[i, j]:
+            return None
+        return self._d.get(self._key(i, j), set())
+
+    def items(self):
+        return self._d.items()
+
+    def copy(self):
+        ret = SeparationSet(self._init_adj)
+        ret._d = {key: set(val) for key, val in self._d.items()}
+        return ret
+
+
+class SkeletonSearch(object):
+    """Skeleton estimation of PC algorithm.
+
+    Args:
+        citest (citest.CITest): conditional independence test.
+        n_nodes (int): the number of nodes (columns of input data).
+        alpha (float): threshold of p-value.
+        init_adj (np.ndarray, optional): initial adjacency matrix.
+            If None, a complete graph is used.
+        max_depth (int, optional): maximum size of conditioning sets.
+            If None or negative, no limit is set.
+        method (str): "stable" for stable-PC, otherwise original-PC.
+        n_workers (int): the number of processes to test edges.
+            Available only for stable-PC, in which all edges in a depth
+            are tested on the same adjacency matrix. The results are
+            merged in the same order as 1 process.
+        time_limit (float, optional): limit of wall time in seconds.
+        max_tests (int, optional): limit of the number of CI tests.
+            If the search exceeds the limits, the depth in progress
+            is discarded and the skeleton of completed depths is returned
+            with self.truncated = True.
+    """
+
+    def __init__(self, citest, n_nodes, alpha, init_adj=None,
+                 max_depth=None, method="default", n_workers=1,
+                 time_limit=None, max_tests=None):
+        self.citest = citest
+        self.n_nodes = n_nodes
+        self.alpha = alpha
+        if init_adj is None:
+            init_adj = complete_adj(n_nodes)
+        self.adj = init_adj.copy()
+        self.sep_set = SeparationSet(init_adj)
+        if max_depth is not None and max_depth < 0:
+            max_depth = None
+        self.max_depth = max_depth
+        self.stable = (method == "stable")
+        self.n_workers = n_workers
+        self.depth = 0
+        # CI tests and seconds in each depth (including truncated one)
+        self.n_tests = []
+        self.depth_time = []
+        self.time_limit = time_limit
+        self.max_tests = max_tests
+        self.truncated = False
+        self._budget = None
+
+        if self.n_workers > 1:
+            import multiprocessing
+            if not self.stable:
+                _logger.warning("parallel skeleton search is available "
+                                "only in stable-PC, use 1 process")
+                self.n_workers = 1
+            elif multiprocessing.current_process().daemon:
+                _logger.warning("parallel skeleton search is not available "
+                                "in daemon processes (e.g., make-dag -p), "
+                                "use 1 process")
+                self.n_workers = 1
+
+    def _search_depth(self, depth):
+        cont = False
+        for i in range(self.n_nodes):
+            for j in np.nonzero(self.adj[i])[0]:
+                j = int(j)
+                # self.adj is modified in original-PC
+                if not self.adj[i, j]:
+                    continue
+                neighbors = [int(k) for k in np.nonzero(self.adj[i])[0]
+                             if not k == j]
+                if len(neighbors) < depth:
+                    continue
+                sep, n_tests = search_sepset(self.citest, self.alpha,
+                                             i, j, neighbors, depth,
+                                             budget=self._budget)
+                self.n_tests[depth] += n_tests
+                if sep is not None:
+                    self.adj[i, j] = False
+                    self.adj[j, i] = False
+                    self.sep_set.add(i, j, sep)
+                cont = True
+        return cont
+
+    def _stable_tasks(self, depth):
+        l_task = []
+        for i in range(self.n_nodes):
+            adj_i = [int(k) for k in np.nonzero(self.adj[i])[0]]
+            if len(adj_i) - 1 < depth:
+                continue
+            for j in adj_i:
+                neighbors = [k for k in adj_i if not k == j]
+                l_task.append((i, j, neighbors, depth))
+        return l_task
+
+    def _search_depth_stable(self, depth, pool=None):
+        # all tasks refer to the adjacency matrix at the start of the depth
+        l_task = self._stable_tasks(depth)
+        if pool is None:
+            l_result = [search_sepset(self.citest, self.alpha, *task,
+                                      budget=self._budget)
+                        for task in l_task]
+        else:
+            chunksize = max(1, len(l_task) // (self.n_workers * 4))
+            l_result = []
+            for result in pool.imap(_search_sepset_worker, l_task,
+                                    chunksize=chunksize):
+                l_result.append(result)
+                if self._budget is not None:
+                    self._budget.consume(result[1])
+
+        remove_edges = []
+        for (i, j, _, _), (sep, n_tests) in zip(l_task, l_result):
+            self.n_tests[depth] += n_tests
+            if sep is not None:
+                remove_edges.append((i, j))
+                self.sep_set.add(i, j, sep)
+        for i, j in remove_edges:
+            self.adj[i, j] = False
+            self.adj[j, i] = False
+        return len(l_task) > 0
+
+    def run(self):
+        if self.time_limit is not None or self.max_tests is not None:
+            self._budget = Budget(self.time_limit, self.max_tests)
+        if self.n_workers > 1:
+            import multiprocessing
+            with multiprocessing.Pool(processes=self.n_workers,
+                                      initializer=_init_worker,
+                                      initargs=(self.citest, self.alpha,
+                                                self._budget)) as pool:
+                return self._run(pool)
+        else:
+            return self._run()
+
+    def _run(self, pool=None):
+        while True:
+            self.n_tests.append(0)
+            n_edges = self.number_of_edges()
+            snapshot = (self.adj.copy(), self.sep_set.copy())
+            start = time.perf_counter()
+            try:
+                if self.stable:
+                    cont = self._search_depth_stable(self.depth, pool)
+                else:
+                    cont = self._search_depth(self.depth)
+            except BudgetExceeded as e:
+                self.depth_time.append(time.perf_counter() - start)
+                # discard the depth in progress
+                self.adj, self.sep_set = snapshot
+                self.truncated = True
+                _logger.warning(
+                    "skeleton search truncated ({0}) at depth {1}: "
+                    "{2} CI tests in {3:.1f} sec, "
+                    "{4} edges remaining with completed depths".format(
+                        e, self.depth, self._budget.n_tests,
+                        self._budget.elapsed(), self.number_of_edges()))
+                break
+            self.depth_time.append(time.perf_counter() - start)
+            _logger.debug("skeleton depth {0}: {1} tests, "
+                          "edges {2} -> {3}".format(
+                self.depth, self.n_tests[self.depth],
+                n_edges, self.number_of_edges()))
+            self.depth += 1
+            if not cont:
+                break
+            if self.max_depth is not None and self.depth > self.max_depth:
+                break
+        return self.adj, self.sep_set
+
+    def number_of_edges(self):
+        return int(np.count_nonzero(self.adj) // 2)
+
+
+def estimate_skeleton(citest, n_nodes, alpha, init_adj=None,
+                      max_depth=None, method="default", n_workers=1,
+                      time_limit=None, max_tests=None):
+    """Returns:
+        adj (np.ndarray): boolean adjacency matrix of the skeleton.
+        sep_set (SeparationSet): separation sets of removed edges.
+    """
+    search = SkeletonSearch(citest, n_nodes, alpha, init_adj=init_adj,
+                            max_depth=max_depth, method=method,
+                            n_workers=n_workers, time_limit=time_limit,
+                            max_tests=max_tests)
+    return search.run()
+
+
+def estimate_cpdag(adj, sep_set):
+    """Orient the skeleton with v-structures and orientation rules
+    (Rule 1 to 3) in the same order as pcalg.estimate_cpdag.
+
+    Returns:
+        np.ndarray: boolean matrix, [i, j] is True if edge i -> j exists.
+            Undirected edges have both directions.
+    """
+    dag = adj.copy()
+    n_nodes = dag.shape[0]
+
+    # v-structures
+    for i in range(n_nodes):
+        # dag[i] is not changed while processing pairs (i, j),
+        # and the other rows only lose edges:
+        # candidates are the nodes sharing some successors with i
+        succ_i = np.nonzero(dag[i])[0]
+        if len(succ_i) == 0:
+            continue
+        cand = dag[:, succ_i].any(axis=1)
+        cand[:i + 1] = False
+        for j in np.nonzero(cand)[0]:
+            if dag[i, j] or dag[j, i]:
+                continue
+            sep = sep_set.get(i, j)
+            if sep is None:
+                continue
+            for k in np.nonzero(dag[i] & dag[j])[0]:
+                if int(k) not in sep:
+                    dag[k, i] = False
+                    dag[k, j] = False
+
+    # orientation rules
+    while True:
+        old_dag = dag.copy()
+        for i in range(n_nodes):
+            for j in np.nonzero(dag[i] & dag[:, i])[0]:
+                _orient_rules(dag, i, j)
+        if np.array_equal(dag, old_dag):
+            break
+    return dag
+
+
+def _orient_rules(dag, i, j):
+    def _undirected(a, b):
+        return dag[a, b] and dag[b, a]
+
+    # Rule 1: Orient i-j into i->j whenever there is an arrow k->i
+    # such that k and j are nonadjacent.
+    if _undirected(i, j):
+        if np.any(dag[:, i] & ~dag[i] & ~dag[:, j] & ~dag[j]):
+            dag[j, i] = False
+
+    # Rule 2: Orient i-j into i->j whenever there is a chain i->k->j.
+    if _undirected(i, j):
+        if np.any(dag[i] & ~dag[:, i] & dag[:, j] & ~dag[j]):
+            dag[j, i] = False
+
+    # Rule 3: Orient i-j into i->j whenever there are two chains
+    # i-k->j and i-l->j such that k and l are nonadjacent.
+    if _undirected(i, j):
+        cand = np.nonzero(dag[i] & dag[:, i] & dag[:, j] & ~dag[j])[0]
+        if len(cand) >= 2:
+            sub = dag[np.ix_(cand, cand)] | dag[np.ix_(cand, cand)].T
+            np.fill_diagonal(sub, True)
+            if not np.all(sub):
+                dag[j, i] = False
+
+
+def adj2digraph(dag):
+    g = nx.DiGraph()
+    g.add_nodes_from(range(dag.shape[0]))
+    g.add_edges_from((int(i), int(j)) for i, j in zip(*np.nonzero(dag)))
+    return g
+
@@ -1,27 +1,233 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import os
 import json
+import logging
+import hashlib
+import numpy as np
 import networkx as nx
 
+from . import metrics
+
+_logger = logging.getLogger(__package__)
+
+
+def _host_index(l_evdef):
+    """Returns:
+        list: hosts of the events (without duplication).
+        np.ndarray: host index of each event.
+    """
+    l_host, a_hid = np.unique([evdef.host for evdef in l_evdef],
+                              return_inverse=True)
+    return list(l_host), a_hid.reshape(-1)
+
+
+class CompiledTopology():
+    """Topology network compiled into host ids and CSR adjacency,
+    used instead of networkx graph in pruning.
+
+    Args:
+        hosts (np.ndarray): host names, the index is the host id.
+        indptr (np.ndarray): CSR index pointers in shape (n_hosts + 1).
+        indices (np.ndarray): CSR column indices (neighbor host ids),
+            including both directions of each edge.
+    """
+
+    def __init__(self, hosts, indptr, indices):
+        self.hosts = hosts
+        self.indptr = indptr
+        self.indices = indices
+        self._d_hid = {host: hid for hid, host in enumerate(hosts)}
+        self._edges = None  # set of host pairs for has_edge
+        self._reach = {}  # key: hops, val: reachability (csr_matrix)
+
+    @classmethod
+    def from_graph(cls, net):
+        hosts = np.array([str(host) for host in net.nodes()], dtype=str)
+        d_hid = {host: hid for hid, host in enumerate(net.nodes())}
+        l_nbrs = [sorted(d_hid[v] for v in net.neighbors(u))
+                  for u in net.nodes()]
+        indptr = np.zeros(len(hosts) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(nbrs) for nbrs in l_nbrs])
+        if len(l_nbrs) > 0:
+            indices = np.fromiter((v for nbrs in l_nbrs for v in nbrs),
+                                  dtype=np.int64, count=indptr[-1])
+        else:
+            indices = np.zeros(0, dtype=np.int64)
+        return cls(hosts, indptr, indices)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros(0, dtype=str), np.zeros(1, dtype=np.int64),
+                   np.zeros(0, dtype=np.int64))
+
+    def has_edge(self, u, v):
+        if self._edges is None:
+            self._edges = {(self.hosts[src], self.hosts[dst])
+                           for src in range(len(self.hosts))
+                           for dst in self.indices[self.indptr[src]:
+                                                   self.indptr[src + 1]]}
+        return (u, v) in self._edges
+
+    def host_adjacency(self, l_host):
+        """Boolean adjacency matrix of given hosts."""
+        host_adj = np.zeros((len(l_host), len(l_host)), dtype=bool)
+        a_idx, a_hid = self._local_index(l_host)
+        if a_idx.size == 0:
+            return host_adj
+        # topology host id -> index in l_host
+        a_local = np.full(len(self.hosts), -1, dtype=np.int64)
+        a_local[a_hid] = a_idx
+        a_len = self.indptr[a_hid + 1] - self.indptr[a_hid]
+        a_row = np.repeat(a_idx, a_len)
+        a_col = a_local[np.concatenate(
+            [self.indices[self.indptr[hid]:self.indptr[hid + 1]]
+             for hid in a_hid])]
+        mask = a_col >= 0
+        host_adj[a_row[mask], a_col[mask]] = True
+        return host_adj
+
+
+    def _local_index(self, l_host):
+        """Returns:
+            np.ndarray: index in l_host of the hosts in the topology.
+            np.ndarray: host ids of them.
+        """
+        l_pair = [(idx, self._d_hid[host]) for idx, host in enumerate(l_host)
+                  if host in self._d_hid]
+        if len(l_pair) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return [np.array(a, dtype=np.int64) for a in zip(*l_pair)]
+
+    def reachability(self, hops):
+        """Sparse boolean matrix of host pairs within given hops
+        (including the diagonal). It is computed once for each hops."""
+        if hops not in self._reach:
+            from scipy.sparse import csr_matrix, identity
+            n_hosts = len(self.hosts)
+            adj = csr_matrix((np.ones(self.indices.size, dtype=np.int32),
+                              self.indices, self.indptr),
+                             shape=(n_hosts, n_hosts))
+            reach = identity(n_hosts, dtype=np.int32, format="csr")
+            for _ in range(hops):
+                reach = reach + reach @ adj
+                # keep the values boolean, not to overflow the counts
+                reach.data[:] = 1
+            self._reach[hops] = reach.astype(bool)
+        return self._reach[hops]
+
+    def host_reachability(self, l_host, hops):
+        """Boolean matrix of given hosts, True if within given hops."""
+        a_idx, a_hid = self._local_index(l_host)
+        host_reach = np.zeros((len(l_host), len(l_host)), dtype=bool)
+        if a_idx.size > 0:
+            sub = self.reachability(hops)[a_hid][:, a_hid]
+            host_reach[np.ix_(a_idx, a_idx)] = sub.toarray()
+        return host_reach
+
+
+# compiled topologies in a process, key: path, val: (stat, topology)
+_topologies = {}
+
+
+def _file_stat(fp):
+    st = os.stat(fp)
+    return st.st_mtime_ns, st.st_size
+
+
+def _file_hash(fp):
+    with open(fp, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _compiled_path(fp, cache_dir):
+    name = hashlib.sha1(os.path.abspath(fp).encode("utf-8")).hexdigest()
+    return "{0}/{1}_{2}.npz".format(cache_dir, os.path.basename(fp),
+                                    name[:8])
+
+
+def _load_compiled(fp, cache_fp, stat):
+    """Load compiled topology if it is compiled from
+    the current network file (same mtime and size, or same hash)."""
+    if not os.path.exists(cache_fp):
+        return None
+    try:
+        with np.load(cache_fp) as npz:
+            if tuple(npz["stat"]) != stat and \
+                    str(npz["sha1"]) != _file_hash(fp):
+                return None
+            return CompiledTopology(npz["hosts"], npz["indptr"],
+                                    npz["indices"])
+    except (OSError, ValueError, KeyError) as e:
+        # broken file, compiled again
+        _logger.warning("failed to load compiled topology {0}: {1}".format(
+            cache_fp, e))
+        return None
+
+
+def _dump_compiled(fp, cache_fp, stat, topo):
+    tmp_fp = "{0}.{1}.tmp".format(cache_fp, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(cache_fp), exist_ok=True)
+        with open(tmp_fp, "wb") as f:
+            np.savez(f, hosts=topo.hosts, indptr=topo.indptr,
+                     indices=topo.indices, stat=np.array(stat),
+                     sha1=np.array(_file_hash(fp)))
+        os.replace(tmp_fp, cache_fp)
+    except OSError as e:
+        _logger.warning("failed to save compiled topology {0}: {1}".format(
+            cache_fp, e))
+
+
+def load_topology(fp, cache_dir=None):
+    """Load a topology network file (networkx node-link json) as
+    CompiledTopology. It is compiled once and kept in the process.
+    If cache_dir is given, it is also saved into a npz file in cache_dir,
+    used while the network file is not changed.
+    Failure in saving the npz file is not fatal (only logged)."""
+    stat = _file_stat(fp)
+    if fp in _topologies and _topologies[fp][0] == stat:
+        return _topologies[fp][1]
+
+    if cache_dir is None:
+        topo = None
+    else:
+        cache_fp = _compiled_path(fp, cache_dir)
+        topo = _load_compiled(fp, cache_fp, stat)
+    if topo is None:
+        with open(fp, 'r', encoding='utf-8') as f:
+            js = json.load(f)
+        topo = CompiledTopology.from_graph(nx.node_link_graph(js))
+        if cache_dir is not None:
+            _dump_compiled(fp, cache_fp, stat, topo)
+        _logger.debug("compiled topology {0}".format(fp))
+    _topologies[fp] = (stat, topo)
+    return topo
+
+
+def load_topologies(conf):
+    """Load topology network files used in pruning into the process,
+    e.g., before forking worker processes."""
+    if conf.getboolean("pc_prune", "do_pruning"):
+        init_pruner(conf)
+
 
 class MultiLayerTopology():
     _default_layer = "other"
 
-    def __init__(self, d_topology_fp, d_rule):
-        self._topology = self._load_graph(d_topology_fp)
+    def __init__(self, d_topology_fp, d_rule, cache_dir=None):
+        self._topology = self._load_graph(d_topology_fp, cache_dir)
         self._d_rule = d_rule
 
     @staticmethod
-    def _load_graph(d_fp):
+    def _load_graph(d_fp, cache_dir=None):
         topo = {}
         for name, fp in d_fp.items():
             try:
-                with open(fp, 'r', encoding='utf-8') as f:
-                    js = json.load(f)
-                topo[name] = nx.node_link_graph(js)
+                topo[name] = load_topology(fp, cache_dir)
             except IOError:
-                topo[name] = nx.Graph()
+                topo[name] = CompiledTopology.empty()
         return topo
 
     def _get_layer(self, evdef):
@@ -53,17 +259,28 @@ class MultiLayerTopology():
                 g_ret.add_edge(*edge)
         return g_ret
 
+    def node_adjacency(self, l_evdef):
+        l_host, a_hid = _host_index(l_evdef)
+        a_layer = np.array([self._get_layer(evdef) for evdef in l_evdef])
+        adj = a_hid[:, np.newaxis] == a_hid[np.newaxis, :]
+        for layer, net in self._topology.items():
+            mask = a_layer == layer
+            if not mask.any():
+                continue
+            # adjacent in the layer of either of the nodes
+            host_adj = net.host_adjacency(l_host)[np.ix_(a_hid, a_hid)]
+            adj |= host_adj & (mask[:, np.newaxis] | mask[np.newaxis, :])
+        return adj
+
 
 class SingleLayerTopology():
 
-    def __init__(self, topology_fp):
-        self._topology = self._load_graph(topology_fp)
+    def __init__(self, topology_fp, cache_dir=None):
+        self._topology = self._load_graph(topology_fp, cache_dir)
 
     @staticmethod
-    def _load_graph(fp):
-        with open(fp, 'r', encoding='utf-8') as f:
-            js = json.load(f)
-        return nx.node_link_graph(js)
+    def _load_graph(fp, cache_dir=None):
+        return load_topology(fp, cache_dir)
 
     def prune(self, g_base, evmap):
         g_ret = nx.Graph()
@@ -75,6 +292,40 @@ class SingleLayerTopology():
                 g_ret.add_edge(*edge)
         return g_ret
 
+    def node_adjacency(self, l_evdef):
+        l_host, a_hid = _host_index(l_evdef)
+        host_adj = self._topology.host_adjacency(l_host)
+        return (a_hid[:, np.newaxis] == a_hid[np.newaxis, :]) | \
+            host_adj[np.ix_(a_hid, a_hid)]
+
+
+class KHopTopology():
+    """Keep edges between hosts within given hops in a topology network,
+    as faults can propagate through transit hosts.
+    The reachability of all host pairs is computed once
+    for each topology file in a process."""
+
+    def __init__(self, topology_fp, hops, cache_dir=None):
+        self._topology = load_topology(topology_fp, cache_dir)
+        self._hops = hops
+
+    def prune(self, g_base, evmap):
+        l_node = list(g_base.nodes())
+        adj = self.node_adjacency([evmap.evdef(node) for node in l_node])
+        d_idx = {node: idx for idx, node in enumerate(l_node)}
+        g_ret = nx.Graph()
+        g_ret.add_nodes_from(l_node)
+        for edge in g_base.edges():
+            if adj[d_idx[edge[0]], d_idx[edge[1]]]:
+                g_ret.add_edge(*edge)
+        return g_ret
+
+    def node_adjacency(self, l_evdef):
+        l_host, a_hid = _host_index(l_evdef)
+        host_reach = self._topology.host_reachability(l_host, self._hops)
+        return (a_hid[:, np.newaxis] == a_hid[np.newaxis, :]) | \
+            host_reach[np.ix_(a_hid, a_hid)]
+
 
 class Independent():
 
@@ -90,15 +341,27 @@ class Independent():
                 g_ret.add_edge(*edge)
         return g_ret
 
+    def node_adjacency(self, l_evdef):
+        _, a_hid = _host_index(l_evdef)
+        return a_hid[:, np.newaxis] == a_hid[np.newaxis, :]
+
+
+def topology_cache_dir(conf):
+    cache_dir = conf.get("pc_prune", "topology_cache_dir")
+    if cache_dir == "":
+        cache_dir = "{0}/topology_cache".format(conf.get("dag", "output_dir"))
+    return cache_dir
+
 
 def init_pruner(conf):
     from amulog import config
     l_pruner = []
+    cache_dir = topology_cache_dir(conf)
     methods = config.getlist(conf, "pc_prune", "methods")
     for method in methods:
         if method == "topology":
             fp = conf.get("pc_prune", "single_network_file")
-            l_pruner.append(SingleLayerTopology(fp))
+            l_pruner.append(SingleLayerTopology(fp, cache_dir))
         elif method == "multi-topology":
             d_fp = {}
             files = config.getlist(conf, "pc_prune", "multi_network_file")
@@ -109,7 +372,11 @@ def init_pruner(conf):
             for rule in rulestr:
                 group, layer = rule.split(":")
                 d_rule[group] = layer
-            l_pruner.append(MultiLayerTopology(d_fp, d_rule))
+            l_pruner.append(MultiLayerTopology(d_fp, d_rule, cache_dir))
+        elif method == "khop-topology":
+            fp = conf.get("pc_prune", "single_network_file")
+            hops = conf.getint("pc_prune", "khop_distance")
+            l_pruner.append(KHopTopology(fp, hops, cache_dir))
         elif method == "independent":
             l_pruner.append(Independent())
         else:
@@ -125,3 +392,31 @@ def prune_graph(g, conf, evmap):
     return g
 
 
+def candidate_edges(conf, evmap):
+    """Edges remaining after pruning, evaluated on boolean adjacency
+    matrices of the nodes (i.e., without the complete graph).
+    The edges are in the same order as those of prune_graph
+    on the complete graph of evmap.eids()."""
+    l_eid = list(evmap.eids())
+    l_evdef = [evmap.evdef(eid) for eid in l_eid]
+    if len(l_eid) == 0:
+        return []
+    with metrics.timer("prune.load_topology"):
+        l_pruner = init_pruner(conf)
+    adj = np.ones((len(l_eid), len(l_eid)), dtype=bool)
+    for p in l_pruner:
+        with metrics.timer("prune." + p.__class__.__name__):
+            adj &= p.node_adjacency(l_evdef)
+    a_src, a_dst = np.nonzero(np.triu(adj, k=1))
+    return [(l_eid[i], l_eid[j]) for i, j in zip(a_src, a_dst)]
+
+
+def pruned_graph(conf, evmap):
+    """Initial graph of PC algorithm, same as prune_graph
+    on the complete graph of evmap.eids()."""
+    l_edge = candidate_edges(conf, evmap)
+    with metrics.timer("prune.graph"):
+        g = nx.Graph()
+        g.add_nodes_from(evmap.eids())
+        g.add_edges_from(l_edge)
+    return g
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Scheduler of make-dag jobs in worker processes.
+
+Jobs are dispatched with imap_unordered, in descending order of
+the estimated cost if [dag] job_order is lpt (longest processing time
+first), so that large jobs (e.g., area all) are not left at the end.
+The job arguments are given to the workers once in the initializer,
+and each task is sent as a job name.
+
+The results of jobs are recorded in the job manifest
+(manifest.jsonl beside the args file), and make-dag --resume
+skips the jobs completed with the current config.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import traceback
+import multiprocessing
+
+from amulog import common
+from . import arguments
+
+_logger = logging.getLogger(__package__)
+
+# job arguments in a worker process, key: jobname, see _init_worker
+_d_args = {}
+_reuse_input = False
+
+
+def _init_worker(l_args, reuse_input):
+    global _reuse_input
+    from . import prune
+    _d_args.clear()
+    for args in l_args:
+        _d_args[arguments.args2name(args)] = args
+    _reuse_input = reuse_input
+    if len(l_args) > 0:
+        prune.load_topologies(l_args[0][0])
+
+
+def run_job(args, reuse_input=False):
+    """Run a make-dag job, and catch the errors in it.
+
+    Returns:
+        dict: result of the job, with keys job, status
+            (done, truncated or failed), time, nodes and error.
+    """
+    from . import makedag
+    jobname = arguments.args2name(args)
+    start = time.time()
+    try:
+        ldag = makedag.makedag_main(args, reuse_input=reuse_input)
+    except Exception:
+        _logger.error("makedag job({0}) failed".format(jobname),
+                      exc_info=True)
+        return {"job": jobname, "status": "failed",
+                "time": time.time() - start, "nodes": None,
+                "error": traceback.format_exc(limit=-1).strip()}
+    if ldag.graph.graph.get("truncated", False):
+        status = "truncated"
+    else:
+        status = "done"
+    return {"job": jobname, "status": status,
+            "time": time.time() - start,
+            "nodes": ldag.graph.number_of_nodes(), "error": None}
+
+
+def _run_job(jobname):
+    return run_job(_d_args[jobname], reuse_input=_reuse_input)
+
+
+# options in [dag] not changing the output DAGs
+_FINGERPRINT_IGNORED = {"whole_term", "area", "unit_diff",
+                        "load_batch", "load_batch_hosts", "load_workers",
+                        "input_cache", "input_cache_dir",
+                        "input_cache_max_windows", "input_persist",
+                        "input_incremental", "input_format", "job_order",
+                        "skeleton_workers", "skeleton_verbose",
+                        "ci_cache_size", "ci_cache_persist",
+                        "metrics_sink",
+                        "args_fn", "evmap_dir", "output_dir"}
+
+
+def job_fingerprint(conf, args):
+    """Fingerprint of the config options and job arguments
+    that determine the output of the job."""
+    from . import inputcache
+    _, dt_range, area = args
+    d = {"input": inputcache.input_fingerprint(conf, args, False, False)}
+    for name, value in conf.items("dag"):
+        if name not in _FINGERPRINT_IGNORED:
+            d["dag." + name] = value
+    if conf.getboolean("pc_prune", "do_pruning"):
+        for name, value in conf.items("pc_prune"):
+            if name != "topology_cache_dir":
+                d["pc_prune." + name] = value
+    s = json.dumps(d, sort_keys=True)
+    return hashlib.sha1(s.encode("utf-8")).hexdigest()
+
+
+def _dag_checksum(conf, args):
+    fp = arguments.ArgumentManager.dag_path(
+        conf, args, ext=conf.get("dag", "output_dag_format"))
+    if fp is None or not os.path.exists(fp):
+        return None
+    with open(fp, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class JobManifest(object):
+    """Records of make-dag jobs, appended as JSON lines to
+    ArgumentManager.manifest_path. The last record of a job is valid.
+
+    Each record has job (name), status (done, truncated or failed),
+    fingerprint (see job_fingerprint), time (seconds), nodes,
+    checksum (sha1 of the DAG file), error and timestamp.
+    """
+
+    def __init__(self, am):
+        self._path = am.manifest_path
+        self._d_record = {}
+        if os.path.exists(self._path):
+            with open(self._path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # partially written line in a crash
+                        continue
+                    self._d_record[record["job"]] = record
+
+    def get(self, jobname):
+        return self._d_record.get(jobname)
+
+    def record(self, conf, args, result):
+        record = dict(result)
+        record["fingerprint"] = job_fingerprint(conf, args)
+        if result["status"] == "failed":
+            record["checksum"] = None
+        else:
+            record["checksum"] = _dag_checksum(conf, args)
+        record["timestamp"] = time.time()
+        self._d_record[record["job"]] = record
+        # 1 line in 1 write, not to be mixed with other writers
+        with open(self._path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        return record
+
+    def is_completed(self, conf, args):
+        """True if the job is done with the current config,
+        and its output DAG is not changed after that."""
+        record = self.get(arguments.args2name(args))
+        if record is None or record["status"] != "done":
+            return False
+        if record["fingerprint"] != job_fingerprint(conf, args):
+            return False
+        return record["checksum"] == _dag_checksum(conf, args)
+
+    def incomplete_args(self, conf, l_args):
+        """Jobs to run in resuming: not recorded, failed, truncated,
+        or stale (config or output changed)."""
+        return [args for args in l_args
+                if not self.is_completed(conf, args)]
+
+
+def estimate_cost(args, d_el=None):
+    """Estimate the cost of a job as the square of the number of nodes
+    (i.e., the number of edge candidates).
+    The number of nodes is taken from the evmap of the previous run,
+    or counted from the series in the sources if not available.
+
+    Args:
+        args (tuple): job arguments.
+        d_el (dict, optional): event loaders (see log2event.init_evloaders)
+            to count the series. If not given, None is returned
+            for the jobs without previous runs.
+    """
+    from . import log2event
+    conf, dt_range, area = args
+    evmap = log2event.EventDefinitionMap()
+    try:
+        evmap.load(conf, args)
+        n_nodes = len(evmap)
+    except OSError:
+        if d_el is None:
+            return None
+        n_nodes = sum(sum(1 for _ in log2event.iter_evdef(conf, src, el,
+                                                          dt_range, area))
+                      for src, el in d_el.items())
+    return n_nodes ** 2
+
+
+def order_jobs(conf, l_args):
+    """Order of jobs to dispatch, following [dag] job_order."""
+    job_order = conf.get("dag", "job_order")
+    if job_order == "args":
+        return list(l_args)
+    elif job_order == "lpt":
+        from . import log2event
+        d_el = None
+        l_cost = []
+        for args in l_args:
+            cost = estimate_cost(args)
+            if cost is None:
+                if d_el is None:
+                    d_el = log2event.init_evloaders(conf)
+                cost = estimate_cost(args, d_el)
+            l_cost.append(cost)
+        # sorted is stable: jobs of same cost are kept in the args order
+        l_idx = sorted(range(len(l_args)), key=lambda idx: -l_cost[idx])
+        return [l_args[idx] for idx in l_idx]
+    else:
+        raise ValueError("job_order invalid ({0})".format(job_order))
+
+
+def run_jobs(conf, l_args, n_proc=1, reuse_input=False, manifest=None):
+    """Run make-dag jobs in n_proc worker processes
+    (in this process in the given order if n_proc is 1).
+
+    Args:
+        manifest (JobManifest, optional): If given,
+            the results are recorded in it.
+
+    Returns:
+        list: results of the jobs (see run_job),
+            in the order of completion.
+    """
+    from . import prune
+    d_args = {arguments.args2name(args): args for args in l_args}
+
+    def _iter_results():
+        if n_proc > 1:
+            l_order = order_jobs(conf, l_args)
+            # compile topology files before forking, to share with workers
+            prune.load_topologies(conf)
+            l_jobname = [arguments.args2name(args) for args in l_order]
+            with multiprocessing.Pool(processes=n_proc,
+                                      initializer=_init_worker,
+                                      initargs=(l_args, reuse_input)) as pool:
+                for result in pool.imap_unordered(_run_job, l_jobname):
+                    yield result
+        else:
+            # keep the time order, e.g., for [dag] input_incremental
+            for args in l_args:
+                yield run_job(args, reuse_input=reuse_input)
+
+    l_result = []
+    for result in _iter_results():
+        l_result.append(result)
+        if manifest is not None:
+            manifest.record(conf, d_args[result["job"]], result)
+        _logger.info("makedag job({0}) {1} in {2:.1f}s "
+                     "({3} nodes) [{4}/{5}]".format(
+            result["job"], result["status"], result["time"],
+            result["nodes"], len(l_result), len(l_args)))
+
+    table = [["job", "status", "time", "nodes"]]
+    for result in sorted(l_result, key=lambda x: -x["time"]):
+        table.append([result["job"], result["status"],
+                      "{0:.1f}".format(result["time"]), str(result["nodes"])])
+    _logger.info("makedag job times:\n" + common.cli_table(table))
+    n_failed = sum(1 for result in l_result if result["status"] == "failed")
+    if n_failed > 0:
+        _logger.error("{0} makedag jobs failed".format(n_failed))
+    return l_result
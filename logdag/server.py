@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Long-running make-dag service (make-dag-server).
+
+Job names (same as those in the args file) are accepted line by line
+from stdin or a local (unix domain) socket, and run in a bounded pool
+of worker processes. The workers keep the event loaders
+(connections to amulog and the evdb, and loaded definitions)
+and the pruning topologies warm among jobs.
+The result of each job is returned as a JSON line
+(see schedule.run_job) in the order of completion,
+and recorded in the job manifest.
+"""
+
+import os
+import json
+import logging
+import threading
+import multiprocessing
+import socketserver
+
+from . import arguments
+
+_logger = logging.getLogger(__package__)
+
+# config in a worker process, see _init_worker
+_conf = None
+_reuse_input = False
+
+
+def _init_worker(conf, reuse_input):
+    global _conf
+    global _reuse_input
+    from . import log2event
+    from . import prune
+    _conf = conf
+    _reuse_input = reuse_input
+    log2event.warm_evloaders(conf)
+    prune.load_topologies(conf)
+
+
+def _run_named_job(jobname):
+    from . import schedule
+    try:
+        args = arguments.ArgumentManager.jobname2args(jobname, _conf)
+    except ValueError as e:
+        return {"job": jobname, "status": "failed", "time": 0.,
+                "nodes": None, "error": "invalid job name: {0}".format(e)}
+    return schedule.run_job(args, reuse_input=_reuse_input)
+
+
+class MakeDagServer(object):
+    """
+    Args:
+        conf: logdag config.
+        n_proc (int): number of worker processes.
+        reuse_input (bool): same as make-dag --reuse-input.
+    """
+
+    def __init__(self, conf, n_proc=1, reuse_input=False):
+        from . import schedule
+        self._conf = conf
+        self._manifest = schedule.JobManifest(arguments.ArgumentManager(conf))
+        self._pool = multiprocessing.Pool(processes=n_proc,
+                                          initializer=_init_worker,
+                                          initargs=(conf, reuse_input))
+
+    def submit(self, jobname, callback):
+        """Run a job asynchronously. callback is called with the result
+        (in the result handler thread of the pool)."""
+
+        def _callback(result):
+            # errors here (e.g., BrokenPipeError of a closed client,
+            # or OSError of the manifest) must not stop the result
+            # handler thread of the pool
+            try:
+                self._record(result)
+                callback(result)
+            except Exception:
+                _logger.error("failed to handle the result of "
+                              "job({0})".format(jobname), exc_info=True)
+
+        def _error_callback(e):
+            # run_job catches job errors, so e is an error
+            # out of the job (e.g., in pickling the arguments)
+            _callback({"job": jobname, "status": "failed", "time": 0.,
+                       "nodes": None, "error": repr(e)})
+
+        return self._pool.apply_async(_run_named_job, (jobname,),
+                                      callback=_callback,
+                                      error_callback=_error_callback)
+
+    def _record(self, result):
+        try:
+            args = arguments.ArgumentManager.jobname2args(
+                result["job"], self._conf)
+        except ValueError:
+            pass
+        else:
+            self._manifest.record(self._conf, args, result)
+        _logger.info("makedag job({0}) {1} in {2:.1f}s".format(
+            result["job"], result["status"], result["time"]))
+
+    def serve_stream(self, fin, fout):
+        """Run jobs given in lines of fin, and write the results
+        into fout as JSON lines, until fin is closed."""
+        lock = threading.Lock()
+
+        def _write(result):
+            with lock:
+                fout.write(json.dumps(result) + "\n")
+                fout.flush()
+
+        l_async = []
+        for line in fin:
+            jobname = line.strip()
+            if jobname == "":
+                continue
+            l_async.append(self.submit(jobname, _write))
+        for async_result in l_async:
+            async_result.wait()
+
+    def serve_socket(self, path):
+        """Accept connections on a unix domain socket, and serve
+        each of them as a stream (see serve_stream)."""
+        server = self
+
+        class _Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                fin = (line.decode("utf-8") for line in self.rfile)
+                fout = _TextWriter(self.wfile)
+                server.serve_stream(fin, fout)
+
+        if os.path.exists(path):
+            os.unlink(path)
+        with socketserver.ThreadingUnixStreamServer(path, _Handler) as sock:
+            _logger.info("make-dag-server listening on {0}".format(path))
+            try:
+                sock.serve_forever()
+            finally:
+                os.unlink(path)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+
+class _TextWriter(object):
+
+    def __init__(self, wfile):
+        self._wfile = wfile
+
+    def write(self, s):
+        self._wfile.write(s.encode("utf-8"))
+
+    def flush(self):
+        self._wfile.flush()
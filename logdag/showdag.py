@@ -39,10 +39,10 @@ class LogDAG():
             self._d_el = log2event.init_evloaders(self.conf)
         return self._d_el
 
-    def dump(self):
+    def dump(self, name="dag"):
         dag_format = self.conf["dag"]["output_dag_format"]
         fp = arguments.ArgumentManager.dag_path(self.conf, self.args,
-                                                ext=dag_format)
+                                                ext=dag_format, name=name)
         if dag_format == "pickle":
             with open(fp, 'wb') as f:
                 pickle.dump(self.graph, f)
@@ -52,10 +52,10 @@ class LogDAG():
                 obj = nx.node_link_data(self.graph)
                 json.dump(obj, f)
 
-    def load(self):
+    def load(self, name="dag"):
         dag_format = self.conf["dag"]["output_dag_format"]
         fp = arguments.ArgumentManager.dag_path(self.conf, self.args,
-                                                ext=dag_format)
+                                                ext=dag_format, name=name)
         try:
             if dag_format == "pickle":
                 with open(fp, 'rb') as f:
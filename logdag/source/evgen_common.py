@@ -40,6 +40,40 @@ class EventLoader(object):
         ut_range = tuple(dt.timestamp() for dt in dt_range)
         return self.evdb.get_items(measure, tags, self.fields, ut_range)
 
+    def load_array(self, measure, tags, dt_range):
+        """Returns:
+            np.ndarray: timestamps in int64 epoch microseconds.
+            np.ndarray: values in shape (n_timestamps, n_fields).
+        """
+        ut_range = tuple(dt.timestamp() for dt in dt_range)
+        return self.evdb.get_array(measure, tags, self.fields, ut_range)
+
+    def load_group(self, measure, l_tags, dt_range, binsize=None):
+        """Load multiple series of a measurement with one query.
+
+        Args:
+            l_tags (List[dict]): tags of series, with keys host and key.
+            binsize (datetime.timedelta, optional): If given,
+                values are summed up in time bins (with fill 0).
+
+        Returns:
+            dict: key is (host, key), value is same as load_array.
+                Series without data in dt_range are not included.
+        """
+        ut_range = tuple(dt.timestamp() for dt in dt_range)
+        d_tags_in = {"host": sorted({tags["host"] for tags in l_tags})}
+        group_tags = ["host", "key"]
+        if binsize is None:
+            d_data = self.evdb.get_group(measure, self.fields, ut_range,
+                                         group_tags, d_tags_in=d_tags_in)
+        else:
+            d_data = self.evdb.get_group(measure, self.fields, ut_range,
+                                         group_tags, d_tags_in=d_tags_in,
+                                         str_bin=config.dur2str(binsize),
+                                         func="sum", fill=0)
+        s_keys = {(tags["host"], tags["key"]) for tags in l_tags}
+        return {k: v for k, v in d_data.items() if k in s_keys}
+
     def load_cnt(self, measure, tags, dt_range):
         ut_range = tuple(dt.timestamp() for dt in dt_range)
         return self.evdb.get(measure, tags, self.fields, ut_range,
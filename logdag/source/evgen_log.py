@@ -14,7 +14,7 @@ FEATURE_MEASUREMENT = "log_feature"
 
 
 class LogEventDefinition(log2event.EventDefinition):
-
+    __slots__ = ["gid", ]
     _l_attr_log = ["gid", ]
 
     def __init__(self, **kwargs):
@@ -26,6 +26,9 @@ class LogEventDefinition(log2event.EventDefinition):
         return "{0}, gid:{1}({2})".format(self.host, str(self.gid),
                                           self.group)
 
+    def ident(self):
+        return self.source, self.host, str(self.gid), self.group
+
     def key(self):
         return str(self.gid)
 
@@ -20,18 +20,22 @@ VSOURCE_KEY = "all"
 
 
 class SNMPEventDefinition(log2event.EventDefinition):
+    __slots__ = ["measure", "direction", "mod_cls", "mod_id"]
     _l_attr_key = ["mod_cls", "mod_id", ]
     _l_attr_snmp = ["measure", "direction", ] + _l_attr_key
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         for attr in self._l_attr_snmp:
-            setattr(self, attr, kwargs[attr])
+            setattr(self, attr, log2event._intern(kwargs[attr]))
 
     def __str__(self):
         return "{0}, {1}@{2}({3})".format(self.host, self.measure,
                                           self.key(), self.group)
 
+    def ident(self):
+        return self.source, self.host, self.measure, self.key(), self.group
+
     def key(self):
         return "@".join([getattr(self, attr) for attr in self._l_attr_key])
 
@@ -59,11 +63,15 @@ class SNMPEventDefinition(log2event.EventDefinition):
 
 
 class SNMPVirtualEventDefinition(SNMPEventDefinition):
+    __slots__ = []
 
     def __str__(self):
         return "{0}, {1}({2})".format(self.host, self.measure,
                                       self.group)
 
+    def ident(self):
+        return self.source, self.host, self.measure, self.group
+
     def key(self):
         return VSOURCE_KEY
 
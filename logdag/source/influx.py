@@ -2,6 +2,7 @@
 # coding: utf-8
 
 import logging
+import threading
 import numpy as np
 import pandas as pd
 import influxdb
@@ -21,11 +22,19 @@ class InfluxDB(object):
         self.verbose = False
         # self._protocol = protocol
         inf_kwargs["database"] = dbname
-        self.client = influxdb.InfluxDBClient(**inf_kwargs)
+        self._inf_kwargs = inf_kwargs
+        # clients (HTTP sessions) are not shared among threads
+        self._local = threading.local()
         if dbname not in list(self._list_database()):
             raise IOError("No database {0}".format(dbname))
             # self.client.create_database(dbname)
 
+    @property
+    def client(self):
+        if not hasattr(self._local, "client"):
+            self._local.client = influxdb.InfluxDBClient(**self._inf_kwargs)
+        return self._local.client
+
     def _list_database(self):
         return [d["name"] for d in self.client.get_list_database()]
 
@@ -129,6 +138,58 @@ class InfluxDB(object):
                                 database=self.dbname)
         return ret
 
+    def get_group(self, measure, fields, ut_range, group_tags,
+                  d_tags_in=None, str_bin=None, func=None, fill=None):
+        """Query multiple series at once with GROUP BY tags.
+
+        Args:
+            group_tags (List[str]): tag keys to group series.
+            d_tags_in (dict, optional): tag key to list of tag values.
+                Series with any of the values are queried.
+
+        Returns:
+            dict: key is tuple of tag values in the order of group_tags,
+                value is tuple of timestamps (int64 array of
+                epoch microseconds) and values (2-dimensional array).
+        """
+        s_fields = ", ".join(["{0}(\"{1}\") as \"{1}\"".format(func, s)
+                              if func else "\"{0}\"".format(s)
+                              for s in fields])
+        s_from = "\"{0}\".\"{1}\".\"{2}\"".format(self.dbname, self._rpolicy,
+                                                  measure)
+        l_where = []
+        if d_tags_in is not None:
+            for k, l_v in d_tags_in.items():
+                l_where.append("(" + " OR ".join(
+                    ["\"{0}\" = '{1}'".format(k, v) for v in l_v]) + ")")
+        l_where.append("time >= {0}s AND time < {1}s".format(
+            int(ut_range[0]), int(ut_range[1])))
+        s_where = " AND ".join(l_where)
+        l_gb = ["\"{0}\"".format(k) for k in group_tags]
+        if str_bin is not None:
+            l_gb = ["time({0})".format(str_bin)] + l_gb
+        s_gb = " GROUP BY " + ", ".join(l_gb)
+        if fill is not None:
+            s_gb += " fill({0})".format(str(fill))
+
+        iql = "SELECT {0} FROM {1} WHERE {2}".format(
+            s_fields, s_from, s_where) + s_gb
+        if self.verbose:
+            print(iql)
+        _logger.debug("influxql query: {0}".format(iql))
+        rs = self.client.query(iql, epoch=self._precision,
+                               database=self.dbname)
+
+        ret = {}
+        for (_, tags), points in rs.items():
+            l_points = list(points)
+            a_ts = np.array([p["time"] for p in l_points],
+                            dtype=np.int64) // 1000
+            a_values = np.array([[p[f] for f in fields] for p in l_points])
+            key = tuple(tags[k] for k in group_tags)
+            ret[key] = (a_ts, a_values.reshape(len(l_points), len(fields)))
+        return ret
+
     def get_items(self, measure, d_tags, fields, ut_range):
         rs = self.get(measure, d_tags, fields, ut_range)
 
@@ -139,6 +200,18 @@ class InfluxDB(object):
             array = np.array([p[f] for f in fields])
             yield (dt, array)
 
+    def get_array(self, measure, d_tags, fields, ut_range):
+        """Same as get_items, but return timestamps as int64 array
+        of epoch microseconds and values as 2-dimensional array,
+        without converting each point into datetime."""
+        rs = self.get(measure, d_tags, fields, ut_range)
+        l_points = list(rs.get_points())
+        # self._precision is "n": time is int epoch nanoseconds
+        a_ts = np.array([p["time"] for p in l_points],
+                        dtype=np.int64) // 1000
+        a_values = np.array([[p[f] for f in fields] for p in l_points])
+        return a_ts, a_values.reshape(len(l_points), len(fields))
+
     def has_data(self, measure, d_tags, fields, ut_range):
         rs = self.get(measure, d_tags, fields, ut_range, limit=1)
         return len(list(rs.get_points())) >= 1
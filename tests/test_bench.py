@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import tempfile
+import unittest
+
+from logdag import arguments
+from logdag import bench
+from logdag import log2event
+
+
+class TestBench(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.conf_path = os.path.join(self._tmpdir.name, "test.conf")
+        with open(self.conf_path, "w") as f:
+            f.write("[general]\nlogging =\n\n"
+                    "[dag]\nskeleton_engine = native\n")
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_run_scale(self):
+        conf = arguments.open_logdag_config(self.conf_path)
+        l_result = bench.run_scale(conf, 10, ["gsq_batch"])
+        d_time = {(r["stage"], r["variant"]): r["time"] for r in l_result}
+        self.assertIsNotNone(d_time[("estimate_dag", "gsq_batch")])
+        self.assertIsNotNone(d_time[("makeinput", "load_batch=true")])
+        # the in-memory loader is not left for later loads
+        self.assertNotIn(log2event.SRCCLS_LOG, log2event._warm_evloaders)
+
+    def test_registered_evloader(self):
+        conf = arguments.open_logdag_config(self.conf_path)
+        prev = object()
+        log2event.register_evloader(conf, "log", prev)
+        try:
+            with log2event.registered_evloader(conf, "log", "el") as el:
+                self.assertEqual(log2event.init_evloader(conf, "log"), el)
+            self.assertIs(log2event.init_evloader(conf, "log"), prev)
+        finally:
+            log2event.unregister_evloader("log")
+        self.assertNotIn("log", log2event._warm_evloaders)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import unittest
+from itertools import combinations
+
+import numpy as np
+from scipy.stats import norm
+from gsq.ci_tests import ci_test_bin
+
+from logdag import citest
+from util import random_binary
+
+
+def conditioning_sets(n_nodes, x, y, size):
+    others = [k for k in range(n_nodes) if k not in (x, y)]
+    return [set(s) for s in combinations(others, size)]
+
+
+class TestGSquareBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.data = random_binary(500, 8, seed=1)
+
+    def test_pvalues(self):
+        ci = citest.GSquareBatch(self.data)
+        n_nodes = self.data.shape[1]
+        for x, y in [(0, 1), (2, 5), (3, 7)]:
+            for size in range(4):
+                l_s = conditioning_sets(n_nodes, x, y, size)
+                expected = [ci_test_bin(self.data, x, y, set(s))
+                            for s in l_s]
+                np.testing.assert_allclose(ci.pvalues(x, y, l_s), expected,
+                                           rtol=1e-7, atol=1e-12)
+
+    def test_pcalg_interface(self):
+        ci = citest.GSquareBatch(self.data)
+        for size in range(4):
+            for s in conditioning_sets(8, 2, 6, size):
+                self.assertAlmostEqual(
+                    ci(self.data, 2, 6, set(s)),
+                    ci_test_bin(self.data, 2, 6, set(s)))
+
+    def test_bit_matrix(self):
+        bm = citest.BitMatrix.from_dense(self.data)
+        l_s = conditioning_sets(8, 0, 4, 2)
+        np.testing.assert_allclose(
+            citest.GSquareBatch(bm).pvalues(0, 4, l_s),
+            citest.GSquareBatch(self.data).pvalues(0, 4, l_s))
+
+
+def pvalue_inverse(cm, n_samples, x, y, s):
+    """Fisher's z-test with the partial correlation from the inverse of
+    the sub-correlation matrix, cut at citest.PCORR_CUT."""
+    idx = [x, y] + sorted(s)
+    prec = np.linalg.inv(cm[np.ix_(idx, idx)])
+    r = -prec[0, 1] / np.sqrt(prec[0, 0] * prec[1, 1])
+    r = min(max(r, -citest.PCORR_CUT), citest.PCORR_CUT)
+    stat = np.sqrt(n_samples - len(s) - 3) * np.arctanh(r)
+    return 2 * norm.sf(abs(stat))
+
+
+class TestFisherZBatch(unittest.TestCase):
+
+    def test_pvalues(self):
+        rng = np.random.default_rng(3)
+        n_samples, n_nodes = 300, 8
+        data = rng.normal(size=(n_samples, n_nodes))
+        for i in range(3, n_nodes):
+            a, b = rng.choice(i, 2, replace=False)
+            data[:, i] += 0.5 * data[:, a] - 0.4 * data[:, b]
+        cm = np.corrcoef(data.T)
+        ci = citest.FisherZBatch(data)
+        for x, y in [(0, 1), (2, 5), (3, 7)]:
+            # recursive formulas for size 1 and 2, inverses for larger
+            for size in range(5):
+                l_s = conditioning_sets(n_nodes, x, y, size)
+                expected = [pvalue_inverse(cm, n_samples, x, y, s)
+                            for s in l_s]
+                np.testing.assert_allclose(ci.pvalues(x, y, l_s), expected,
+                                           rtol=1e-6, atol=1e-12)
+
+    def test_pcorr_cut(self):
+        # x and y are identical (partial correlation 1)
+        rng = np.random.default_rng(4)
+        n_samples = 10
+        data = rng.normal(size=(n_samples, 5))
+        data[:, 1] = data[:, 0]
+        ci = citest.FisherZBatch(data)
+        for size in range(4):
+            l_s = conditioning_sets(5, 0, 1, size)
+            expected = 2 * norm.sf(np.sqrt(n_samples - size - 3) *
+                                   np.arctanh(citest.PCORR_CUT))
+            a_pval = ci.pvalues(0, 1, l_s)
+            self.assertTrue(np.all(a_pval > 0))
+            np.testing.assert_allclose(a_pval, expected, rtol=1e-3)
+
+
+class _CountedCITest(citest.CITest):
+
+    def __init__(self, ci):
+        self._ci = ci
+        self.n_calls = 0
+
+    def pvalues(self, x, y, l_s):
+        self.n_calls += len(l_s)
+        return self._ci.pvalues(x, y, l_s)
+
+
+class TestCITestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.data = random_binary(500, 6, seed=5)
+        self.node_keys = ["node{0}".format(i) for i in range(6)]
+
+    def _cached(self, cache, data=None):
+        if data is None:
+            data = self.data
+        ci = _CountedCITest(citest.GSquareBatch(data))
+        return ci, citest.CachedCITest(ci, cache, "gsq_batch",
+                                       self.node_keys, data)
+
+    def test_key_symmetry(self):
+        cache = citest.CITestCache(None)
+        ci, cached = self._cached(cache)
+        pval = cached.pvalue(1, 4, {0, 2})
+        # same test with x and y swapped, and s in another order
+        self.assertEqual(cached.pvalue(4, 1, (2, 0)), pval)
+        self.assertEqual(ci.n_calls, 1)
+        self.assertEqual(cache.hits, 1)
+
+        # same nodes (keys and data) in another column order
+        order = [3, 4, 5, 0, 1, 2]
+        cache.hits = 0
+        other = self.data[:, order]
+        ci2 = _CountedCITest(citest.GSquareBatch(other))
+        cached2 = citest.CachedCITest(ci2, cache, "gsq_batch",
+                                      [self.node_keys[i] for i in order],
+                                      other)
+        self.assertEqual(cached2.pvalue(4, 1, {3, 5}), pval)
+        self.assertEqual(ci2.n_calls, 0)
+
+    def test_data_fingerprint(self):
+        cache = citest.CITestCache(None)
+        _, cached = self._cached(cache)
+        cached.pvalue(0, 1, set())
+        # same keys with another data are not hit
+        ci2, cached2 = self._cached(cache, random_binary(500, 6, seed=6))
+        cached2.pvalue(0, 1, set())
+        self.assertEqual(ci2.n_calls, 1)
+
+    def test_lru(self):
+        cache = citest.CITestCache(2)
+        ci, cached = self._cached(cache)
+        cached.pvalue(0, 1, set())
+        cached.pvalue(0, 2, set())
+        cached.pvalue(0, 1, set())
+        # (0, 2) is the least recently used
+        cached.pvalue(0, 3, set())
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(ci.n_calls, 3)
+        cached.pvalue(0, 1, set())
+        self.assertEqual(ci.n_calls, 3)
+        cached.pvalue(0, 2, set())
+        self.assertEqual(ci.n_calls, 4)
+
+    def test_dump(self):
+        import os
+        import tempfile
+        cache = citest.CITestCache(None)
+        _, cached = self._cached(cache)
+        l_s = conditioning_sets(6, 0, 1, 2)
+        a_pval = cached.pvalues(0, 1, l_s)
+        with tempfile.TemporaryDirectory() as dirname:
+            fp = os.path.join(dirname, "citest_cache.pickle")
+            cache.dump(fp, keys=cached.used_keys)
+            cache2 = citest.CITestCache(None)
+            self.assertEqual(cache2.load(fp), len(l_s))
+        ci2, cached2 = self._cached(cache2)
+        np.testing.assert_array_equal(cached2.pvalues(0, 1, l_s), a_pval)
+        self.assertEqual(ci2.n_calls, 0)
+
+
+class TestGSquareSparse(unittest.TestCase):
+
+    def setUp(self):
+        self.data = random_binary(500, 8, seed=1)
+
+    def test_cooccurrence(self):
+        for data in (self.data, citest.BitMatrix.from_dense(self.data)):
+            stats = citest.SparseBinaryStats(data)
+            for x in range(8):
+                for y in range(8):
+                    self.assertEqual(stats.cooccurrence(x, y),
+                                     int((self.data[:, x] &
+                                          self.data[:, y]).sum()))
+
+    def test_pvalues(self):
+        batch = citest.GSquareBatch(self.data)
+        for data in (self.data, citest.BitMatrix.from_dense(self.data)):
+            ci = citest.GSquareSparse(data)
+            for x, y in [(0, 1), (2, 5), (3, 7)]:
+                for size in range(4):
+                    l_s = conditioning_sets(8, x, y, size)
+                    a_pval = ci.pvalues(x, y, l_s)
+                    np.testing.assert_allclose(a_pval,
+                                               batch.pvalues(x, y, l_s),
+                                               rtol=1e-9, atol=1e-12)
+                    expected = [ci_test_bin(self.data, x, y, set(s))
+                                for s in l_s]
+                    np.testing.assert_allclose(a_pval, expected,
+                                               rtol=1e-7, atol=1e-12)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import time
+import datetime
+import unittest
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+from dateutil.tz import tzlocal
+
+from logdag import dtutil
+
+
+def discretize_changepoint(l_dt, l_term, dt_range, binarize,
+                           l_dt_values=None):
+    """Former implementation of dtutil.discretize (mapping by
+    change points of the terms), as the reference."""
+    if l_dt_values is None:
+        l_dt_values = np.array([1] * len(l_dt))
+    top_dt, end_dt = dt_range
+    a_ret = np.zeros(len(l_term), dtype=int)
+
+    d_cp = defaultdict(list)
+    for idx, term in enumerate(l_term):
+        if term[0] <= top_dt < term[1]:
+            d_cp[top_dt].append((idx, True))
+    for idx, term in enumerate(l_term):
+        if term[0] > top_dt:
+            d_cp[term[0]].append((idx, True))
+        if end_dt >= term[1]:
+            d_cp[term[1]].append((idx, False))
+    for idx, term in enumerate(l_term):
+        if term[0] <= end_dt < term[1]:
+            d_cp[end_dt].append((idx, False))
+
+    l_cp = []
+    temp_idxs = set()
+    for dt, changes in sorted(d_cp.items(), key=lambda x: x[0]):
+        for idx, flag in changes:
+            if flag:
+                temp_idxs.add(idx)
+            else:
+                temp_idxs.remove(idx)
+        l_cp.append((dt, tuple(temp_idxs)))
+
+    iterobj = zip(l_cp[:-1], l_cp[1:])
+    try:
+        (key, l_rid), (next_key, next_l_rid) = next(iterobj)
+    except StopIteration:
+        return a_ret
+
+    for dt, v in zip(l_dt, l_dt_values):
+        if not dt_range[0] <= dt < dt_range[1]:
+            continue
+        if next_key is not None:
+            while dt >= next_key:
+                try:
+                    (key, l_rid), (next_key, next_l_rid) = next(iterobj)
+                except StopIteration:
+                    key, l_rid = l_cp[-1]
+                    next_key = None
+                    break
+        if binarize:
+            a_ret[np.array(l_rid)] = 1
+        else:
+            a_ret[np.array(l_rid)] += v
+    return a_ret
+
+
+def terms_sequential(dt_range, binsize):
+    return terms_slide(dt_range, binsize, binsize)
+
+
+def terms_slide(dt_range, bin_slide, binsize):
+    l_term = []
+    temp_dt = dt_range[0]
+    while temp_dt < dt_range[1]:
+        l_term.append((temp_dt, temp_dt + binsize))
+        temp_dt += bin_slide
+    return l_term
+
+
+def terms_radius(dt_range, bin_slide, bin_radius):
+    l_term = []
+    temp_dt = dt_range[0] + 0.5 * bin_slide
+    while temp_dt < dt_range[1]:
+        l_term.append((temp_dt - bin_radius, temp_dt + bin_radius))
+        temp_dt += bin_slide
+    return l_term
+
+
+class TestDiscretize(unittest.TestCase):
+
+    # local time zones, with and without DST
+    local_timezones = ["UTC", "Asia/Tokyo", "Europe/Berlin"]
+
+    def setUp(self):
+        self._tz_env = os.environ.get("TZ")
+
+    def tearDown(self):
+        if self._tz_env is None:
+            os.environ.pop("TZ", None)
+        else:
+            os.environ["TZ"] = self._tz_env
+        time.tzset()
+
+    @staticmethod
+    def _set_local_timezone(name):
+        os.environ["TZ"] = name
+        time.tzset()
+
+    @staticmethod
+    def _random_series(dt_range, n_dt, seed):
+        rng = np.random.default_rng(seed)
+        top_dt, end_dt = dt_range
+        # including timestamps out of dt_range, and on the bin edges
+        width = int((end_dt - top_dt).total_seconds()) + 7200
+        a_sec = rng.integers(0, width, n_dt) - 3600
+        a_sec[::10] = a_sec[::10] // 60 * 60
+        # the former implementation requires sorted input
+        l_dt = sorted(top_dt + datetime.timedelta(seconds=int(sec),
+                                                  microseconds=int(us))
+                      for sec, us
+                      in zip(a_sec, rng.integers(0, 2, n_dt) * 500))
+        l_values = rng.integers(0, 5, n_dt)
+        return l_dt, l_values
+
+    def _iter_tzinfo(self):
+        # naive (local time), tzlocal, and fixed offset
+        yield None
+        yield tzlocal()
+        yield datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+
+    def _assert_same(self, tzinfo, seed):
+        dt_range = tuple(datetime.datetime(2112, 9, 1, hour, tzinfo=tzinfo)
+                         for hour in (0, 12))
+        l_dt, l_values = self._random_series(dt_range, 500, seed)
+        minute = datetime.timedelta(minutes=1)
+
+        l_case = [
+            ("sequential", terms_sequential(dt_range, 10 * minute),
+             dtutil.discretize_sequential(l_dt, dt_range, 10 * minute,
+                                          binarize=False)),
+            ("slide", terms_slide(dt_range, 5 * minute, 13 * minute),
+             dtutil.discretize_slide(l_dt, dt_range, 5 * minute,
+                                     13 * minute, binarize=False)),
+            ("radius", terms_radius(dt_range, 5 * minute, 7 * minute),
+             dtutil.discretize_radius(l_dt, dt_range, 5 * minute,
+                                      7 * minute, binarize=False)),
+        ]
+        for name, l_term, a_new in l_case:
+            with self.subTest(method=name):
+                a_ref = discretize_changepoint(l_dt, l_term, dt_range, False)
+                np.testing.assert_array_equal(a_new, a_ref)
+                self.assertGreater(a_ref.sum(), 0)
+                for binarize in (False, True):
+                    np.testing.assert_array_equal(
+                        dtutil.discretize(l_dt, l_term, dt_range, binarize,
+                                          l_values),
+                        discretize_changepoint(l_dt, l_term, dt_range,
+                                               binarize, l_values))
+
+    def test_same_as_changepoint(self):
+        for tz_name in self.local_timezones:
+            self._set_local_timezone(tz_name)
+            for tzinfo in self._iter_tzinfo():
+                for seed in range(3):
+                    with self.subTest(local=tz_name, tzinfo=tzinfo,
+                                      seed=seed):
+                        self._assert_same(tzinfo, seed)
+
+    def test_dt2us_array(self):
+        for tz_name in self.local_timezones:
+            self._set_local_timezone(tz_name)
+            for tzinfo in self._iter_tzinfo():
+                top_dt = datetime.datetime(2112, 9, 1, tzinfo=tzinfo)
+                l_dt, _ = self._random_series(
+                    (top_dt, top_dt + datetime.timedelta(days=1)), 100, 0)
+                with self.subTest(local=tz_name, tzinfo=tzinfo):
+                    self.assertEqual(dtutil.dt2us_array(l_dt).tolist(),
+                                     [dtutil.dt2us(dt) for dt in l_dt])
+
+    def test_dtindex2us(self):
+        dt = datetime.datetime(2112, 9, 1, 0, 0, 1)
+        # wall clock for naive, UTC for timezone-aware
+        expected = (dt - datetime.datetime(1970, 1, 1)) // \
+            datetime.timedelta(microseconds=1)
+        for tz in (None, "UTC"):
+            index = pd.DatetimeIndex([dt], tz=tz)
+            for unit in ("s", "us", "ns"):
+                if hasattr(index, "as_unit"):
+                    index = index.as_unit(unit)
+                with self.subTest(tz=tz, unit=unit):
+                    self.assertEqual(dtutil.dtindex2us(index).tolist(),
+                                     [expected])
+
+
+class TestShortstr(unittest.TestCase):
+
+    def test_shortstr(self):
+        for tzinfo in (None, tzlocal()):
+            for dt, dtstr in (
+                    (datetime.datetime(2112, 9, 1, tzinfo=tzinfo),
+                     "21120901"),
+                    (datetime.datetime(2112, 9, 1, 12, 30, tzinfo=tzinfo),
+                     "21120901_123000")):
+                with self.subTest(dt=dt):
+                    self.assertEqual(dtutil.shortstr(dt), dtstr)
+                    self.assertEqual(dtutil.shortstr2dt(dtstr).replace(
+                        tzinfo=tzinfo), dt)
+
+
+if __name__ == "__main__":
+    unittest.main()
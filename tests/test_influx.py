@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import re
+import json
+import time
+import tempfile
+import threading
+import unittest
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+try:
+    import influxdb
+except ImportError:
+    influxdb = None
+
+from amulog import config
+from logdag import bench
+from logdag import log2event
+from util import DT_RANGE, open_test_config
+
+DBNAME = "log"
+
+
+class FakeInfluxHandler(BaseHTTPRequestHandler):
+    """InfluxDB /query endpoint serving SyntheticEvents,
+    for the queries issued by source.influx.InfluxDB."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._query(parse_qs(urlparse(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode("utf-8")
+        d_param = parse_qs(urlparse(self.path).query)
+        d_param.update(parse_qs(body))
+        self._query(d_param)
+
+    def _query(self, d_param):
+        server = self.server
+        with server.lock:
+            server.n_active += 1
+            server.max_active = max(server.max_active, server.n_active)
+        try:
+            # make concurrent queries overlap
+            time.sleep(0.01)
+            l_series = self._series(d_param["q"][0])
+        finally:
+            with server.lock:
+                server.n_active -= 1
+        body = json.dumps({"results": [{"statement_id": 0,
+                                        "series": l_series}]})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body.encode("utf-8"))
+
+    def _series(self, iql):
+        if iql.startswith("SHOW DATABASES"):
+            return [{"name": "databases", "columns": ["name"],
+                     "values": [[DBNAME]]}]
+        events = self.server.events
+        top, end = [int(v) * 10 ** 6 for v in re.search(
+            r"time >= (\d+)s AND time < (\d+)s", iql).groups()]
+        d_where = {}
+        for k, v in re.findall(r"\"(host|key)\" = '([^']*)'", iql):
+            d_where.setdefault(k, set()).add(v)
+        mo = re.search(r"time\((\w+)\)", iql)
+        binsize = None if mo is None else \
+            int(config.str2dur(mo.group(1)).total_seconds()) * 10 ** 6
+        group_tags = "GROUP BY" in iql and "\"host\"" in \
+            iql.partition("GROUP BY")[2]
+
+        l_series = []
+        for node in range(events.n_nodes):
+            tags = {"host": events.l_host[node], "key": str(node)}
+            if not all(tags[k] in s for k, s in d_where.items()):
+                continue
+            a_us = events.l_us[node]
+            a_us = a_us[(a_us >= top) & (a_us < end)]
+            if a_us.size == 0:
+                continue
+            if binsize is None:
+                values = [[int(t) * 1000, 1] for t in a_us]
+            else:
+                # aligned on epoch, with fill(0)
+                a_index = np.arange(top // binsize * binsize, end, binsize)
+                a_cnt = np.bincount((a_us - a_index[0]) // binsize,
+                                    minlength=a_index.size)
+                values = [[int(t) * 1000, int(cnt)]
+                          for t, cnt in zip(a_index, a_cnt)]
+            series = {"name": bench.MEASUREMENT,
+                      "columns": ["time", "val"], "values": values}
+            if group_tags:
+                series["tags"] = tags
+            l_series.append(series)
+        return l_series
+
+
+class InfluxEventLoader(bench.SyntheticEventLoader):
+    """Event definitions of SyntheticEvents, with the events
+    loaded from influxdb through evgen_common.EventLoader."""
+
+    def __init__(self, events, evdb):
+        from logdag.source import evgen_common
+        super().__init__(events)
+        self._loader = evgen_common.EventLoader(None)
+        self._loader.fields = self.fields
+        self._loader.evdb = evdb
+
+    def load(self, measure, tags, dt_range, binsize):
+        return self._loader.load(measure, tags, dt_range, binsize)
+
+    def load_array(self, measure, tags, dt_range):
+        return self._loader.load_array(measure, tags, dt_range)
+
+    def load_group(self, measure, l_tags, dt_range, binsize=None):
+        return self._loader.load_group(measure, l_tags, dt_range, binsize)
+
+
+@unittest.skipIf(influxdb is None, "influxdb not installed")
+class TestInfluxLoad(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.events = bench.SyntheticEvents(20, DT_RANGE, seed=1)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0),
+                                          FakeInfluxHandler)
+        self.server.daemon_threads = True
+        self.server.events = self.events
+        self.server.lock = threading.Lock()
+        self.server.n_active = 0
+        self.server.max_active = 0
+        self._thread = threading.Thread(target=self.server.serve_forever)
+        self._thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
+        self._tmpdir.cleanup()
+
+    def _makeinput(self, el, **kwargs):
+        conf = open_test_config(self._tmpdir.name, input_cache="none",
+                                **kwargs)
+        with log2event.registered_evloader(conf, log2event.SRCCLS_LOG, el):
+            return log2event.makeinput(conf, DT_RANGE, "all", True)
+
+    def _influx_loader(self):
+        from logdag.source import influx
+        evdb = influx.InfluxDB(DBNAME, {"host": "127.0.0.1",
+                                        "port": self.server.server_port})
+        return InfluxEventLoader(self.events, evdb)
+
+    def test_client_per_thread(self):
+        evdb = self._influx_loader()._loader.evdb
+        l_client = []
+        thread = threading.Thread(target=lambda: l_client.append(evdb.client))
+        thread.start()
+        thread.join()
+        self.assertIs(evdb.client, evdb.client)
+        self.assertIsNot(evdb.client, l_client[0])
+
+    def test_load_workers(self):
+        for method in ("sequential", "slide"):
+            for load_batch in ("false", "true"):
+                # 1 batch query for each host
+                opts = {"ci_bin_method": method, "ci_bin_size": "10m",
+                        "ci_bin_diff": "5m", "load_batch": load_batch,
+                        "load_batch_hosts": 1}
+                with self.subTest(method=method, load_batch=load_batch):
+                    expected, expected_evmap = self._makeinput(
+                        bench.SyntheticEventLoader(self.events),
+                        load_workers=1, **opts)
+
+                    l_result = []
+                    for n_workers in (1, 4):
+                        self.server.max_active = 0
+                        l_result.append(self._makeinput(
+                            self._influx_loader(), load_workers=n_workers,
+                            **opts))
+                        if n_workers == 1:
+                            self.assertEqual(self.server.max_active, 1)
+                        else:
+                            # queries are issued concurrently
+                            self.assertGreater(self.server.max_active, 1)
+
+                    for input_df, evmap in l_result:
+                        self.assertEqual(
+                            [str(evdef) for evdef in evmap.iter_evdef()],
+                            [str(evdef) for evdef
+                             in expected_evmap.iter_evdef()])
+                        self.assertEqual(list(input_df.columns),
+                                         list(expected.columns))
+                        self.assertTrue(input_df.index.equals(
+                            expected.index))
+                        np.testing.assert_array_equal(input_df.values,
+                                                      expected.values)
+                    self.assertGreater(expected.values.sum(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
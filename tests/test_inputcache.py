@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import datetime
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from logdag import arguments
+from logdag import bench
+from logdag import citest
+from logdag import log2event
+from logdag import makedag
+from logdag import inputcache
+from util import DT_RANGE, open_test_config
+
+
+class TestSeriesCache(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self._tmpdir.name, "input_cache")
+        hour = datetime.timedelta(hours=1)
+        self.l_window = [(DT_RANGE[0] + i * hour, DT_RANGE[0] + (i + 6) * hour)
+                         for i in range(4)]
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _fill(self, cache):
+        for i, dt_range in enumerate(self.l_window):
+            cache.put("series", dt_range, np.arange(i + 1))
+            cache.put("empty", dt_range, None)
+            # stored in order
+            os.utime(cache._window_dir(), (i, i))
+
+    def test_max_windows(self):
+        cache = inputcache.SeriesCache(self.cache_dir, max_windows=2)
+        self._fill(cache)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+        # another process sharing the directory
+        other = inputcache.SeriesCache(self.cache_dir, max_windows=2)
+        for i, dt_range in enumerate(self.l_window):
+            cached, array = other.get("series", dt_range)
+            if i < 2:
+                self.assertFalse(cached)
+            else:
+                self.assertTrue(cached)
+                np.testing.assert_array_equal(array, np.arange(i + 1))
+                self.assertEqual(other.get("empty", dt_range), (True, None))
+
+    def test_no_limit(self):
+        cache = inputcache.SeriesCache(self.cache_dir)
+        self._fill(cache)
+        self.assertEqual(len(os.listdir(self.cache_dir)), len(self.l_window))
+
+    def test_removed_window(self):
+        cache = inputcache.SeriesCache(self.cache_dir, max_windows=1)
+        other = inputcache.SeriesCache(self.cache_dir, max_windows=1)
+        cache.put("series", self.l_window[0], np.arange(3))
+        os.utime(cache._window_dir(), (0, 0))
+        # the window of cache is removed by the other process
+        other.put("series", self.l_window[1], np.arange(3))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        cache.put("another", self.l_window[0], np.arange(3))
+        self.assertFalse(other.get("series", self.l_window[0])[0])
+        self.assertTrue(cache.get("another", self.l_window[0])[0])
+
+
+class TestReuseInput(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.events = bench.SyntheticEvents(15, DT_RANGE, seed=3)
+        makedag._ci_cache = None
+        inputcache._series_cache = None
+
+    def tearDown(self):
+        makedag._ci_cache = None
+        inputcache._series_cache = None
+        self._tmpdir.cleanup()
+
+    def _conf(self, **kwargs):
+        opts = {"ci_func": "gsq_batch", "skeleton_engine": "native"}
+        opts.update(kwargs)
+        return open_test_config(self._tmpdir.name, **opts)
+
+    def _run(self, conf, reuse_input=True):
+        args = (conf, DT_RANGE, "all")
+        el = bench.SyntheticEventLoader(self.events)
+        with log2event.registered_evloader(conf, log2event.SRCCLS_LOG, el):
+            return makedag.makedag_main(args, reuse_input=reuse_input)
+
+    def test_round_trip(self):
+        for packed in (False, True):
+            conf = self._conf()
+            args = (conf, DT_RANGE, "all")
+            el = bench.SyntheticEventLoader(self.events)
+            with log2event.registered_evloader(conf, log2event.SRCCLS_LOG,
+                                               el):
+                input_df, evmap = log2event.makeinput(
+                    conf, DT_RANGE, "all", True, packed=packed)
+            evmap.dump(conf, args)
+            inputcache.dump_input(conf, args, input_df, True, packed)
+
+            with self.subTest(packed=packed):
+                loaded_df, loaded_evmap = inputcache.load_input(
+                    conf, args, True, packed)
+                self.assertIsNotNone(loaded_df)
+                self.assertEqual(list(loaded_evmap.iter_evdef()),
+                                 list(evmap.iter_evdef()))
+                if packed:
+                    self.assertIsInstance(loaded_df, citest.BitMatrix)
+                    np.testing.assert_array_equal(loaded_df.bits,
+                                                  input_df.bits)
+                    loaded_df = loaded_df.to_dataframe()
+                    input_df = input_df.to_dataframe()
+                self.assertTrue(loaded_df.equals(input_df))
+                self.assertTrue(loaded_df.index.equals(input_df.index))
+                # another binarize option is not reused
+                self.assertIsNone(inputcache.load_input(
+                    conf, args, False, packed)[0])
+
+    def test_reuse(self):
+        conf = self._conf()
+        args = (conf, DT_RANGE, "all")
+        expected = self._run(conf)
+        fp = arguments.ArgumentManager.input_path(conf, args,
+                                                  name="input_meta",
+                                                  ext="json")
+        self.assertTrue(os.path.exists(fp))
+
+        # events are not loaded again
+        with mock.patch.object(log2event, "makeinput",
+                               side_effect=AssertionError):
+            ldag = self._run(conf)
+        self.assertEqual(set(ldag.graph.edges()),
+                         set(expected.graph.edges()))
+        self.assertGreater(ldag.graph.number_of_edges(), 0)
+
+    def test_stale(self):
+        conf = self._conf(ci_bin_size="1m", ci_bin_diff="1m")
+        args = (conf, DT_RANGE, "all")
+        self._run(conf)
+        fingerprint = inputcache.input_fingerprint(conf, args, True, False)
+
+        conf["dag"]["ci_bin_size"] = "10m"
+        conf["dag"]["ci_bin_diff"] = "10m"
+        self.assertIsNone(inputcache.load_input(conf, args, True, False)[0])
+        with mock.patch.object(log2event, "makeinput",
+                               wraps=log2event.makeinput) as makeinput:
+            self._run(conf)
+        self.assertEqual(makeinput.call_count, 1)
+
+        # materialized again with the new config
+        self.assertNotEqual(
+            inputcache.input_fingerprint(conf, args, True, False),
+            fingerprint)
+        input_df, _ = inputcache.load_input(conf, args, True, False)
+        self.assertEqual(input_df.shape[0], 12 * 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import datetime
+import tempfile
+import unittest
+import multiprocessing
+from collections import Counter
+
+import networkx as nx
+from dateutil.tz import tzlocal
+
+from logdag import arguments
+from logdag import jobqueue
+from logdag import makedag
+from logdag import schedule
+from logdag import showdag
+
+
+def _fake_makedag_main(args, reuse_input=False):
+    conf = args[0]
+    runs_path = os.path.join(conf.get("dag", "output_dir"), "runs.log")
+    with open(runs_path, "a") as f:
+        f.write(arguments.args2name(args) + "\n")
+    graph = nx.DiGraph()
+    graph.add_nodes_from(range(3))
+    ldag = showdag.LogDAG(args, graph)
+    ldag.dump()
+    return ldag
+
+
+def _worker(conf_path):
+    conf = arguments.open_logdag_config(conf_path)
+    am = arguments.ArgumentManager(conf)
+    am.load()
+    jobqueue.run_worker(conf, am)
+
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.output_dir = os.path.join(self._tmpdir.name, "out")
+        self.conf_path = os.path.join(self._tmpdir.name, "test.conf")
+        with open(self.conf_path, "w") as f:
+            f.write("[general]\nlogging =\n\n"
+                    "[dag]\noutput_dir = {0}\nunit_term = 1d\n"
+                    "worker_lease = 10s\nworker_poll = 1s\n".format(
+                        self.output_dir))
+        self._makedag_main = makedag.makedag_main
+        makedag.makedag_main = _fake_makedag_main
+
+    def tearDown(self):
+        makedag.makedag_main = self._makedag_main
+        self._tmpdir.cleanup()
+
+    def _generate_args(self, conf):
+        # localized in the same way as whole_term
+        l_args = []
+        for day in range(1, 6):
+            dts = datetime.datetime(2112, 9, day, tzinfo=tzlocal())
+            dte = dts + datetime.timedelta(days=1)
+            for area in ("all", "host_a_b", "host_abcdefgh_ab1234"):
+                l_args.append((conf, (dts, dte), area))
+        return l_args
+
+    def test_jobname2args(self):
+        conf = arguments.open_logdag_config(self.conf_path)
+        for args in self._generate_args(conf):
+            name = arguments.args2name(args)
+            self.assertEqual(arguments.name2args(name, conf), args)
+
+        # parts of area names similar to the time
+        for area in ("host_abcdefgh_ab1234", "host_20200101_123456x",
+                     "host_20200101"):
+            for dtstr, dts in (
+                    ("20200102", datetime.datetime(2020, 1, 2)),
+                    ("20200102_123000", datetime.datetime(2020, 1, 2, 12,
+                                                          30))):
+                name = "_".join((area, dtstr))
+                with self.subTest(name=name):
+                    _, dt_range, loaded_area = arguments.name2args(name,
+                                                                   conf)
+                    self.assertEqual(loaded_area, area)
+                    self.assertEqual(dt_range[0],
+                                     dts.replace(tzinfo=tzlocal()))
+
+    def test_args_in_time(self):
+        conf = arguments.open_logdag_config(self.conf_path)
+        am = arguments.ArgumentManager(conf)
+        for args in self._generate_args(conf):
+            am.add(args)
+        am.dump()
+        am.load()
+
+        # naive datetimes in local time (e.g., given in command line),
+        # and timezone-aware ones (e.g., log messages in amulog)
+        naive = datetime.datetime(2112, 9, 2)
+        aware = naive.replace(tzinfo=tzlocal())
+        for dts in (naive, aware, aware.astimezone(datetime.timezone.utc)):
+            dt_range = (dts, dts + datetime.timedelta(days=1))
+            with self.subTest(dts=dts):
+                l_args = am.args_in_time(dt_range)
+                self.assertEqual([args[2] for args in l_args],
+                                 ["all", "host_a_b", "host_abcdefgh_ab1234"])
+                self.assertEqual(list(am.args_from_time(
+                    dts + datetime.timedelta(hours=1))), l_args)
+
+    def test_workers(self):
+        conf = arguments.open_logdag_config(self.conf_path)
+        am = arguments.ArgumentManager(conf)
+        l_args = self._generate_args(conf)
+        for args in l_args:
+            am.add(args)
+        am.dump()
+
+        ctx = multiprocessing.get_context("fork")
+        l_proc = [ctx.Process(target=_worker, args=(self.conf_path,))
+                  for _ in range(3)]
+        for proc in l_proc:
+            proc.start()
+        for proc in l_proc:
+            proc.join(60)
+            self.assertEqual(proc.exitcode, 0)
+
+        # every job is run exactly once among the workers
+        with open(os.path.join(self.output_dir, "runs.log")) as f:
+            runs = Counter(line.strip() for line in f)
+        self.assertEqual(runs, Counter(arguments.args2name(args)
+                                       for args in l_args))
+
+        queue = jobqueue.JobQueue(am, 10)
+        manifest = schedule.JobManifest(am)
+        for args in l_args:
+            self.assertTrue(queue.is_done(arguments.args2name(args)))
+            # recorded with args loaded from the args file
+            self.assertTrue(manifest.is_completed(conf, args))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import sys
+import pickle
+import contextlib
+import datetime
+import tempfile
+import unittest
+import tracemalloc
+from unittest import mock
+
+import numpy as np
+
+from logdag import arguments
+from logdag import log2event
+from logdag import bench
+from logdag import citest
+from logdag import inputcache
+from logdag import metrics
+from util import DT_RANGE, open_test_config
+
+
+def former_class(cls):
+    """Class of the former (not slotted) event definitions,
+    pickled with __dict__ as the state under the same name as cls."""
+    return type(cls.__name__, (object,), {"__module__": cls.__module__,
+                                          "__qualname__": cls.__qualname__})
+
+
+class TestEventDefinition(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.conf = open_test_config(self._tmpdir.name)
+        self.args = (self.conf, DT_RANGE, "all")
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _l_evdef(self):
+        from logdag.source import evgen_log, evgen_snmp
+        return [
+            evgen_log.LogEventDefinition(source="log", host="host1",
+                                         group="sshd", gid=3),
+            evgen_snmp.SNMPEventDefinition(
+                source="snmp", host="host1", group="interface",
+                measure="ifInOctets", direction="up",
+                mod_cls="eth", mod_id="0"),
+            bench.SyntheticEventDefinition(source="log", host="host2",
+                                           group="bench", gid=4),
+        ]
+
+    def test_former_pickle(self):
+        l_evdef = self._l_evdef()
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            with self.subTest(protocol=protocol):
+                # evdef file of former versions, with dict states and
+                # the reverse map keyed by str(evdef)
+                emap = {}
+                with contextlib.ExitStack() as stack:
+                    for eid, evdef in enumerate(l_evdef):
+                        cls = type(evdef)
+                        former_cls = former_class(cls)
+                        stack.enter_context(mock.patch.object(
+                            sys.modules[cls.__module__], cls.__name__,
+                            former_cls))
+                        emap[eid] = former_cls()
+                        emap[eid].__dict__.update(evdef.__getstate__())
+                    obj = (emap, {str(evdef): eid
+                                  for eid, evdef in enumerate(l_evdef)})
+                    fp = arguments.ArgumentManager.evdef_path(self.args)
+                    with open(fp, "wb") as f:
+                        pickle.dump(obj, f, protocol=protocol)
+
+                evmap = log2event.EventDefinitionMap()
+                evmap.load(self.conf, self.args)
+                for eid, evdef in enumerate(l_evdef):
+                    loaded = evmap.evdef(eid)
+                    self.assertIs(type(loaded), type(evdef))
+                    self.assertEqual(str(loaded), str(evdef))
+                    self.assertEqual(loaded, evdef)
+                    self.assertEqual(evmap.get_eid(evdef), eid)
+                    self.assertEqual(loaded.__getstate__(),
+                                     evdef.__getstate__())
+                    self.assertIs(loaded.host, sys.intern(evdef.host))
+
+    def test_pickle(self):
+        evmap = log2event.EventDefinitionMap()
+        for evdef in self._l_evdef():
+            evmap.add_evdef(evdef)
+        evmap.dump(self.conf, self.args)
+        loaded = log2event.EventDefinitionMap()
+        loaded.load(self.conf, self.args)
+        self.assertEqual(list(loaded.items()), list(evmap.items()))
+        # slots state given by the default reduction
+        for evdef in evmap.iter_evdef():
+            state = (None, evdef.__getstate__())
+            tmp_evdef = object.__new__(type(evdef))
+            tmp_evdef.__setstate__(state)
+            self.assertEqual(tmp_evdef, evdef)
+
+
+class TestMakeInput(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.conf_path = os.path.join(self._tmpdir.name, "test.conf")
+        with open(self.conf_path, "w") as f:
+            f.write("[general]\nlogging =\n\n[dag]\nsource = log\n")
+        top_dt = datetime.datetime(2112, 9, 1)
+        self.dt_range = (top_dt, top_dt + datetime.timedelta(hours=6))
+        self.events = bench.SyntheticEvents(20, self.dt_range, seed=1)
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _makeinput(self, packed=False, **kwargs):
+        conf = arguments.open_logdag_config(self.conf_path)
+        for key, val in kwargs.items():
+            conf["dag"][key] = str(val)
+        el = bench.SyntheticEventLoader(self.events)
+        with log2event.registered_evloader(conf, "log", el):
+            return log2event.makeinput(conf, self.dt_range, "all", True,
+                                       packed=packed)
+
+    def test_load_workers(self):
+        input_df, evmap = self._makeinput(load_workers=2)
+        self.assertEqual(len(evmap), input_df.shape[1])
+        self.assertGreater(len(evmap), 0)
+
+    def test_load_workers_same_input(self):
+        for method in ("sequential", "slide"):
+            for load_batch in ("false", "true"):
+                opts = {"ci_bin_method": method, "ci_bin_size": "10m",
+                        "ci_bin_diff": "1m", "load_batch": load_batch}
+                df1, evmap1 = self._makeinput(load_workers=1, **opts)
+                df4, evmap4 = self._makeinput(load_workers=4, **opts)
+                self.assertEqual([str(evdef) for evdef in evmap1.iter_evdef()],
+                                 [str(evdef) for evdef in evmap4.iter_evdef()])
+                self.assertTrue(df1.equals(df4))
+
+
+    def test_packed_batch(self):
+        dense, evmap1 = self._makeinput(load_batch="true")
+        inputcache._series_cache = None
+        for input_cache in ("none", "memory"):
+            # the second run is served from the cache
+            for _ in range(2):
+                packed, evmap2 = self._makeinput(
+                    load_batch="true", input_cache=input_cache, packed=True)
+                self.assertIsInstance(packed, citest.BitMatrix)
+                self.assertEqual(list(evmap1.iter_evdef()),
+                                 list(evmap2.iter_evdef()))
+                self.assertTrue(packed.to_dataframe().equals(
+                    (dense > 0).astype(np.uint8)))
+        self.assertGreater(inputcache._series_cache.hits, 0)
+        inputcache._series_cache = None
+
+    def test_packed_batch_memory(self):
+        top_dt = self.dt_range[0]
+        self.dt_range = (top_dt, top_dt + datetime.timedelta(days=1))
+        self.events = bench.SyntheticEvents(200, self.dt_range, seed=1)
+        # series are loaded as timestamps with ci_bin_method slide
+        opts = {"load_batch": "true", "ci_bin_method": "slide",
+                "ci_bin_size": "10s", "ci_bin_diff": "10s", "packed": True}
+        self._makeinput(**opts)
+        tracemalloc.start()
+        try:
+            packed, _ = self._makeinput(**opts)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        # smaller than the int64 matrix
+        self.assertLess(peak, packed.shape[0] * packed.shape[1] * 8 / 4)
+
+
+class TestSlidingWindowInput(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        top_dt = datetime.datetime(2112, 9, 1)
+        self.events = bench.SyntheticEvents(
+            20, (top_dt, top_dt + datetime.timedelta(days=1)), seed=1)
+        self.top_dt = top_dt
+
+    def tearDown(self):
+        log2event._window_inputs.clear()
+        self._tmpdir.cleanup()
+
+    def _conf(self, **kwargs):
+        return open_test_config(self._tmpdir.name, input_cache="none",
+                                load_batch="true", **kwargs)
+
+    def _windows(self, l_minute, term=datetime.timedelta(hours=6)):
+        return [(self.top_dt + datetime.timedelta(minutes=m),
+                 self.top_dt + datetime.timedelta(minutes=m) + term)
+                for m in l_minute]
+
+    def _assert_same(self, l_dt_range, binarize, **kwargs):
+        """Returns:
+            list: the number of reused bins in each window."""
+        # builders of former options are not reused
+        log2event._window_inputs.clear()
+        el = bench.SyntheticEventLoader(self.events)
+        conf = self._conf(input_incremental="true", **kwargs)
+        l_reused = []
+        with log2event.registered_evloader(conf, log2event.SRCCLS_LOG, el):
+            for dt_range in l_dt_range:
+                with metrics.collect() as job_metrics:
+                    input_df, evmap = log2event.makeinput(
+                        conf, dt_range, "all", binarize)
+                l_reused.append(job_metrics.counters["input.bins_reused"])
+
+                conf_expected = self._conf(input_incremental="false",
+                                           **kwargs)
+                with log2event.registered_evloader(
+                        conf_expected, log2event.SRCCLS_LOG, el):
+                    expected, expected_evmap = log2event.makeinput(
+                        conf_expected, dt_range, "all", binarize)
+                self.assertEqual(list(evmap.iter_evdef()),
+                                 list(expected_evmap.iter_evdef()),
+                                 dt_range)
+                self.assertTrue(input_df.index.equals(expected.index))
+                self.assertEqual(list(input_df.columns),
+                                 list(expected.columns))
+                np.testing.assert_array_equal(input_df.values,
+                                              expected.values)
+                self.assertGreater(input_df.shape[1], 0)
+        return l_reused
+
+    def test_overlapping(self):
+        for method in ("sequential", "slide", "radius"):
+            for binarize in (True, False):
+                with self.subTest(method=method, binarize=binarize):
+                    l_reused = self._assert_same(
+                        self._windows([0, 60, 120, 150]), binarize,
+                        ci_bin_method=method, ci_bin_size="10m",
+                        ci_bin_diff="5m")
+                    self.assertEqual(l_reused[0], 0)
+                    if method == "radius":
+                        self.assertEqual(sum(l_reused), 0)
+                    else:
+                        self.assertTrue(all(n > 0 for n in l_reused[1:]))
+
+    def test_not_overlapping(self):
+        for method in ("sequential", "slide"):
+            with self.subTest(method=method):
+                l_reused = self._assert_same(
+                    self._windows([0, 360, 720]), True,
+                    ci_bin_method=method, ci_bin_size="10m",
+                    ci_bin_diff="10m")
+                self.assertEqual(sum(l_reused), 0)
+
+    def test_misaligned(self):
+        for method in ("sequential", "slide"):
+            with self.subTest(method=method):
+                # windows overlapping but not aligned on the bins
+                # of the former window
+                l_reused = self._assert_same(
+                    self._windows([0, 7, 67, 120]), True,
+                    ci_bin_method=method, ci_bin_size="10m",
+                    ci_bin_diff="10m")
+                self.assertEqual(l_reused[:2], [0, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import tempfile
+import unittest
+
+from logdag import arguments
+from logdag import bench
+from logdag import log2event
+from logdag import makedag
+from util import DT_RANGE, open_test_config
+
+
+def edge_set(graph):
+    return set(graph.edges())
+
+
+class TestMakeDag(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.events = bench.SyntheticEvents(15, DT_RANGE, seed=3)
+        makedag._ci_cache = None
+
+    def tearDown(self):
+        makedag._ci_cache = None
+        self._tmpdir.cleanup()
+
+    def _run(self, conf, **kwargs):
+        args = (conf, DT_RANGE, "all")
+        el = bench.SyntheticEventLoader(self.events)
+        with log2event.registered_evloader(conf, log2event.SRCCLS_LOG, el):
+            return makedag.makedag_main(args, **kwargs)
+
+    def _conf(self, name, **kwargs):
+        dirname = os.path.join(self._tmpdir.name, name)
+        os.makedirs(dirname)
+        opts = {"ci_func": "gsq_batch", "skeleton_engine": "native"}
+        opts.update(kwargs)
+        return open_test_config(dirname, **opts)
+
+    def test_ci_cache_persist(self):
+        conf = self._conf("cached", ci_cache_size=100000,
+                          ci_cache_persist="true",
+                          skeleton_threshold=0.01)
+        self._run(conf)
+        args = (conf, DT_RANGE, "all")
+        fp = arguments.ArgumentManager.citest_cache_path(conf, args)
+        self.assertTrue(os.path.exists(fp))
+
+        # another process (without the cache in memory)
+        # with another threshold
+        makedag._ci_cache = None
+        conf["dag"]["skeleton_threshold"] = "0.05"
+        ldag = self._run(conf)
+        self.assertGreater(makedag._ci_cache.hits, 0)
+
+        expected = self._run(self._conf("uncached",
+                                        skeleton_threshold=0.05))
+        self.assertEqual(edge_set(ldag.graph), edge_set(expected.graph))
+        self.assertGreater(ldag.graph.number_of_edges(), 0)
+
+
+    def test_threshold_sweep(self):
+        l_th = [0.05, 0.01, 0.001]
+        for engine in ("native", "pcalg"):
+            conf = self._conf("sweep_" + engine, skeleton_engine=engine)
+            el = bench.SyntheticEventLoader(self.events)
+            with log2event.registered_evloader(conf, log2event.SRCCLS_LOG,
+                                               el):
+                input_df, evmap = log2event.makeinput(conf, DT_RANGE,
+                                                      "all", True)
+            init_graph = makedag._complete_graph(evmap.eids())
+            d_graph = makedag.estimate_dag_sweep(conf, input_df, "gsq_batch",
+                                                 l_th, init_graph,
+                                                 evmap=evmap)
+            self.assertEqual(set(d_graph), set(l_th))
+            l_edges = []
+            for th in l_th:
+                conf["dag"]["skeleton_threshold"] = str(th)
+                graph = makedag.estimate_dag(conf, input_df, "gsq_batch",
+                                             init_graph.copy(), evmap=evmap)
+                self.assertEqual(edge_set(d_graph[th]), edge_set(graph),
+                                 (engine, th))
+                l_edges.append(edge_set(graph))
+            # the thresholds give different DAGs
+            self.assertGreater(len(set(map(frozenset, l_edges))), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
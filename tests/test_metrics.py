@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import datetime
+import tempfile
+import unittest
+from unittest import mock
+
+from logdag import arguments
+from logdag import bench
+from logdag import log2event
+from logdag import makedag
+from logdag import metrics
+from util import DT_RANGE, open_test_config
+
+
+class _FailingSink(object):
+
+    def emit(self, conf, args, d_metrics):
+        raise OSError("failed sink")
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.events = bench.SyntheticEvents(10, DT_RANGE, seed=2)
+        makedag._ci_cache = None
+
+    def tearDown(self):
+        makedag._ci_cache = None
+        self._tmpdir.cleanup()
+
+    def _conf(self, **kwargs):
+        opts = {"ci_func": "gsq_batch", "skeleton_engine": "native"}
+        opts.update(kwargs)
+        return open_test_config(self._tmpdir.name, **opts)
+
+    def _run(self, conf):
+        args = (conf, DT_RANGE, "all")
+        el = bench.SyntheticEventLoader(self.events)
+        with log2event.registered_evloader(conf, log2event.SRCCLS_LOG, el):
+            return makedag.makedag_main(args)
+
+    def test_noop(self):
+        self.assertFalse(metrics.enabled())
+        with metrics.timer("stage"):
+            metrics.incr("counter")
+            metrics.add_time("stage", 1.)
+
+        # stages record nothing without sinks
+        conf = self._conf()
+        with mock.patch.object(metrics.Metrics, "add_time",
+                               side_effect=AssertionError), \
+                mock.patch.object(metrics.Metrics, "incr",
+                                  side_effect=AssertionError):
+            ldag = self._run(conf)
+        self.assertGreater(ldag.graph.number_of_edges(), 0)
+        self.assertFalse(os.path.exists(
+            arguments.ArgumentManager.metrics_path(conf, ldag.args)))
+
+        # restored after nested collect
+        with metrics.collect() as outer:
+            with metrics.collect() as inner:
+                metrics.incr("counter")
+            metrics.incr("counter", 2)
+        self.assertFalse(metrics.enabled())
+        self.assertEqual(inner.counters, {"counter": 1})
+        self.assertEqual(outer.counters, {"counter": 2})
+
+    def test_json_sink(self):
+        conf = self._conf(metrics_sink="json")
+        ldag = self._run(conf)
+        d_metrics = metrics.load_metrics(conf, ldag.args)
+        self.assertEqual(d_metrics["job"], arguments.args2name(ldag.args))
+        self.assertEqual(d_metrics["status"], "done")
+        for name in ("job", "input", "prune", "estimate", "dump"):
+            self.assertEqual(d_metrics["timers"][name]["count"], 1)
+        self.assertGreaterEqual(
+            d_metrics["timers"]["job"]["time"],
+            d_metrics["timers"]["estimate"]["time"])
+        self.assertEqual(d_metrics["counters"]["input.nodes"],
+                         ldag.graph.number_of_nodes())
+        self.assertEqual(d_metrics["counters"]["dag.edges"],
+                         ldag.graph.number_of_edges())
+
+        # failed jobs, and errors in the other sinks
+        with mock.patch.dict(metrics.SINKS, {"fail": _FailingSink}):
+            conf["dag"]["metrics_sink"] = "fail, json"
+            with mock.patch.object(makedag, "_makedag_main",
+                                   side_effect=RuntimeError("failed job")):
+                with self.assertLogs("logdag", level="WARNING"):
+                    with self.assertRaises(RuntimeError):
+                        self._run(conf)
+        d_metrics = metrics.load_metrics(conf, ldag.args)
+        self.assertEqual(d_metrics["status"], "failed")
+        self.assertIn("job", d_metrics["timers"])
+
+        conf["dag"]["metrics_sink"] = "invalid"
+        with self.assertRaises(ValueError):
+            self._run(conf)
+
+    def test_report(self):
+        conf = self._conf()
+        am = arguments.ArgumentManager(conf)
+        for day in range(3):
+            dts = DT_RANGE[0] + datetime.timedelta(days=day)
+            am.add((conf, (dts, dts + datetime.timedelta(days=1)), "all"))
+        self.assertEqual(metrics.report(conf, am),
+                         "no job metrics found (see [dag] metrics_sink)")
+
+        # the last job without metrics
+        sink = metrics.JSONFileSink()
+        for args, sec, n in zip(am[:2], (1., 3.), (10, 4)):
+            job_metrics = metrics.Metrics()
+            job_metrics.add_time("input", sec)
+            job_metrics.add_time("input", sec)
+            job_metrics.incr("input.nodes", n)
+            if n == 4:
+                job_metrics.incr("dag.edges", 5)
+            metrics.emit(conf, args, job_metrics, [sink], status="done")
+        self.assertEqual(metrics.load_metrics(conf, am[0])["timers"]["input"],
+                         {"time": 2., "count": 2})
+
+        l_line = metrics.report(conf, am).splitlines()
+        self.assertEqual(l_line[0], "2 jobs (1 without metrics)")
+        d_row = {}
+        for line in l_line[2:]:
+            # timers are named with (s)
+            name, *row = line.replace(" (s)", "(s)").split()
+            d_row[name] = row
+        job1 = arguments.args2name(am[1])
+        job0 = arguments.args2name(am[0])
+        self.assertEqual(d_row["input(s)"],
+                         ["8.000", "4.000", "6.000", job1, "4"])
+        self.assertEqual(d_row["input.nodes"], ["14", "7.0", "10", job0])
+        self.assertEqual(d_row["dag.edges"], ["5", "5.0", "5", job1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import unittest
+from itertools import combinations
+
+import numpy as np
+import networkx as nx
+import pcalg
+
+from logdag import citest
+from logdag import pc_native
+from util import random_binary
+
+
+def random_init_graph(n_nodes, seed=0):
+    rng = np.random.default_rng(seed)
+    graph = nx.Graph()
+    graph.add_nodes_from(range(n_nodes))
+    graph.add_edges_from((i, j) for i, j in combinations(range(n_nodes), 2)
+                         if rng.random() < 0.7)
+    return graph
+
+
+class TestPCNative(unittest.TestCase):
+
+    alpha = 0.01
+
+    def setUp(self):
+        self.data = random_binary(1000, 10, seed=2)
+        self.n_nodes = self.data.shape[1]
+
+    def _pcalg(self, method, init_graph, depth):
+        kwargs = {"method": method}
+        if init_graph is not None:
+            kwargs["init_graph"] = init_graph.copy()
+        if depth is not None:
+            kwargs["max_reach"] = depth
+        return pcalg.estimate_skeleton(citest.GSquareBatch(self.data),
+                                       self.data, self.alpha, **kwargs)
+
+    def _native(self, method, init_graph, depth, n_workers=1):
+        if init_graph is None:
+            init_adj = None
+        else:
+            init_adj = pc_native.graph2adj(init_graph, self.n_nodes)
+        return pc_native.estimate_skeleton(
+            citest.GSquareBatch(self.data), self.n_nodes, self.alpha,
+            init_adj=init_adj, max_depth=depth, method=method,
+            n_workers=n_workers)
+
+    def _assert_same(self, method, init_graph, depth):
+        skel, sep_set = self._pcalg(method, init_graph, depth)
+        adj, native_sep_set = self._native(method, init_graph, depth)
+
+        self.assertEqual(
+            set(map(frozenset, skel.edges())),
+            set(map(frozenset, nx.Graph(pc_native.adj2digraph(adj)).edges())))
+        for i, j in combinations(range(self.n_nodes), 2):
+            self.assertEqual(native_sep_set.get(i, j), sep_set[i][j],
+                             (i, j))
+        cpdag = pcalg.estimate_cpdag(skel_graph=skel, sep_set=sep_set)
+        native_cpdag = pc_native.adj2digraph(
+            pc_native.estimate_cpdag(adj, native_sep_set))
+        self.assertEqual(set(cpdag.edges()), set(native_cpdag.edges()))
+        # the skeleton is not trivial
+        self.assertGreater(skel.number_of_edges(), 0)
+        self.assertGreater(len(sep_set), 0)
+
+    def test_same_as_pcalg(self):
+        for method in ("default", "stable"):
+            for init_graph in (None, random_init_graph(self.n_nodes)):
+                for depth in (None, 1):
+                    with self.subTest(method=method,
+                                      init_graph=init_graph is not None,
+                                      depth=depth):
+                        self._assert_same(method, init_graph, depth)
+
+    def test_workers(self):
+        for init_graph in (None, random_init_graph(self.n_nodes)):
+            l_search = []
+            for n_workers in (1, 3):
+                if init_graph is None:
+                    init_adj = None
+                else:
+                    init_adj = pc_native.graph2adj(init_graph, self.n_nodes)
+                search = pc_native.SkeletonSearch(
+                    citest.GSquareBatch(self.data), self.n_nodes, self.alpha,
+                    init_adj=init_adj, method="stable", n_workers=n_workers)
+                self.assertEqual(search.n_workers, n_workers)
+                search.run()
+                l_search.append(search)
+            search1, search3 = l_search
+            np.testing.assert_array_equal(search1.adj, search3.adj)
+            self.assertEqual(dict(search1.sep_set.items()),
+                             dict(search3.sep_set.items()))
+            self.assertEqual(search1.n_tests, search3.n_tests)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import json
+import tempfile
+import unittest
+from itertools import combinations
+from unittest import mock
+
+import numpy as np
+import networkx as nx
+
+from logdag import bench
+from logdag import log2event
+from logdag import makedag
+from logdag import prune
+from util import open_test_config
+
+
+def random_topology(n_hosts, n_edges, seed=0):
+    net = nx.gnm_random_graph(n_hosts, n_edges, seed=seed)
+    return nx.relabel_nodes(net, {i: "host{0}".format(i)
+                                  for i in range(n_hosts)})
+
+
+def dump_topology(net, fp):
+    with open(fp, "w", encoding="utf-8") as f:
+        json.dump(nx.node_link_data(net), f)
+
+
+def random_evmap(n_events, n_hosts, l_group, seed=0):
+    """Events on the hosts, including hosts not in the topology."""
+    rng = np.random.default_rng(seed)
+    evmap = log2event.EventDefinitionMap()
+    for gid in range(n_events):
+        host = "host{0}".format(rng.integers(n_hosts + 2))
+        group = l_group[rng.integers(len(l_group))]
+        evmap.add_evdef(bench.SyntheticEventDefinition(
+            source="log", host=host, group=group, gid=gid))
+    return evmap
+
+
+class _PruneTestCase(unittest.TestCase):
+
+    n_hosts = 12
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.conf = open_test_config(self._tmpdir.name)
+        prune._topologies.clear()
+
+        self.d_net = {}
+        for seed, name in enumerate(["single", "l2", "l3"]):
+            net = random_topology(self.n_hosts, 15, seed=seed)
+            fp = os.path.join(self._tmpdir.name, name + ".json")
+            dump_topology(net, fp)
+            self.d_net[name] = (net, fp)
+        conf = self.conf["pc_prune"]
+        conf["do_pruning"] = "true"
+        conf["single_network_file"] = self.d_net["single"][1]
+        conf["multi_network_file"] = ", ".join(
+            ["{0}:{1}".format(name, self.d_net[name][1])
+             for name in ("l2", "l3")])
+        conf["multi_network_group"] = "interface:l2, egp:l3"
+        self.evmap = random_evmap(60, self.n_hosts,
+                                  ["interface", "egp", "system"])
+
+    def tearDown(self):
+        prune._topologies.clear()
+        self._tmpdir.cleanup()
+
+    def _prune_graph(self):
+        g = makedag._complete_graph(self.evmap.eids())
+        return prune.prune_graph(g, self.conf, self.evmap)
+
+
+class TestPrune(_PruneTestCase):
+
+    def test_same_as_prune_graph(self):
+        for methods in ("topology", "multi-topology", "independent",
+                        "topology, multi-topology"):
+            self.conf["pc_prune"]["methods"] = methods
+            with self.subTest(methods=methods):
+                expected = self._prune_graph()
+                l_edge = prune.candidate_edges(self.conf, self.evmap)
+                self.assertEqual(set(map(frozenset, l_edge)),
+                                 set(map(frozenset, expected.edges())))
+                self.assertEqual(len(l_edge), len(set(l_edge)))
+
+                graph = prune.pruned_graph(self.conf, self.evmap)
+                self.assertEqual(set(graph.nodes()),
+                                 set(expected.nodes()))
+                self.assertEqual(set(map(frozenset, graph.edges())),
+                                 set(map(frozenset, expected.edges())))
+                self.assertGreater(graph.number_of_edges(), 0)
+                self.assertLess(graph.number_of_edges(),
+                                len(self.evmap) *
+                                (len(self.evmap) - 1) // 2)
+
+    def test_empty(self):
+        self.conf["pc_prune"]["methods"] = "topology"
+        evmap = log2event.EventDefinitionMap()
+        self.assertEqual(prune.candidate_edges(self.conf, evmap), [])
+        self.assertEqual(prune.pruned_graph(self.conf, evmap).order(), 0)
+
+
+class TestKHopTopology(_PruneTestCase):
+
+    def test_reachability(self):
+        net, fp = self.d_net["single"]
+        # disconnected components and isolated hosts
+        net.add_edges_from(nx.path_graph(["p0", "p1", "p2", "p3"]).edges())
+        net.add_node("isolated")
+        dump_topology(net, fp)
+        topo = prune.load_topology(fp)
+        l_host = list(topo.hosts)
+        for hops in range(5):
+            with self.subTest(hops=hops):
+                reach = topo.reachability(hops).toarray()
+                for src, host in enumerate(l_host):
+                    expected = set(nx.single_source_shortest_path_length(
+                        net, host, cutoff=hops))
+                    self.assertEqual({l_host[dst] for dst
+                                      in np.nonzero(reach[src])[0]},
+                                     expected)
+
+    def test_host_reachability(self):
+        net, fp = self.d_net["single"]
+        topo = prune.load_topology(fp)
+        # including hosts not in the topology
+        l_host = ["host3", "unknown", "host0", "host7", "host11"]
+        for hops in (1, 2, 3):
+            host_reach = topo.host_reachability(l_host, hops)
+            for i, src in enumerate(l_host):
+                for j, dst in enumerate(l_host):
+                    if src in net and dst in net:
+                        expected = nx.has_path(net, src, dst) and \
+                            nx.shortest_path_length(net, src, dst) <= hops
+                    else:
+                        expected = False
+                    self.assertEqual(host_reach[i, j], expected,
+                                     (src, dst, hops))
+
+    def test_same_as_prune_graph(self):
+        net = self.d_net["single"][0]
+        for methods in ("khop-topology", "multi-topology, khop-topology"):
+            for hops in (1, 2, 3):
+                self.conf["pc_prune"]["methods"] = methods
+                self.conf["pc_prune"]["khop_distance"] = str(hops)
+                with self.subTest(methods=methods, hops=hops):
+                    expected = self._prune_graph()
+                    graph = prune.pruned_graph(self.conf, self.evmap)
+                    self.assertEqual(set(map(frozenset, graph.edges())),
+                                     set(map(frozenset, expected.edges())))
+                    self.assertGreater(graph.number_of_edges(), 0)
+
+        # k-hop edges between hosts
+        self.conf["pc_prune"]["methods"] = "khop-topology"
+        for hops in (1, 2, 3):
+            self.conf["pc_prune"]["khop_distance"] = str(hops)
+            graph = prune.pruned_graph(self.conf, self.evmap)
+            for u, v in graph.edges():
+                src = self.evmap.evdef(u).host
+                dst = self.evmap.evdef(v).host
+                if src != dst:
+                    self.assertLessEqual(
+                        nx.shortest_path_length(net, src, dst), hops)
+            for u, v in combinations(self.evmap.eids(), 2):
+                src = self.evmap.evdef(u).host
+                dst = self.evmap.evdef(v).host
+                if src == dst or (src in net and dst in net and
+                                  nx.has_path(net, src, dst) and
+                                  nx.shortest_path_length(net, src, dst)
+                                  <= hops):
+                    self.assertTrue(graph.has_edge(u, v))
+
+
+class TestTopologyCache(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.conf = open_test_config(self._tmpdir.name)
+        self.net = random_topology(8, 10)
+        self.net_dir = os.path.join(self._tmpdir.name, "network")
+        os.makedirs(self.net_dir)
+        self.net_fp = os.path.join(self.net_dir, "topology.json")
+        dump_topology(self.net, self.net_fp)
+        self.conf["pc_prune"]["methods"] = "topology"
+        self.conf["pc_prune"]["single_network_file"] = self.net_fp
+        prune._topologies.clear()
+
+    def tearDown(self):
+        prune._topologies.clear()
+        self._tmpdir.cleanup()
+
+    def _load(self):
+        # as in a new process
+        prune._topologies.clear()
+        pruner, = prune.init_pruner(self.conf)
+        return pruner._topology
+
+    def _assert_topology(self, topo):
+        for u, v in self.net.edges():
+            self.assertTrue(topo.has_edge(u, v))
+            self.assertTrue(topo.has_edge(v, u))
+        self.assertEqual(len(topo.indices), 2 * self.net.number_of_edges())
+
+    def test_default_cache_dir(self):
+        self._assert_topology(self._load())
+        cache_dir = os.path.join(self.conf.get("dag", "output_dir"),
+                                 "topology_cache")
+        self.assertEqual(prune.topology_cache_dir(self.conf), cache_dir)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        # nothing is written beside the network file
+        self.assertEqual(os.listdir(self.net_dir), ["topology.json"])
+
+        # loaded from the compiled file
+        with mock.patch.object(prune.CompiledTopology, "from_graph",
+                               side_effect=AssertionError):
+            self._assert_topology(self._load())
+
+        # compiled again after the network file is updated
+        self.net.add_edge("host0", "host7")
+        self.net.add_edge("host1", "host6")
+        dump_topology(self.net, self.net_fp)
+        self._assert_topology(self._load())
+
+    def test_write_failure(self):
+        # cache directory under a regular file
+        fp = os.path.join(self._tmpdir.name, "file")
+        with open(fp, "w") as f:
+            f.write("")
+        self.conf["pc_prune"]["topology_cache_dir"] = os.path.join(fp, "dir")
+        with self.assertLogs("logdag", level="WARNING"):
+            self._assert_topology(self._load())
+
+    def test_broken_cache(self):
+        self._load()
+        cache_dir = prune.topology_cache_dir(self.conf)
+        cache_fp = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+        with open(cache_fp, "wb") as f:
+            f.write(b"broken")
+        with self.assertLogs("logdag", level="WARNING"):
+            self._assert_topology(self._load())
+        # saved again
+        with mock.patch.object(prune.CompiledTopology, "from_graph",
+                               side_effect=AssertionError):
+            self._assert_topology(self._load())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import argparse
+import datetime
+import tempfile
+import unittest
+import multiprocessing.pool
+from unittest import mock
+
+import networkx as nx
+
+from logdag import arguments
+from logdag import __main__
+from logdag import bench
+from logdag import log2event
+from logdag import makedag
+from logdag import schedule
+from logdag import showdag
+from util import DT_RANGE, open_test_config
+
+
+def _fake_makedag_main(args, reuse_input=False):
+    """DAG with the nodes given in the area name (e.g., nodes3),
+    and 1 more node if reuse_input. Area fail raises an error,
+    and area truncated gives a truncated DAG."""
+    conf, _, area = args
+    if area == "fail":
+        raise RuntimeError("failed job")
+    graph = nx.DiGraph()
+    if area == "truncated":
+        graph.graph["truncated"] = True
+        graph.add_node(0)
+    else:
+        graph.add_nodes_from(range(int(area[len("nodes"):]) +
+                                   int(reuse_input)))
+    ldag = showdag.LogDAG(args, graph)
+    ldag.dump()
+    return ldag
+
+
+class TestSchedule(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.conf = open_test_config(self._tmpdir.name, unit_term="1d",
+                                     unit_diff="1d")
+        self._makedag_main = makedag.makedag_main
+        makedag.makedag_main = _fake_makedag_main
+
+    def tearDown(self):
+        makedag.makedag_main = self._makedag_main
+        self._tmpdir.cleanup()
+
+    def _args(self, l_area, n_days=1):
+        l_args = []
+        for day in range(n_days):
+            dts = DT_RANGE[0] + datetime.timedelta(days=day)
+            for area in l_area:
+                l_args.append((self.conf, (dts, dts + datetime.timedelta(
+                    days=1)), area))
+        return l_args
+
+    @staticmethod
+    def _dump_evmap(args, n_nodes):
+        evmap = log2event.EventDefinitionMap()
+        for gid in range(n_nodes):
+            evmap.add_evdef(bench.SyntheticEventDefinition(
+                source="log", host="host0", group="bench", gid=gid))
+        evmap.dump(args[0], args)
+
+    def test_order_jobs(self):
+        l_area = ["a", "b", "c", "d", "e", "f"]
+        l_args = self._args(l_area)
+        # number of nodes in the former runs, None if not run
+        d_nodes = {"a": 3, "b": 10, "c": 3, "d": None, "e": 25, "f": 0}
+        for args in l_args:
+            n_nodes = d_nodes[args[2]]
+            if n_nodes is not None:
+                self._dump_evmap(args, n_nodes)
+
+        self.conf["dag"]["job_order"] = "args"
+        self.assertEqual(schedule.order_jobs(self.conf, l_args), l_args)
+
+        self.conf["dag"]["job_order"] = "lpt"
+        # jobs without former runs are estimated with the sources
+        events = bench.SyntheticEvents(20, (DT_RANGE[0], DT_RANGE[0] +
+                                            datetime.timedelta(days=1)))
+        el = bench.SyntheticEventLoader(events)
+        with log2event.registered_evloader(self.conf, log2event.SRCCLS_LOG,
+                                           el):
+            d_nodes["d"] = len(list(el.iter_evdef(l_args[3][1])))
+            l_order = schedule.order_jobs(self.conf, l_args)
+        l_cost = [schedule.estimate_cost(args) for args in l_order]
+        self.assertEqual([args[2] for args in l_order],
+                         ["e", "d", "b", "a", "c", "f"])
+        # the cost of d is not stored in the former runs
+        self.assertEqual(l_cost[:1] + l_cost[2:],
+                         [25 ** 2, 10 ** 2, 3 ** 2, 3 ** 2, 0])
+        self.assertGreater(d_nodes["d"], 10)
+
+        self.conf["dag"]["job_order"] = "invalid"
+        with self.assertRaises(ValueError):
+            schedule.order_jobs(self.conf, l_args)
+
+    def test_run_jobs(self):
+        l_args = self._args(["nodes1", "nodes5", "fail", "nodes3"],
+                            n_days=3)
+        self.conf["dag"]["job_order"] = "lpt"
+        # costs of all jobs are given in the former runs
+        for args in l_args:
+            if args[2] == "fail":
+                self._dump_evmap(args, 2)
+            else:
+                self._dump_evmap(args, int(args[2][len("nodes"):]))
+
+        imap_unordered = multiprocessing.pool.Pool.imap_unordered
+        for n_proc in (1, 3):
+            for reuse_input in (False, True):
+                with self.subTest(n_proc=n_proc, reuse_input=reuse_input):
+                    am = arguments.ArgumentManager(self.conf)
+                    if os.path.exists(am.manifest_path):
+                        os.remove(am.manifest_path)
+                    manifest = schedule.JobManifest(am)
+                    with mock.patch.object(
+                            multiprocessing.pool.Pool, "imap_unordered",
+                            autospec=True,
+                            side_effect=imap_unordered) as dispatch:
+                        l_result = schedule.run_jobs(
+                            self.conf, l_args, n_proc=n_proc,
+                            reuse_input=reuse_input, manifest=manifest)
+                    if n_proc > 1:
+                        # dispatched in descending order of the cost
+                        (_, _, l_jobname), _ = dispatch.call_args
+                        l_cost = [schedule.estimate_cost(
+                            arguments.name2args(jobname, self.conf))
+                            for jobname in l_jobname]
+                        self.assertEqual(l_cost,
+                                         sorted(l_cost, reverse=True))
+                        self.assertEqual(len(l_jobname), len(l_args))
+                    else:
+                        dispatch.assert_not_called()
+                    # every job exactly once
+                    self.assertEqual(
+                        sorted(result["job"] for result in l_result),
+                        sorted(arguments.args2name(args)
+                               for args in l_args))
+                    for result in l_result:
+                        args = arguments.name2args(result["job"], self.conf)
+                        area = args[2]
+                        record = schedule.JobManifest(am).get(result["job"])
+                        self.assertEqual(record["status"], result["status"])
+                        if area == "fail":
+                            self.assertEqual(result["status"], "failed")
+                            self.assertIn("failed job", result["error"])
+                            self.assertIsNone(result["nodes"])
+                        else:
+                            self.assertEqual(result["status"], "done")
+                            # reuse_input given to the workers
+                            self.assertEqual(
+                                result["nodes"],
+                                int(area[len("nodes"):]) + int(reuse_input))
+
+
+    def test_resume(self):
+        l_args = self._args(["nodes1", "nodes2", "truncated", "fail"])
+        d_args = {args[2]: args for args in l_args}
+        am = arguments.ArgumentManager(self.conf)
+        schedule.run_jobs(self.conf, l_args,
+                          manifest=schedule.JobManifest(am))
+
+        def _incomplete():
+            # as in a new process
+            manifest = schedule.JobManifest(am)
+            return [args[2] for args
+                    in manifest.incomplete_args(self.conf, l_args)]
+
+        # failed and truncated jobs are run again
+        self.assertEqual(_incomplete(), ["truncated", "fail"])
+
+        # partially written line in a crash
+        with open(am.manifest_path, "a") as f:
+            f.write('{"job": "' + arguments.args2name(d_args["nodes1"]))
+        self.assertEqual(_incomplete(), ["truncated", "fail"])
+
+        # output DAG changed after the job
+        fp = arguments.ArgumentManager.dag_path(
+            self.conf, d_args["nodes2"],
+            ext=self.conf.get("dag", "output_dag_format"))
+        with open(fp, "ab") as f:
+            f.write(b"changed")
+        self.assertEqual(_incomplete(), ["nodes2", "truncated", "fail"])
+        os.remove(fp)
+        self.assertEqual(_incomplete(), ["nodes2", "truncated", "fail"])
+
+        # options not changing the output DAGs
+        self.conf["dag"]["job_order"] = "lpt"
+        self.conf["dag"]["load_workers"] = "4"
+        self.assertEqual(_incomplete(), ["nodes2", "truncated", "fail"])
+
+        # config changed (stale)
+        self.conf["dag"]["skeleton_threshold"] = "0.05"
+        self.assertEqual(_incomplete(), ["nodes1", "nodes2", "truncated",
+                                         "fail"])
+
+    def test_make_dag(self):
+        l_area = ["nodes1", "nodes2", "truncated", "fail"]
+        ns = argparse.Namespace(
+            conf_path=os.path.join(self._tmpdir.name, "test.conf"),
+            debug=False, parallel=1, reuse_input=False, resume=False)
+
+        def _all_args(conf):
+            dts = DT_RANGE[0]
+            return [(conf, (dts, dts + datetime.timedelta(days=1)), area)
+                    for area in l_area]
+
+        def _make_dag(resume):
+            """Returns the areas of the jobs run, and the exit code."""
+            ns.resume = resume
+            code = None
+            with mock.patch.object(arguments, "all_args", _all_args), \
+                    mock.patch.object(schedule, "run_job",
+                                      wraps=schedule.run_job) as run_job:
+                try:
+                    __main__.make_dag(ns)
+                except SystemExit as e:
+                    code = e.code
+            return [args[2] for (args, ), _ in run_job.call_args_list], code
+
+        # exit with an error if any job failed
+        self.assertEqual(_make_dag(False), (l_area, "1 makedag jobs failed"))
+        self.assertEqual(_make_dag(True), (["truncated", "fail"],
+                                           "1 makedag jobs failed"))
+
+        # without failed jobs
+        l_area.remove("fail")
+        self.assertEqual(_make_dag(True), (["truncated"], None))
+        self.assertEqual(_make_dag(False), (l_area, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
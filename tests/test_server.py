@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import io
+import json
+import datetime
+import tempfile
+import unittest
+
+import networkx as nx
+
+from logdag import arguments
+from logdag import bench
+from logdag import log2event
+from logdag import makedag
+from logdag import schedule
+from logdag import server
+from logdag import showdag
+from util import DT_RANGE, open_test_config
+
+
+def _fake_makedag_main(args, reuse_input=False):
+    """DAG with the nodes given in the area name (e.g., nodes3).
+    Area fail raises an error."""
+    conf, _, area = args
+    if area == "fail":
+        raise RuntimeError("failed job")
+    graph = nx.DiGraph()
+    graph.add_nodes_from(range(int(area[len("nodes"):])))
+    ldag = showdag.LogDAG(args, graph)
+    ldag.dump()
+    return ldag
+
+
+class TestMakeDagServer(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.conf = open_test_config(self._tmpdir.name, unit_term="1d",
+                                     unit_diff="1d")
+        self._makedag_main = makedag.makedag_main
+        makedag.makedag_main = _fake_makedag_main
+
+    def tearDown(self):
+        makedag.makedag_main = self._makedag_main
+        self._tmpdir.cleanup()
+
+    def _serve(self, lines, n_proc):
+        fin = io.StringIO("".join(line + "\n" for line in lines))
+        fout = io.StringIO()
+        # workers keep the loader registered before forking
+        events = bench.SyntheticEvents(5, DT_RANGE)
+        with log2event.registered_evloader(
+                self.conf, log2event.SRCCLS_LOG,
+                bench.SyntheticEventLoader(events)):
+            srv = server.MakeDagServer(self.conf, n_proc=n_proc)
+            try:
+                srv.serve_stream(fin, fout)
+            finally:
+                srv.close()
+        return [json.loads(line) for line in fout.getvalue().splitlines()]
+
+    def test_serve_stream(self):
+        l_jobname = []
+        for day in range(2):
+            dts = DT_RANGE[0] + datetime.timedelta(days=day)
+            for area in ("nodes2", "fail", "nodes4"):
+                l_jobname.append(arguments.args2name(
+                    (self.conf, (dts, dts + datetime.timedelta(days=1)),
+                     area)))
+
+        for n_proc in (1, 3):
+            with self.subTest(n_proc=n_proc):
+                # including empty lines and an invalid job name
+                l_result = self._serve(l_jobname + ["", "invalid"], n_proc)
+                # one result for each job
+                self.assertEqual(sorted(result["job"] for result in l_result),
+                                 sorted(l_jobname + ["invalid"]))
+
+                manifest = schedule.JobManifest(
+                    arguments.ArgumentManager(self.conf))
+                for result in l_result:
+                    if result["job"] == "invalid":
+                        self.assertEqual(result["status"], "failed")
+                        self.assertIn("invalid job name", result["error"])
+                        self.assertIsNone(manifest.get("invalid"))
+                        continue
+                    area = arguments.name2args(result["job"], self.conf)[2]
+                    if area == "fail":
+                        self.assertEqual(result["status"], "failed")
+                        self.assertIn("failed job", result["error"])
+                        self.assertIsNone(result["nodes"])
+                    else:
+                        self.assertEqual(result["status"], "done")
+                        self.assertEqual(result["nodes"],
+                                         int(area[len("nodes"):]))
+                    # recorded in the manifest
+                    self.assertEqual(manifest.get(result["job"])["status"],
+                                     result["status"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import datetime
+import numpy as np
+
+from logdag import arguments
+
+DT_RANGE = (datetime.datetime(2112, 9, 1),
+            datetime.datetime(2112, 9, 1, 12))
+
+
+def random_binary(n_samples, n_nodes, seed=0):
+    """Binary data with dependencies: every node after the first 3
+    is a noisy OR of 2 former nodes."""
+    rng = np.random.default_rng(seed)
+    data = (rng.random((n_samples, n_nodes)) < 0.2).astype(np.int64)
+    for i in range(3, n_nodes):
+        a, b = rng.choice(i, 2, replace=False)
+        noise = rng.random(n_samples) < 0.1
+        data[:, i] = (data[:, a] | data[:, b]) ^ noise
+    return data
+
+
+def open_test_config(dirname, **kwargs):
+    """logdag config with the outputs in dirname, and [dag] options
+    given in kwargs (the log source, e.g., bench.SyntheticEventLoader)."""
+    conf_path = os.path.join(dirname, "test.conf")
+    output_dir = os.path.join(dirname, "output")
+    os.makedirs(output_dir, exist_ok=True)
+    with open(conf_path, "w") as f:
+        f.write("[general]\nlogging =\n\n"
+                "[dag]\nsource = log\noutput_dir = {0}\n".format(
+                    output_dir))
+    conf = arguments.open_logdag_config(conf_path)
+    for key, val in kwargs.items():
+        conf["dag"][key] = str(val)
+    return conf